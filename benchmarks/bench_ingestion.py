@@ -0,0 +1,45 @@
+"""
+Compares the readers of .pairs.gz inputs in csv_to_parquet:
+
+- duckdb: the header is read through fileio.auto_open, then DuckDB read_csv decompresses the whole file again
+- stream: one decompression pass, the header is parsed and the rest of the stream goes to DuckDB via Arrow
+- pipe: like stream, but decompressed by an external multi-threaded program (bgzip/pigz with nproc_in threads)
+- bgzf: BGZF inputs only, block ranges are inflated and parsed by nproc_in threads
+
+Example:
+    python benchmarks/bench_ingestion.py --input_path big.pairs.gz --threads 8 --nproc_in 8
+    python benchmarks/bench_ingestion.py --n_rows 5000000    # synthetic BGZF input
+"""
+import os
+import tempfile
+
+import fire
+
+from pairs_to_parquet.lib import csv_parquet_converter, bgzf
+
+from utils import make_mock_pairs, measure, print_table, file_size_mb
+
+
+def run(input_path=None, n_rows=2_000_000, threads=4, nproc_in=4, memory="2G", repeats=1):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if input_path is None:
+            input_path = make_mock_pairs(os.path.join(tmpdir, "mock.pairs.gz"), n_rows=n_rows, bgzf=True)
+
+        readers = ["duckdb", "stream", "pipe"] + (["bgzf"] if bgzf.is_bgzf(input_path) else [])
+        rows = []
+        for reader in readers:
+            for i in range(repeats):
+                output_path = os.path.join(tmpdir, f"{reader}_{i}.parquet")
+                stats = measure(
+                    csv_parquet_converter.duckdb_read_query_write,
+                    input_path, output_path, None, tmpdir, memory,
+                    enable_progress_bar=False, numb_threads=threads,
+                    UTIL_NAME="bench_ingestion", input_reader=reader, nproc_in=nproc_in,
+                )
+                rows.append({"reader": reader, **stats, "input_MB": file_size_mb(input_path)})
+
+        print_table(rows, ["reader", "input_MB", "real", "user", "sys", "read_MB"])
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,89 @@
+"""
+Size / scan-speed tradeoff of the Parquet writer options (--parquet-compression, --parquet-compression-level,
+--row-group-size, --no-parquet-dictionary):
+
+- MB: size of the .parquet file
+- write: csv_to_parquet time from the .pairs(.gz) input
+- scan: full scan of all columns
+- select: a narrow region query, which benefits from predicate pushdown on small row groups
+- select_read_MB: bytes read by the region query
+
+Example:
+    python benchmarks/bench_parquet_writer.py --input_path real.pairs.gz --threads 8
+    python benchmarks/bench_parquet_writer.py --n_rows 5000000    # synthetic input
+"""
+import os
+import tempfile
+
+import duckdb
+import fire
+
+from pairs_to_parquet.lib import csv_parquet_converter
+
+from utils import make_mock_pairs, measure, print_table, file_size_mb
+
+
+CONFIGS = [
+    {"name": "default (snappy)"},
+    {"name": "none", "parquet_compression": "none"},
+    {"name": "lz4", "parquet_compression": "lz4"},
+    {"name": "zstd 1", "parquet_compression": "zstd", "parquet_compression_level": 1},
+    {"name": "zstd 9", "parquet_compression": "zstd", "parquet_compression_level": 9},
+    {"name": "zstd 1, no dictionary", "parquet_compression": "zstd", "parquet_compression_level": 1, "parquet_dictionary": False},
+    {"name": "zstd 1, 10k rows/group", "parquet_compression": "zstd", "parquet_compression_level": 1, "row_group_size": 10_000},
+    {"name": "zstd 1, 1M rows/group", "parquet_compression": "zstd", "parquet_compression_level": 1, "row_group_size": 1_000_000},
+]
+
+
+def scan(path, threads):
+    con = duckdb.connect()
+    con.execute(f"SET threads = {threads}")
+    for _ in con.execute(f"SELECT * FROM read_parquet('{path}')").fetch_record_batch():
+        pass
+
+
+def select_region(path, threads, chrom, start, end):
+    con = duckdb.connect()
+    con.execute(f"SET threads = {threads}")
+    con.execute(
+        f"SELECT * FROM read_parquet('{path}') WHERE chrom1 = ? AND pos1 BETWEEN ? AND ?",
+        [chrom, start, end],
+    ).fetchall()
+
+
+def run(input_path=None, n_rows=2_000_000, threads=4, memory="2G", chrom="chr1", start=1_000_000, end=2_000_000, sorted_input=True):
+    """
+    sorted_input (bool): sort the pairs by chrom1, pos1 before writing, as `sort` does. Min/max statistics of
+        row groups only prune the region query when the file is sorted.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if input_path is None:
+            input_path = make_mock_pairs(os.path.join(tmpdir, "mock.pairs.gz"), n_rows=n_rows)
+
+        query = " ORDER BY chrom1, pos1" if sorted_input else None
+        rows = []
+        for config in CONFIGS:
+            options = {k: v for k, v in config.items() if k != "name"}
+            output_path = os.path.join(tmpdir, "out.parquet")
+            write = measure(
+                csv_parquet_converter.duckdb_read_query_write,
+                input_path, output_path, query, tmpdir, memory,
+                enable_progress_bar=False, numb_threads=threads, UTIL_NAME="bench_parquet_writer", **options,
+            )
+            scan_stats = measure(scan, output_path, threads)
+            select_stats = measure(select_region, output_path, threads, chrom, start, end)
+            rows.append({
+                "config": config["name"],
+                "MB": file_size_mb(output_path),
+                "write": write["real"],
+                "scan": scan_stats["real"],
+                "select": select_stats["real"],
+                "select_read_MB": select_stats["read_MB"],
+            })
+            os.remove(output_path)
+
+        print_table(rows, ["config", "MB", "write", "scan", "select", "select_read_MB"])
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,85 @@
+"""
+Sort engines (sort --sort-engine global|partitioned|late) on .pairs/.pairsam inputs:
+
+- real/user: time of the sort command
+- peak_MB: peak resident memory of the sort command, including the batches of --export-batch-size rows
+- failed: the sort command failed, e.g. ran out of --memory
+- tmp_MB: peak size of --tmpdir (DuckDB spill files and intermediates of the engine), sampled
+
+Example:
+    python bench_sort_engines.py --input_path real.pairsam.gz --threads 8 --memory 4G
+    python bench_sort_engines.py --n_rows 1000000 --sam_size 300    # synthetic .pairsam input
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fire
+
+from utils import make_mock_pairs, print_table
+
+
+ENGINES = ["global", "partitioned", "late"]
+
+
+def directory_size_mb(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size / 2**20
+
+
+def run_sort(input_path, output_path, engine, threads, memory, tmpdir):
+    """Runs the sort command in a child process, returns its time, peak memory and peak --tmpdir size."""
+    cmd = [
+        sys.executable, "-m", "pairs_to_parquet", "sort", input_path, "-o", output_path,
+        "--sort-engine", engine, "--if-sorted", "resort", "--nproc", str(threads), "--memory", memory, "--tmpdir", tmpdir,
+    ]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+    tmp_mb = 0
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            break
+        tmp_mb = max(tmp_mb, directory_size_mb(tmpdir))
+        time.sleep(0.2)
+    if os.waitstatus_to_exitcode(status):
+        # e.g. out of memory
+        return {"real": "failed"}
+    return {
+        "real": time.perf_counter() - start,
+        "user": rusage.ru_utime,
+        "peak_MB": rusage.ru_maxrss / 2**10,
+        "tmp_MB": tmp_mb,
+    }
+
+
+def run(input_path=None, n_rows=1_000_000, sam_size=300, threads=4, memory="1G", output_format="parquet"):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if input_path is None:
+            input_path = make_mock_pairs(os.path.join(tmpdir, "mock.pairs.gz"), n_rows=n_rows, sam_size=sam_size)
+
+        rows = []
+        for engine in ENGINES:
+            output_path = os.path.join(tmpdir, f"sorted.{output_format}")
+            sort_tmpdir = os.path.join(tmpdir, "tmp")
+            os.makedirs(sort_tmpdir)
+            stats = run_sort(input_path, output_path, engine, threads, memory, sort_tmpdir)
+            rows.append({"engine": engine, **stats})
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            shutil.rmtree(sort_tmpdir)
+
+        print_table(rows, ["engine", "real", "user", "peak_MB", "tmp_MB"])
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,101 @@
+import gzip
+import io
+import os
+import random
+import resource
+import time
+
+
+def make_mock_pairs(path, n_rows=2_000_000, n_chroms=23, chrom_size=200_000_000, seed=0, bgzf=False, sam_size=0):
+    """
+    Writes a synthetic .pairs(.gz) file with a valid header, for benchmarks without real data.
+
+    Parameters
+    ----------
+    path (str): output path, compressed with gzip if it ends with .gz
+    bgzf (bool): compress .gz output as BGZF (via pysam) instead of plain gzip
+    n_rows (int): number of pairs
+    n_chroms (int): number of chromosomes in the header and in the body
+    chrom_size (int): length of every chromosome
+    seed (int): seed of the random generator
+    sam_size (int): if > 0, adds sam1/sam2 columns of that many characters, as in .pairsam files
+    """
+    rng = random.Random(seed)
+    chroms = [f"chr{i}" for i in range(1, n_chroms + 1)]
+    pair_types = ["UU", "UU", "UU", "UR", "RU", "NU", "MU", "DD"]
+    header = ["## pairs format v1.0.0", "#shape: upper triangle", "#genome_assembly: unknown"]
+    header += [f"#samheader: @SQ\tSN:{c}\tLN:{chrom_size}" for c in chroms]
+    header += [f"#chromsize: {c} {chrom_size}" for c in chroms]
+    header += ["#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type" + (" sam1 sam2" if sam_size else "")]
+    sam = "\t" + "A" * sam_size + "\t" + "C" * sam_size if sam_size else ""
+
+    if path.endswith(".gz") and bgzf:
+        import pysam
+        opener = lambda p, mode: io.TextIOWrapper(pysam.BGZFile(p, "wb"))
+    elif path.endswith(".gz"):
+        opener = gzip.open
+    else:
+        opener = open
+    with opener(path, "wt") as f:
+        f.write("\n".join(header) + "\n")
+        for i in range(n_rows):
+            c1, c2 = rng.choice(chroms), rng.choice(chroms)
+            f.write(
+                f"read{i}\t{c1}\t{rng.randrange(chrom_size)}\t{c2}\t{rng.randrange(chrom_size)}\t"
+                f"{rng.choice('+-')}\t{rng.choice('+-')}\t{rng.choice(pair_types)}{sam}\n"
+            )
+    return path
+
+
+def _read_bytes():
+    """Bytes read by this process through read() syscalls (Linux only, None elsewhere)."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+        return int(counters["rchar"])
+    except (OSError, KeyError):
+        return None
+
+
+def measure(func, *args, **kwargs):
+    """
+    Runs func once and measures wall-clock time, CPU time (incl. child processes) and bytes read.
+
+    Returns
+    ----------
+    dict: {"real": s, "user": s, "sys": s, "read_MB": MB or None}
+    """
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    child_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    read_before = _read_bytes()
+    start = time.perf_counter()
+
+    func(*args, **kwargs)
+
+    real = time.perf_counter() - start
+    read_after = _read_bytes()
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    child_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return {
+        "real": real,
+        "user": (self_after.ru_utime - self_before.ru_utime) + (child_after.ru_utime - child_before.ru_utime),
+        "sys": (self_after.ru_stime - self_before.ru_stime) + (child_after.ru_stime - child_before.ru_stime),
+        "read_MB": None if read_before is None else (read_after - read_before) / 2**20,
+    }
+
+
+def print_table(rows, columns):
+    """Prints a list of dicts as a markdown table, in the style of the README benchmark."""
+    print("| " + " | ".join(columns) + " |")
+    print("|" + "|".join("---" for _ in columns) + "|")
+    for row in rows:
+        cells = []
+        for col in columns:
+            value = row.get(col)
+            cells.append(f"{value:.2f}" if isinstance(value, float) else str(value))
+        print("| " + " | ".join(cells) + " |")
+
+
+def file_size_mb(path):
+    return os.path.getsize(path) / 2**20
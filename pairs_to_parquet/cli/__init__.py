@@ -149,14 +149,22 @@ def common_io_options(func):
         type=int,
         default=3,
         show_default=True,
-        help="Number of processes used by the auto-guessed input decompressing command.",
+        help="Number of processes used by the auto-guessed input decompressing command "
+        "(bgzip -@ / pigz -p of the pipe input reader).",
     )
     @click.option(
         "--nproc-out",
         type=int,
         default=8,
         show_default=True,
-        help="Number of processes used by the auto-guessed output compressing command.",
+        help="Number of threads used by the output compressor (built-in bgzf/lz4/zstd/bz2 or pigz).",
+    )
+    @click.option(
+        "--compress-level",
+        type=int,
+        default=None,
+        help="Compression level of the built-in compressors: 0-9 for bgzf (default 6), "
+        "1-12 for lz4 (default 1), 1-22 for zstd (default 1), 1-9 for bz2 (default 9).",
     )
     @click.option(
         "--cmd-in",
@@ -178,6 +186,160 @@ def common_io_options(func):
         "Must read input from stdin and print output into stdout. "
         "EXAMPLE: pbgzip -c -n 8",
     )
+    @click.option(
+        "--input-reader",
+        type=click.Choice(["auto", "duckdb", "stream", "pipe", "bgzf"]),
+        default="auto",
+        show_default=True,
+        help="How the body of a .pairs input is read. "
+        "duckdb: DuckDB read_csv re-reads the file after the header; "
+        "stream: header and body come from a single decompression pass, streamed to DuckDB via Arrow; "
+        "pipe: like stream, but decompressed by --cmd-in or bgzip/pigz with --nproc-in threads; "
+        "bgzf: BGZF blocks (located via a .gzi index if present) are inflated and parsed by --nproc-in threads; "
+        "auto: pipe if --cmd-in is set, bgzf for BGZF inputs, pipe for .gz if --nproc-in > 1 and bgzip/pigz exist, "
+        "stream for other compressed inputs (.gz, .lz4, .zst, .bz2), duckdb for plain .pairs.",
+    )
+    @click.option(
+        "--export-batch-size",
+        type=int,
+        default=1_000_000,
+        show_default=True,
+        help="Rows per record batch fetched from DuckDB when writing .pairs outputs.",
+    )
+    @click.option(
+        "--export-queue-depth",
+        type=int,
+        default=4,
+        show_default=True,
+        help="Record batches in flight while writing .pairs outputs: the query, "
+        "text encoding and compression run concurrently on that many batches. "
+        "0 runs them one after another.",
+    )
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def compress_program_option(func):
+    @click.option(
+        "--compress-program",
+        type=str,
+        default="auto",
+        show_default=True,
+        help="Compressor of .pairs outputs. "
+        "bgzf: built-in BGZF compressor with --nproc-out threads, indexable by pairix/tabix. "
+        "lz4, zstd, bz2: built-in compressors with --nproc-out threads. "
+        "Alternatives (external programs): pigz, gzip, lzop, lz4c, snzip, none. "
+        'If "auto", then use bgzf for .gz outputs, lz4/zstd/bz2 for .lz4/.zst/.bz2 outputs '
+        "and no compression otherwise.",
+    )
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def parquet_writer_options(func):
+    @click.option(
+        "--parquet-compression",
+        type=click.Choice(["zstd", "snappy", "lz4", "gzip", "brotli", "none"]),
+        default=None,
+        help="Codec of .parquet outputs. DuckDB default (snappy) if not set.",
+    )
+    @click.option(
+        "--parquet-compression-level",
+        type=int,
+        default=None,
+        help="Compression level of .parquet outputs, zstd only (1-22).",
+    )
+    @click.option(
+        "--row-group-size",
+        type=int,
+        default=None,
+        help="Rows per row group of .parquet outputs. Smaller row groups let select/query skip more data "
+        "by their min/max statistics, larger ones compress better and scan faster. "
+        "DuckDB default (122880) if not set.",
+    )
+    @click.option(
+        "--parquet-dictionary/--no-parquet-dictionary",
+        default=True,
+        show_default=True,
+        help="Dictionary-encode the columns of .parquet outputs. "
+        "ENUM columns (chroms, strands, pair_type) are always dictionary-encoded.",
+    )
+    @click.option(
+        "--parquet-dictionary-page-size",
+        type=int,
+        default=None,
+        help="Maximum size in bytes of a string dictionary page of .parquet outputs; "
+        "bigger dictionaries fall back to plain encoding.",
+    )
+    @click.option(
+        "--summary-stats/--no-summary-stats",
+        default=False,
+        show_default=True,
+        help="Store summary statistics of .parquet outputs in their kv metadata: rows per chrom pair, "
+        "pair types, cis/trans counts and the position range of every chrom. "
+        "A .parquet file is then written by pyarrow, which aggregates the batches as they are written; "
+        "a partitioned dataset reads its chrom, position and pair type columns once more.",
+    )
+    @click.option(
+        "--region-index",
+        is_flag=True,
+        default=False,
+        help="Write a region index next to .parquet outputs (OUTPUT.rgi): the chrom pairs and position ranges "
+        "of every row group, so that the query command reads only the row groups of a region.",
+    )
+    @click.option(
+        "--partition-by-chroms",
+        is_flag=True,
+        default=False,
+        help="Write the Parquet output as a directory partitioned by chrom pair (OUTPUT/chrom1=chr1/chrom2=chr3/data_0.parquet), "
+        "with the header in every file and in OUTPUT/_header.parquet. Sorted outputs are sorted within every partition "
+        "and read back in order. All commands take such a directory as input.",
+    )
+    @click.option(
+        "--compact-schema",
+        is_flag=True,
+        default=False,
+        help="Store positions (pos1, pos2, pos51, ...) as unsigned 32-bit and mapq1/mapq2 as unsigned 8-bit integers. "
+        "Chroms, strands and pair_type are dictionary-encoded ENUMs in any case. Lossless for .pairs round trips.",
+    )
+    @click.option(
+        "--readid",
+        type=click.Choice(["keep", "drop", "hash"]),
+        default="keep",
+        show_default=True,
+        help="What to do with the readID column: keep it, drop it or replace it by its 64-bit hash "
+        "(much smaller, still tells apart the reads, but the names are lost).",
+    )
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def chrom_order_options(func):
+    @click.option(
+        "--chrom-order",
+        type=click.Choice(["lexicographic", "header", "natural", "file"]),
+        default="lexicographic",
+        show_default=True,
+        help="Order of the chromosomes in the output. lexicographic: as pairtools sort; "
+        "header: order of the #chromsize lines of the input(s); natural: numbers compared by value (chr2 before chr10); "
+        "file: order of --chroms-path, other chromosomes follow lexicographically. "
+        "The #chromsize lines of the output are written in this order.",
+    )
+    @click.option(
+        "--chroms-path",
+        type=str,
+        default=None,
+        help="Chromosome order file for --chrom-order file, e.g. a .chrom.sizes file: chromosome names in the first column.",
+    )
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         return func(*args, **kwargs)
@@ -187,7 +349,13 @@ def common_io_options(func):
 
 from . import (
     sort,
+    merge,
+    dedup,
+    stats,
+    index,
+    query,
     select, 
+    split,
     csv_to_parquet,
     parquet_to_csv
 )
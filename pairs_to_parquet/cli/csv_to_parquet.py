@@ -8,7 +8,7 @@ import click
 from pairtools.lib import fileio, pairsam_format, headerops
 
 from ..lib import  duckdb_utils, json_transform, csv_parquet_converter
-from . import cli, common_io_options
+from . import cli, common_io_options, parquet_writer_options, compress_program_option
 
 
 
@@ -21,8 +21,8 @@ from . import cli, common_io_options
     type=str,
     default="",
     help="output pairs or parquet file."
-    " If the path ends with .gz or .lz4, the output is compressed by bgzip "
-    "or lz4, correspondingly.",
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
 )
 @click.option(
     "--nproc",
@@ -44,18 +44,9 @@ from . import cli, common_io_options
     show_default=True,
     help="The amount of memory used by default.",
 )
-@click.option(
-    "--compress-program",
-    type=str,
-    default="auto",
-    show_default=True,
-    help="A binary to compress temporary sorted chunks. "
-    "Must decompress input when the flag -d is provided. "
-    "Suggested alternatives: gzip, lzop, lz4c, snzip. "
-    'If "auto", then use lz4c if available, and gzip '
-    "otherwise.",
-)
+@compress_program_option
 @common_io_options
+@parquet_writer_options
 def csv_to_parquet(
     input_path,
     output,
@@ -90,7 +81,7 @@ def csv_to_parquet_py(input_path,
 
     query=None
 
-    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_csv_to_parquet")
+    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_csv_to_parquet", **kwargs)
     
 if __name__ == "__main__":
     csv_to_parquet()
\ No newline at end of file
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import click
+
+
+from pairtools.lib import pairsam_format
+
+from ..lib import duckdb_dedup
+from . import cli, common_io_options, parquet_writer_options, compress_program_option
+
+
+
+
+@cli.command()
+@click.argument("pairs_path", type=str, required=True)
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    required=True,
+    help="output pairs or parquet file with the unique mapped pairs."
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
+)
+@click.option(
+    "--output-dups",
+    type=str,
+    default="",
+    help="output pairs or parquet file with the duplicates. "
+    "If the same as --output, all mapped pairs are written there in the order of the input.",
+)
+@click.option(
+    "--output-unmapped",
+    type=str,
+    default="",
+    help="output pairs or parquet file with the unmapped pairs (chrom1 or chrom2 is !). "
+    "May be the same as --output or --output-dups.",
+)
+@click.option(
+    "--output-stats",
+    type=str,
+    default="",
+    help="output file with the counts of the pairs and duplicates, as key-value lines: total, total_unmapped, "
+    "total_mapped, total_dups, total_nodups and summary/frac_dups. These keys are a subset of the stats of "
+    "pairtools dedup, not its full format.",
+)
+@click.option(
+    "--max-mismatch",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Pairs with both sides within this many bp are duplicates.",
+)
+@click.option(
+    "--method",
+    type=click.Choice(duckdb_dedup.DEDUP_METHODS),
+    default="max",
+    show_default=True,
+    help="max: the difference of each side is at most --max-mismatch; "
+    "sum: the sum of the differences of both sides is at most --max-mismatch.",
+)
+@click.option(
+    "--mark-dups",
+    is_flag=True,
+    default=False,
+    help="Set the pair type of the duplicates to DD.",
+)
+@click.option(
+    "--c1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[1],
+    help=f"Chrom 1 column; default {pairsam_format.COLUMNS_PAIRS[1]}"
+    "[input format option]",
+)
+@click.option(
+    "--c2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[3],
+    help=f"Chrom 2 column; default {pairsam_format.COLUMNS_PAIRS[3]}"
+    "[input format option]",
+)
+@click.option(
+    "--p1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[2],
+    help=f"Position 1 column; default {pairsam_format.COLUMNS_PAIRS[2]}"
+    "[input format option]",
+)
+@click.option(
+    "--p2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[4],
+    help=f"Position 2 column; default {pairsam_format.COLUMNS_PAIRS[4]}"
+    "[input format option]",
+)
+@click.option(
+    "--s1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[5],
+    help=f"Strand 1 column; default {pairsam_format.COLUMNS_PAIRS[5]}"
+    "[input format option]",
+)
+@click.option(
+    "--s2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[6],
+    help=f"Strand 2 column; default {pairsam_format.COLUMNS_PAIRS[6]}"
+    "[input format option]",
+)
+@click.option(
+    "--nproc",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of DuckDB threads.",
+)
+@click.option(
+    "--tmpdir",
+    type=str,
+    default="",
+    help="Custom temporary folder for DuckDB intermediates.",
+)
+@click.option(
+    "--memory",
+    type=str,
+    default="2G",
+    show_default=True,
+    help="The amount of memory used by default.",
+)
+@compress_program_option
+@common_io_options
+@parquet_writer_options
+def dedup(
+    pairs_path,
+    output,
+    output_dups,
+    output_unmapped,
+    output_stats,
+    max_mismatch,
+    method,
+    mark_dups,
+    c1,
+    c2,
+    p1,
+    p2,
+    s1,
+    s2,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs,
+):
+    """Remove duplicates from .pairs/.pairsam/.parquet files.
+
+    A mapped pair is a duplicate, if an earlier pair has the same chroms and strands
+    and both positions within --max-mismatch. The input must be sorted by chrom1, chrom2 and pos1,
+    as by the sort command: the duplicates are found in one streaming pass that looks back --max-mismatch bp
+    of pos1, the outputs keep the order of the input.
+
+    Unlike pairtools dedup, the duplicates are not chained: a pair is compared with the earlier pairs,
+    not with the clusters they form, so two pairs more than --max-mismatch apart are both kept even if a pair
+    lies between them. At a large --max-mismatch this finds slightly fewer duplicates than pairtools
+    (e.g. 1358 vs 1364 at --max-mismatch 10).
+
+    PAIRS_PATH : input .pairs/.pairsam/.parquet file. If the path ends with .gz, .lz4, .zst or .bz2, the
+    input is decompressed correspondingly
+    """
+    dedup_py(
+        pairs_path,
+        output,
+        output_dups,
+        output_unmapped,
+        output_stats,
+        max_mismatch,
+        method,
+        mark_dups,
+        c1,
+        c2,
+        p1,
+        p2,
+        s1,
+        s2,
+        nproc,
+        tmpdir,
+        memory,
+        compress_program,
+        **kwargs,
+    )
+
+
+
+def dedup_py(input_path,
+    output_path,
+    output_dups_path,
+    output_unmapped_path,
+    output_stats_path,
+    max_mismatch,
+    method,
+    mark_dups,
+    c1,
+    c2,
+    p1,
+    p2,
+    s1,
+    s2,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs):
+
+    columns = {"c1": c1, "c2": c2, "p1": p1, "p2": p2, "s1": s1, "s2": s2}
+    duckdb_dedup.dedup_file(
+        input_path, output_path, output_dups_path, output_unmapped_path, output_stats_path, max_mismatch, method, mark_dups,
+        tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_dedup", columns=columns, **kwargs
+    )
+
+if __name__ == "__main__":
+    dedup()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import click
+
+
+from pairtools.lib import pairsam_format
+
+from ..lib import region_index, parquet_dataset
+from . import cli
+
+
+
+
+@cli.command()
+@click.argument("parquet_path", type=str, required=True)
+@click.option(
+    "--c1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[1],
+    help=f"Chrom 1 column; default {pairsam_format.COLUMNS_PAIRS[1]}"
+    "[input format option]",
+)
+@click.option(
+    "--c2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[3],
+    help=f"Chrom 2 column; default {pairsam_format.COLUMNS_PAIRS[3]}"
+    "[input format option]",
+)
+@click.option(
+    "--p1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[2],
+    help=f"Position 1 column; default {pairsam_format.COLUMNS_PAIRS[2]}"
+    "[input format option]",
+)
+@click.option(
+    "--p2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[4],
+    help=f"Position 2 column; default {pairsam_format.COLUMNS_PAIRS[4]}"
+    "[input format option]",
+)
+def index(parquet_path, c1, c2, p1, p2):
+    """Build the region index of a .parquet file.
+
+    The index (PARQUET_PATH.rgi) holds the chrom pairs, position ranges and row ranges of every
+    row group, like pairix for .pairs.gz files, so that query reads only the row groups of a region.
+    It is most selective for sorted files. Outputs of other commands get it with --region-index.
+    Every data file of a partitioned dataset gets its own index.
+
+    PARQUET_PATH : .parquet file of pairs or partitioned dataset
+    """
+    paths = parquet_dataset.dataset_files(parquet_path) if parquet_dataset.is_dataset(parquet_path) else [parquet_path]
+    for path in paths:
+        region_index.build_region_index(path, c1, c2, p1, p2)
+
+
+if __name__ == "__main__":
+    index()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import click
+
+
+from pairtools.lib import pairsam_format, headerops
+
+from ..lib import csv_parquet_converter, duckdb_merge
+from . import cli, common_io_options, parquet_writer_options, chrom_order_options, compress_program_option
+
+
+
+
+@cli.command()
+@click.argument("pairs_path", type=str, nargs=-1, required=True)
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    default="",
+    help="output pairs or parquet file."
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
+)
+@click.option(
+    "--c1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[1],
+    help=f"Chrom 1 column; default {pairsam_format.COLUMNS_PAIRS[1]}"
+    "[input format option]",
+)
+@click.option(
+    "--c2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[3],
+    help=f"Chrom 2 column; default {pairsam_format.COLUMNS_PAIRS[3]}"
+    "[input format option]",
+)
+@click.option(
+    "--p1",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[2],
+    help=f"Position 1 column; default {pairsam_format.COLUMNS_PAIRS[2]}"
+    "[input format option]",
+)
+@click.option(
+    "--p2",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[4],
+    help=f"Position 2 column; default {pairsam_format.COLUMNS_PAIRS[4]}"
+    "[input format option]",
+)
+@click.option(
+    "--pt",
+    type=str,
+    default=pairsam_format.COLUMNS_PAIRS[7],
+    help=f"Pair type column; default {pairsam_format.COLUMNS_PAIRS[7]}"
+    "[input format option]",
+)
+@click.option(
+    "--extra-col",
+    nargs=1,
+    type=str,
+    multiple=True,
+    help="Extra column (name or numerical index) that the inputs are also sorted by."
+    "The option can be provided multiple times."
+    'Example: --extra-col "phase1" --extra-col "phase2". [output format option]',
+)
+@click.option(
+    "--nproc",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of DuckDB threads, split between the inputs.",
+)
+@click.option(
+    "--tmpdir",
+    type=str,
+    default="",
+    help="Custom temporary folder for DuckDB intermediates.",
+)
+@click.option(
+    "--memory",
+    type=str,
+    default="2G",
+    show_default=True,
+    help="The amount of memory used by default, split between the inputs.",
+)
+@compress_program_option
+@chrom_order_options
+@common_io_options
+@parquet_writer_options
+def merge(
+    pairs_path,
+    output,
+    c1,
+    c2,
+    p1,
+    p2,
+    pt,
+    extra_col,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs,
+):
+    """Merge sorted .pairs/.pairsam/.parquet files.
+
+    Streams a k-way merge of inputs sorted by chrom1, chrom2, pos1, pos2 and pair_type
+    (as by sort, with the same --chrom-order) into one sorted output. The headers are merged: #samheader lines, @PG chains and chromsizes.
+    Memory is bounded by the number of inputs times --export-batch-size rows.
+
+    PAIRS_PATH : sorted input .pairs/.pairsam/.parquet files. If the path ends with .gz, .lz4, .zst or .bz2, the
+    input is decompressed correspondingly
+    """
+    merge_py(
+        pairs_path,
+        output,
+        c1,
+        c2,
+        p1,
+        p2,
+        pt,
+        extra_col,
+        nproc,
+        tmpdir,
+        memory,
+        compress_program,
+        **kwargs,
+    )
+
+
+
+def merge_py(input_paths,
+    output_path,
+    c1,
+    c2,
+    p1,
+    p2,
+    pt,
+    extra_col,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs):
+
+    header = csv_parquet_converter.read_header(input_paths[0])
+    column_names = headerops.extract_column_names(header)
+    user_columns_to_sort = [c1, c2, p1, p2, pt] + list(extra_col)
+    sort_keys = csv_parquet_converter.resolve_keys(user_columns_to_sort, column_names)
+
+    duckdb_merge.merge_sorted_files(list(input_paths), output_path, sort_keys, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_merge", **kwargs)
+
+if __name__ == "__main__":
+    merge()
@@ -8,7 +8,7 @@ import click
 from pairtools.lib import fileio, pairsam_format, headerops
 
 from ..lib import  duckdb_utils, json_transform, csv_parquet_converter
-from . import cli, common_io_options
+from . import cli, common_io_options, parquet_writer_options, compress_program_option
 
 
 
@@ -21,8 +21,8 @@ from . import cli, common_io_options
     type=str,
     default="",
     help="output pairs or parquet file."
-    " If the path ends with .gz or .lz4, the output is compressed by bgzip "
-    "or lz4, correspondingly.",
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
 )
 @click.option(
     "--nproc",
@@ -44,18 +44,16 @@ from . import cli, common_io_options
     show_default=True,
     help="The amount of memory used by default.",
 )
+@compress_program_option
 @click.option(
-    "--compress-program",
-    type=str,
-    default="auto",
-    show_default=True,
-    help="A binary to compress temporary sorted chunks. "
-    "Must decompress input when the flag -d is provided. "
-    "Suggested alternatives: gzip, lzop, lz4c, snzip. "
-    'If "auto", then use lz4c if available, and gzip '
-    "otherwise.",
+    "--parallel-export",
+    is_flag=True,
+    default=False,
+    help="Encode and compress ranges of row groups in --nproc processes and concatenate "
+    "the parts in order. Only for the built-in compressors and uncompressed .pairs outputs.",
 )
 @common_io_options
+@parquet_writer_options
 def parquet_to_csv(
     input_path,
     output,
@@ -63,6 +61,7 @@ def parquet_to_csv(
     tmpdir,
     memory,
     compress_program,
+    parallel_export,
     **kwargs,
 ):
     """Convert  /.parquet   to    /.pairs.gz  file format
@@ -74,6 +73,7 @@ def parquet_to_csv(
         tmpdir,
         memory,
         compress_program,
+        parallel_export,
         **kwargs,
     )
 
@@ -85,11 +85,16 @@ def parquet_to_csv_py(input_path,
     tmpdir,
     memory,
     compress_program,
+    parallel_export=False,
     **kwargs):
 
+    if parallel_export:
+        csv_parquet_converter.parquet_to_csv_parallel(input_path, output_path, nproc, tmpdir, compress_program, UTIL_NAME="pairs_to_parquet_parquet_to_csv", cmd_out=kwargs.get("cmd_out"), compress_level=kwargs.get("compress_level"))
+        return
+
     query=None
 
-    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_parquet_to_csv")
+    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_parquet_to_csv", **kwargs)
     
 if __name__ == "__main__":
     parquet_to_csv()
\ No newline at end of file
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import click
+
+import duckdb
+import pyarrow as pa
+
+from pairtools.lib import headerops
+
+from ..lib import duckdb_utils, csv_parquet_converter, region_index
+from . import cli, common_io_options, parquet_writer_options, compress_program_option
+
+
+
+
+@cli.command()
+@click.argument("parquet_path", type=str, required=True)
+@click.argument("region1", type=str, required=True)
+@click.argument("region2", type=str, required=False)
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    default="",
+    help="output pairs or parquet file, .pairs to stdout if not set."
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
+)
+@compress_program_option
+@common_io_options
+@parquet_writer_options
+def query(parquet_path, region1, region2, output, compress_program, **kwargs):
+    """Query the pairs of a region or a pair of regions in a .parquet file.
+
+    REGION1 selects chrom1/pos1 and REGION2, if given, chrom2/pos2, e.g. chr1:1M-2M chr2:5M-6M
+    (1-based, inclusive, k/M/G suffixes allowed; chr1:1M is a single position). With a region index (see the index command)
+    only the matching row groups are read, otherwise the row group statistics are used.
+    Of a dataset partitioned by chrom pair only the partitions of the regions are read.
+
+    PARQUET_PATH : .parquet file of pairs or partitioned dataset
+    """
+    query_py(parquet_path, region1, region2, output, compress_program, **kwargs)
+
+
+def query_py(parquet_path, region1, region2, output, compress_program, **kwargs):
+    header = headerops.append_new_pg(
+        duckdb_utils.duckdb_kv_metadata_to_header(parquet_path), ID="pairs_to_parquet_query", PN="pairs_to_parquet_query"
+    )
+    # regions of chroms missing from the #chromsize lines are errors, not empty results
+    chroms = list(headerops.extract_chromsizes(header).index) or None
+    table = region_index.query_region(parquet_path, region1, region2, chroms=chroms)
+
+    if not output:
+        sink = pa.output_stream(sys.stdout.buffer)
+        sink.write("".join(line + "\n" for line in header).encode())
+        duckdb_utils.write_parquet_to_csv(iter([table]), sink, queue_depth=0)
+        sink.flush()
+        return
+
+    con = duckdb.connect()
+    con.register("region_pairs", table)
+    csv_parquet_converter.write_query_output(con, "SELECT * FROM region_pairs", header, output, compress_program=compress_program, **kwargs)
+
+
+if __name__ == "__main__":
+    query()
@@ -3,25 +3,37 @@ import sys
 import click
 
 from ..lib import duckdb_select
-from . import cli, common_io_options
+from . import cli, common_io_options, parquet_writer_options
 
 
 
 @cli.command()
-@click.argument("condition", type=str)
-@click.argument("parquet_path", type=str, required=True)
+@click.argument("condition", type=str, required=False)
+@click.argument("pairs_path", type=str, required=False)
 @click.option(
     "-o",
     "--output",
     type=str,
-    required=True,
-    help="Output Parquet file for selected pairs.",
+    default=None,
+    help="Output pairs or parquet file for selected pairs. "
+    "If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed correspondingly.",
+)
+@click.option(
+    "--manifest",
+    type=str,
+    default=None,
+    help="Select by several conditions in a single scan of the input: a file of (condition, output) pairs, "
+    "one per line separated by a tab, or a .yaml list of mappings with the keys condition and output. "
+    "CONDITION and --output are omitted then; --output-rest gets the pairs of none of the conditions.",
 )
 @click.option(
     "--output-rest",
     type=str,
     default=None,
-    help="Optional output Parquet file for non-selected pairs.",
+    help="Optional output pairs or parquet file for non-selected pairs. "
+    "With a .parquet input and a single condition, the selected pairs are read by a scan pruned by the condition "
+    "and the rest by a second scan of the whole input; .pairs inputs and --manifest write all outputs from a single scan, "
+    "which reads every row group.",
 )
 @click.option(
     "--chrom-subset",
@@ -45,17 +57,19 @@ from . import cli, common_io_options
     help="Comma-separated list of columns to drop.",
 )
 @common_io_options
+@parquet_writer_options
 def select(
     condition,
-    parquet_path,
+    pairs_path,
     output,
     output_rest,
+    manifest,
     chrom_subset,
     type_cast,
     remove_columns,
     **kwargs,
 ):
-    """Select pairs from a Parquet file according to CONDITION.
+    """Select pairs from a .pairs/.pairsam/.parquet file according to CONDITION.
 
     CONDITION is a Python-like boolean expression, e.g.:
 
@@ -63,17 +77,45 @@ def select(
         'chrom1 == chrom2 and abs(pos1 - pos2) < 1e6'
         'regex_match(chrom1, \"chr[0-9]+\")'
         'region_match(chrom1, pos1, \"chr1\", 1000, 5000)'
+        'csv_match(chrom1, \"chr1,chr2\") and wildcard_match(pair_type, \"*U\")'
+
+    This tool reproduces `pairtools select` with DuckDB. .pairs inputs are streamed by --input-reader,
+    the condition is evaluated by DuckDB instead of Python for every row.
+    The condition is parsed as a Python expression and compiled into SQL: comparisons of columns with
+    constants, region_match and csv_match skip row groups of .parquet inputs by their statistics. With -v the
+    log shows the compiled condition and the filters DuckDB pushes into the scan of a .parquet input,
+    as its EXPLAIN plan reports them.
+
+    With --manifest, e.g. `pairs_to_parquet select --manifest split.tsv PAIRS_PATH`, the input is
+    read once for all the conditions of the manifest, and the outputs are written concurrently:
+
+        chrom1 == chrom2 and abs(pos1 - pos2) < 1e4<TAB>cis_near.parquet
+        chrom1 == chrom2 and abs(pos1 - pos2) >= 1e4<TAB>cis_far.parquet
+        chrom1 != chrom2<TAB>trans.parquet
 
-    This tool reproduces `pairtools select`, but works on Parquet using DuckDB.
+    PAIRS_PATH : input .pairs/.pairsam/.parquet file or partitioned dataset. If the path ends with .gz, .lz4, .zst or .bz2,
+    the input is decompressed correspondingly
     """
-    duckdb_select.run_select_parquet(
-        input_path=parquet_path,
+    if manifest:
+        if pairs_path is not None:
+            raise click.UsageError("CONDITION is given by the manifest")
+        if output is not None:
+            raise click.UsageError("--output is given by the manifest")
+        pairs_path, condition = condition, None
+    elif output is None:
+        raise click.UsageError("Missing option '-o' / '--output'.")
+    if pairs_path is None:
+        raise click.UsageError("Missing argument 'PAIRS_PATH'.")
+    duckdb_select.run_select(
+        input_path=pairs_path,
         output=output,
         output_rest=output_rest,
         condition=condition,
         remove_columns=remove_columns,
         chrom_subset=chrom_subset,
         type_cast=type_cast,
+        manifest=manifest,
+        **kwargs,
     )
 
 
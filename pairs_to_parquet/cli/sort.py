@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import io
-import sys
 import click
 
 
-from pairtools.lib import fileio, pairsam_format, headerops
+from pairtools.lib import pairsam_format, headerops
 
-from ..lib import  duckdb_utils, json_transform, csv_parquet_converter
-from . import cli, common_io_options
+from ..lib import  duckdb_utils, duckdb_sort, header_metadata, csv_parquet_converter
+from .._logging import get_logger
+from . import cli, common_io_options, parquet_writer_options, chrom_order_options, compress_program_option
+
+logger = get_logger()
 
 
 
@@ -21,8 +22,8 @@ from . import cli, common_io_options
     type=str,
     default="",
     help="output pairs file."
-    " If the path ends with .gz or .lz4, the output is compressed by bgzip "
-    "or lz4, correspondingly.",
+    " If the path ends with .gz, .lz4, .zst or .bz2, the output is compressed by "
+    "the built-in bgzf, lz4, zstd or bz2 compressor, correspondingly.",
 )
 @click.option(
     "--c1",
@@ -88,18 +89,33 @@ from . import cli, common_io_options
     show_default=True,
     help="The amount of memory used by default.",
 )
+@compress_program_option
 @click.option(
-    "--compress-program",
-    type=str,
-    default="auto",
+    "--if-sorted",
+    type=click.Choice(["verify", "skip", "resort"]),
+    default="verify",
+    show_default=True,
+    help="What to do if the #sorted field of the input header claims an order. "
+    "verify: check the order in one scan of the key columns and skip sorting if it holds; "
+    "skip: trust the header if the requested keys are a prefix of the claimed ones; "
+    "resort: always sort.",
+)
+@click.option(
+    "--sort-engine",
+    type=click.Choice(["global", "partitioned", "late"]),
+    default="global",
     show_default=True,
-    help="A binary to compress temporary sorted chunks. "
-    "Must decompress input when the flag -d is provided. "
-    "Suggested alternatives: gzip, lzop, lz4c, snzip. "
-    'If "auto", then use lz4c if available, and gzip '
-    "otherwise.",
+    help="global: one ORDER BY over all pairs, spilling to --tmpdir when they do not fit into --memory; "
+    "partitioned: one scan splits the pairs by (chrom1, chrom2) into partitions in --tmpdir, "
+    "which are sorted by --nproc processes with --memory / --nproc each and concatenated in chrom order. "
+    "Needs #chromsize lines in the header and chrom1 as the first sort key, otherwise sorts globally; "
+    "late: sorts runs of a quarter of --memory by their key columns only and moves the other columns once, "
+    "runs that do not fit are written lz4-compressed to --tmpdir and merged in a streaming pass, "
+    "for wide inputs such as .pairsam (sam1, sam2).",
 )
+@chrom_order_options
 @common_io_options
+@parquet_writer_options
 def sort(
     pairs_path,
     output,
@@ -113,6 +129,10 @@ def sort(
     tmpdir,
     memory,
     compress_program,
+    if_sorted,
+    sort_engine,
+    chrom_order,
+    chroms_path,
     **kwargs,
 ):
     """Sort a .pairs/.pairsam/.parquet file.
@@ -121,8 +141,8 @@ def sort(
     numeric order along pos1 and pos2 and in the lexicographic order along
     pair_type.
 
-    INPUT_PATH : input .pairs/.pairsam/.parquet file. If the path ends with .gz or .lz4, the
-    input is decompressed by bgzip or lz4c, correspondingly
+    INPUT_PATH : input .pairs/.pairsam/.parquet file. If the path ends with .gz, .lz4, .zst or .bz2, the
+    input is decompressed correspondingly
     """
     sort_py(
         pairs_path,
@@ -137,6 +157,10 @@ def sort(
         tmpdir,
         memory,
         compress_program,
+        if_sorted,
+        sort_engine,
+        chrom_order,
+        chroms_path,
         **kwargs,
     )
 
@@ -154,32 +178,49 @@ def sort_py(input_path,
     tmpdir,
     memory,
     compress_program,
+    if_sorted="verify",
+    sort_engine="global",
+    chrom_order="lexicographic",
+    chroms_path=None,
     **kwargs):
 
-    if input_path.endswith("gz") or input_path.endswith("pairs"):
-        instream = fileio.auto_open(
-            input_path,
-            mode="r",
-            nproc=kwargs.get("nproc_in", 1),
-            command=kwargs.get("cmd_in", None),
-        )
-
-        header, body_stream = headerops.get_header(instream)
-        
-        if instream != sys.stdin:
-            instream.close()
+    if chrom_order == "file" and not chroms_path:
+        raise click.BadParameter("--chrom-order file needs --chroms-path")
 
-
-    if input_path.endswith("parquet") or  input_path.endswith("pq"):
-        header=duckdb_utils.duckdb_kv_metadata_to_header(input_path)
-        
+    # only the header is needed here, the body is read by duckdb_read_query_write
+    header = csv_parquet_converter.read_header(input_path)
 
     column_names = headerops.extract_column_names(header)
     user_columns_to_sort = [c1, c2, p1, p2, pt] + list(extra_col)
     sort_keys=csv_parquet_converter.resolve_keys(user_columns_to_sort, column_names)
     query=duckdb_utils.sort_query(sort_keys)
 
-    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_sort")
+    # an input, which is already in the requested order, is only converted
+    claimed_keys = duckdb_sort.extract_sort_keys(header)
+    if if_sorted == "skip" and duckdb_sort.is_sorted_by(claimed_keys, sort_keys) and chrom_order_holds(header, chrom_order, chroms_path):
+        logger.info(f"Input is sorted by {','.join(claimed_keys)} according to its header, skipping the sort")
+        query = None
+    elif if_sorted == "verify" and claimed_keys is not None:
+        is_sorted = duckdb_sort.verify_sorted(input_path, header, sort_keys, chrom_order=chrom_order, chroms_path=chroms_path)
+        if is_sorted:
+            logger.info(f"Input is sorted by {','.join(sort_keys)}, skipping the sort")
+            query = None
+        elif is_sorted is None:
+            logger.info("The order of this input cannot be verified, sorting")
+        else:
+            logger.info(f"Input is not sorted by {','.join(sort_keys)}, sorting")
+
+    csv_parquet_converter.duckdb_read_query_write(input_path, output_path, query, tmpdir, memory, numb_threads=nproc, compress_program=compress_program, UTIL_NAME="pairs_to_parquet_sort", sort_keys=sort_keys, sort_engine=sort_engine, chrom_order=chrom_order, chroms_path=chroms_path, **kwargs)
     
+
+
+def chrom_order_holds(header, chrom_order, chroms_path=None):
+    """
+    The #sorted field does not tell the chromosome order: it is trusted, if the #chromsize lines
+    are in the requested order, as sort writes them.
+    """
+    chromsizes = headerops.extract_chromsizes(header) if any(l.startswith("#chromsize") for l in header) else {}
+    return tuple(chromsizes.keys()) == header_metadata.extract_ordered_chromosome_field(chromsizes, chrom_order, chroms_path)
+
 if __name__ == "__main__":
     sort()
\ No newline at end of file
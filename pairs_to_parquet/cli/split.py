@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import click
+
+from ..lib import duckdb_split
+from . import cli, common_io_options, parquet_writer_options, compress_program_option
+
+
+@cli.command()
+@click.argument("pairs_path", type=str, required=True)
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    required=True,
+    help="Template of the output pairs or parquet files, with {} for the value, e.g. pairs.{}.parquet or by_chrom/{}.pairs.gz. "
+    "Values that are not safe in a file name are percent-encoded.",
+)
+@click.option(
+    "--by",
+    type=str,
+    required=True,
+    help="Column of the input to split by, e.g. chrom1 or pair_type, "
+    f"or one of: {', '.join(duckdb_split.SPLIT_KEYS)} (cis: chrom1 == chrom2, trans: otherwise, unmapped: chrom1 or chrom2 is !). "
+    "Rows with a missing value go to the output with %NULL for {}.",
+)
+@click.option(
+    "--max-writers",
+    type=int,
+    default=32,
+    show_default=True,
+    help="Outputs written at a time. If the input has more values, it is read again for the next ones.",
+)
+@click.option(
+    "--nproc",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of DuckDB threads.",
+)
+@click.option(
+    "--tmpdir",
+    type=str,
+    default="",
+    help="Custom temporary folder for DuckDB intermediates.",
+)
+@click.option(
+    "--memory",
+    type=str,
+    default="2G",
+    show_default=True,
+    help="The amount of memory used by default.",
+)
+@compress_program_option
+@common_io_options
+@parquet_writer_options
+def split(
+    pairs_path,
+    output,
+    by,
+    max_writers,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs,
+):
+    """Split .pairs/.pairsam/.parquet files into one output per value of a column.
+
+    The outputs are written concurrently in one scan of the input and keep its order,
+    each with the header of the input. E.g. one file per pair type:
+
+        pairs_to_parquet split pairs.parquet --by pair_type -o pairs.{}.parquet
+
+    PAIRS_PATH : input .pairs/.pairsam/.parquet file. If the path ends with .gz, .lz4, .zst or .bz2, the
+    input is decompressed correspondingly
+    """
+    split_py(
+        pairs_path,
+        output,
+        by,
+        max_writers,
+        nproc,
+        tmpdir,
+        memory,
+        compress_program,
+        **kwargs,
+    )
+
+
+def split_py(input_path,
+    output_template,
+    by,
+    max_writers,
+    nproc,
+    tmpdir,
+    memory,
+    compress_program,
+    **kwargs):
+
+    duckdb_split.split_file(
+        input_path, output_template, by, max_writers, tmpdir, memory, numb_threads=nproc,
+        compress_program=compress_program, UTIL_NAME="pairs_to_parquet_split", **kwargs
+    )
+
+
+if __name__ == "__main__":
+    split()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import click
+
+
+from pairtools.lib.stats import PairCounter, do_merge
+
+from ..lib import duckdb_stats
+from . import cli, common_io_options
+
+
+
+
+@cli.command()
+@click.argument("input_path", type=str, nargs=-1, required=True)
+@click.option("-o", "--output", type=str, default="", help="output stats tsv file, stdout if not set.")
+@click.option(
+    "--merge",
+    is_flag=True,
+    help="If specified, merge multiple input stats files instead of calculating"
+    " statistics of a .pairs/.pairsam/.parquet file. Merging is performed via summation of"
+    " all overlapping statistics. Non-overlapping statistics are appended to"
+    " the end of the file. Supported for tsv stats with single filter.",
+)
+@click.option(
+    "--n-dist-bins-decade",
+    type=int,
+    default=PairCounter.N_DIST_BINS_DECADE_DEFAULT,
+    show_default=True,
+    help="Number of bins to split the distance range in log10-space, specified per a factor of 10 difference.",
+)
+@click.option(
+    "--with-chromsizes/--no-chromsizes",
+    is_flag=True,
+    default=True,
+    show_default=True,
+    help="If enabled, will store sizes of chromosomes from the header of the pairs file in the stats file.",
+)
+@click.option(
+    "--yaml/--no-yaml",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Output stats in yaml format instead of table.",
+)
+@click.option(
+    "--nproc",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of DuckDB threads.",
+)
+@click.option(
+    "--tmpdir",
+    type=str,
+    default="",
+    help="Custom temporary folder for DuckDB intermediates.",
+)
+@click.option(
+    "--memory",
+    type=str,
+    default="2G",
+    show_default=True,
+    help="The amount of memory used by default.",
+)
+@common_io_options
+def stats(input_path, output, merge, n_dist_bins_decade, with_chromsizes, yaml, nproc, tmpdir, memory, **kwargs):
+    """Calculate pairs statistics.
+
+    The statistics of pairtools stats (totals, cis/trans, pair types, chrom pairs and the cis
+    distance histograms by orientation) come from one aggregating DuckDB scan, which reads only
+    the chrom, position, strand and pair type columns. The output can be merged by pairtools stats --merge.
+
+    INPUT_PATH : input .pairs/.pairsam/.parquet file or, with --merge, several stats files.
+    If the path ends with .gz, .lz4, .zst or .bz2, the input is decompressed correspondingly.
+    """
+    stats_py(input_path, output, merge, n_dist_bins_decade, with_chromsizes, yaml, nproc, tmpdir, memory, **kwargs)
+
+
+def stats_py(input_path, output, merge, n_dist_bins_decade, with_chromsizes, yaml, nproc, tmpdir, memory, **kwargs):
+    if merge:
+        do_merge(output, input_path, n_dist_bins_decade=n_dist_bins_decade, yaml=yaml, **kwargs)
+        return
+    if len(input_path) > 1:
+        raise click.BadParameter("Several inputs can only be merged, use --merge for stats files")
+
+    counter = duckdb_stats.pairs_stats(
+        input_path[0], tmpdir, memory, numb_threads=nproc, n_dist_bins_decade=n_dist_bins_decade, with_chromsizes=with_chromsizes, **kwargs
+    )
+    duckdb_stats.save_stats(counter, output, yaml, **kwargs)
+
+if __name__ == "__main__":
+    stats()
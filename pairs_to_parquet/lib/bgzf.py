@@ -0,0 +1,228 @@
+import os
+import struct
+import zlib
+from functools import partial
+
+from .compression import ChunkedWriter
+
+
+# BGZF (blocked gzip, SAM/BAM specification section 4.1): a series of gzip members of at most 64 KiB,
+# each carrying its own compressed size in the 'BC' extra subfield -> blocks can be located and
+# inflated independently of each other.
+GZIP_MAGIC = b"\x1f\x8b\x08"
+FEXTRA = 4
+BGZF_HEADER_SIZE = 18  # fixed gzip header (12) + XLEN=6 extra field with the BC subfield
+# input bytes per block, as in bgzip: leaves room for incompressible data within the 64 KiB block limit
+BGZF_BLOCK_DATA_SIZE = 0xff00
+# empty block that marks the end of a BGZF file
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def _parse_block_header(header):
+    """
+    Returns the total size of the BGZF block (header + deflate data + footer) or None,
+    if the bytes do not start a BGZF block.
+    """
+    if len(header) < BGZF_HEADER_SIZE or header[:3] != GZIP_MAGIC or not header[3] & FEXTRA:
+        return None
+    xlen = struct.unpack_from("<H", header, 10)[0]
+    # walk the extra subfields to find BC
+    pos, end = 12, 12 + xlen
+    while pos + 4 <= min(end, len(header)):
+        si1, si2, slen = header[pos], header[pos + 1], struct.unpack_from("<H", header, pos + 2)[0]
+        if si1 == 66 and si2 == 67 and slen == 2:  # 'B', 'C'
+            return struct.unpack_from("<H", header, pos + 4)[0] + 1
+        pos += 4 + slen
+    return None
+
+
+def is_bgzf(path):
+    """
+    Checks whether the file is BGZF (e.g. written by bgzip or pairtools), not just plain gzip.
+
+    Parameters
+    ----------
+    path (str): path to the file
+
+    Returns
+    ----------
+    bool
+    """
+    with open(path, "rb") as f:
+        return _parse_block_header(f.read(BGZF_HEADER_SIZE)) is not None
+
+
+def read_gzi_index(gzi_path):
+    """
+    Reads a bgzip .gzi index: uint64 number of entries, then (compressed offset, uncompressed offset) pairs
+    for every block except the first one.
+
+    Parameters
+    ----------
+    gzi_path (str): path to the .gzi file
+
+    Returns
+    ----------
+    list of int: compressed offsets of all blocks, starting with 0
+    """
+    with open(gzi_path, "rb") as f:
+        (n_entries,) = struct.unpack("<Q", f.read(8))
+        entries = struct.unpack(f"<{2 * n_entries}Q", f.read(16 * n_entries))
+    return [0] + list(entries[0::2])
+
+
+def scan_block_offsets(path):
+    """
+    Finds the compressed offsets of all BGZF blocks by hopping from one block header to the next.
+    Only 18 bytes per 64 KiB block are read.
+
+    Parameters
+    ----------
+    path (str): path to the BGZF file
+
+    Returns
+    ----------
+    list of int: compressed offsets of all blocks, starting with 0
+    """
+    offsets = []
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset < file_size:
+            f.seek(offset)
+            block_size = _parse_block_header(f.read(BGZF_HEADER_SIZE))
+            if block_size is None:
+                raise ValueError(f"{path} is not a valid BGZF file: no block header at offset {offset}")
+            offsets.append(offset)
+            offset += block_size
+    return offsets
+
+
+def block_offsets(path):
+    """
+    Compressed offsets of all BGZF blocks, taken from the .gzi index next to the file if it exists,
+    otherwise scanned from the block headers.
+    """
+    gzi_path = path + ".gzi"
+    if os.path.exists(gzi_path):
+        return read_gzi_index(gzi_path)
+    return scan_block_offsets(path)
+
+
+def split_block_ranges(offsets, file_size, chunk_size):
+    """
+    Groups consecutive blocks into byte ranges of about chunk_size compressed bytes.
+    Every range starts and ends at a block boundary, so it can be inflated on its own.
+
+    Parameters
+    ----------
+    offsets (list of int): compressed offsets of all blocks
+    file_size (int): size of the file
+    chunk_size (int): target compressed size of a range
+
+    Returns
+    ----------
+    list of (start, end) tuples
+    """
+    ranges = []
+    start = 0
+    for offset in offsets[1:]:
+        if offset - start >= chunk_size:
+            ranges.append((start, offset))
+            start = offset
+    if start < file_size:
+        ranges.append((start, file_size))
+    return ranges
+
+
+def inflate_blocks(data):
+    """
+    Inflates a buffer of consecutive whole BGZF blocks. zlib releases the GIL, so ranges can be
+    inflated by several threads at once.
+
+    Parameters
+    ----------
+    data (bytes): compressed blocks
+
+    Returns
+    ----------
+    bytes: the decompressed data
+    """
+    out = []
+    view = memoryview(data)
+    pos = 0
+    while pos < len(data):
+        block_size = _parse_block_header(view[pos:pos + BGZF_HEADER_SIZE].tobytes())
+        if block_size is None:
+            raise ValueError(f"Invalid BGZF block header at relative offset {pos}")
+        xlen = struct.unpack_from("<H", view, pos + 10)[0]
+        # raw deflate between the header and the 8-byte footer (CRC32, ISIZE)
+        block = zlib.decompress(view[pos + 12 + xlen:pos + block_size - 8], wbits=-15)
+        crc, isize = struct.unpack_from("<II", view, pos + block_size - 8)
+        if isize != len(block) or crc != zlib.crc32(block):
+            raise ValueError(f"Corrupted BGZF block at relative offset {pos}: CRC or size mismatch")
+        out.append(block)
+        pos += block_size
+    return b"".join(out)
+
+
+def read_block_range(path, start, end):
+    """Reads and inflates the blocks within the compressed byte range [start, end)."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        return inflate_blocks(f.read(end - start))
+
+
+def compress_block(data, level=6):
+    """
+    Compresses up to BGZF_BLOCK_DATA_SIZE bytes into one BGZF block.
+
+    Parameters
+    ----------
+    data (bytes): uncompressed data
+    level (int): zlib compression level, 0-9
+
+    Returns
+    ----------
+    bytes: the BGZF block
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = BGZF_HEADER_SIZE + len(deflated) + 8
+    header = struct.pack(
+        "<4BIBBHBBHH",
+        0x1F, 0x8B, 8, FEXTRA,  # magic, deflate, FLG.FEXTRA
+        0, 0, 0xFF,  # MTIME, XFL, OS=unknown
+        6, 66, 67, 2, block_size - 1,  # XLEN, 'B', 'C', SLEN, BSIZE
+    )
+    return header + deflated + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def compress_blocks(data, level=6):
+    """
+    Compresses a buffer of any size into consecutive BGZF blocks (without the EOF marker).
+    Concatenated outputs of several calls form a valid BGZF stream.
+    """
+    view = memoryview(data)
+    return b"".join(
+        compress_block(view[pos:pos + BGZF_BLOCK_DATA_SIZE], level)
+        for pos in range(0, len(data), BGZF_BLOCK_DATA_SIZE)
+    )
+
+
+class BgzfWriter(ChunkedWriter):
+    """
+    Writable binary file, which compresses its content into BGZF with a pool of threads.
+    Output is a valid gzip file, which can also be indexed by pairix/tabix.
+
+    Parameters
+    ----------
+    path (str): output path
+    threads (int): number of compressing threads
+    level (int): zlib compression level, 0-9
+    chunk_size (int): uncompressed bytes handed to one thread at a time
+    eof (bool): write the EOF marker on close, False for parts to be concatenated with other BGZF data
+    """
+
+    def __init__(self, path, threads=1, level=6, chunk_size=16 * BGZF_BLOCK_DATA_SIZE, eof=True):
+        super().__init__(path, partial(compress_blocks, level=level), threads, chunk_size, BGZF_EOF if eof else b"")
@@ -0,0 +1,149 @@
+import bz2
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+
+
+# In-process codecs of .pairs files by extension. Every codec allows concatenating independently
+# compressed frames/streams into one valid file, so chunks can be compressed by several threads.
+CODEC_EXTENSIONS = {
+    ".lz4": "lz4",
+    ".zst": "zstd",
+    ".bz2": "bz2",
+}
+
+# uncompressed bytes per independently compressed frame
+DEFAULT_FRAME_SIZE = 4 << 20
+
+
+def detect_codec(path):
+    """
+    Returns the in-process codec of a .pairs file ('lz4', 'zstd' or 'bz2') by its extension, or None.
+    """
+    for extension, codec in CODEC_EXTENSIONS.items():
+        if path.endswith(extension):
+            return codec
+    return None
+
+
+def compress_frame(data, codec, level=None):
+    """
+    Compresses a buffer into one self-contained frame (lz4 frame, zstd frame or bz2 stream).
+    Both Arrow codecs and bz2 release the GIL, so frames can be compressed by several threads at once.
+
+    Parameters
+    ----------
+    data (bytes): uncompressed data
+    codec (str): 'lz4', 'zstd' or 'bz2'
+    level (int): compression level, the codec default if None
+
+    Returns
+    ----------
+    bytes: the compressed frame
+    """
+    if codec == "bz2":
+        # Arrow has no one-shot bz2 compression
+        return bz2.compress(data, 9 if level is None else level)
+    return pa.Codec(codec, compression_level=level).compress(data, asbytes=True)
+
+
+class ChunkedWriter:
+    """
+    Writable binary file, which cuts its content into chunks and compresses them with a pool of threads.
+    Compressed chunks are written in order, followed by the trailer. If the with block raises,
+    the output is removed instead, so a truncated file never ends in a valid trailer.
+
+    Parameters
+    ----------
+    path (str): output path
+    compress (callable): bytes -> compressed bytes, must produce output that can be concatenated
+    threads (int): number of compressing threads
+    chunk_size (int): uncompressed bytes handed to one thread at a time
+    trailer (bytes): written after the last chunk on close
+    """
+
+    def __init__(self, path, compress, threads=1, chunk_size=DEFAULT_FRAME_SIZE, trailer=b""):
+        self._path = path
+        self._file = open(path, "wb")
+        self._compress = compress
+        self._chunk_size = chunk_size
+        self._trailer = trailer
+        self._threads = max(threads, 1)
+        self._pool = ThreadPoolExecutor(self._threads)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            n_full = len(self._buffer) // self._chunk_size * self._chunk_size
+            self._submit(bytes(self._buffer[:n_full]))
+            del self._buffer[:n_full]
+        return len(data)
+
+    def _submit(self, data):
+        # chunks are compressed concurrently and written in submission order
+        for pos in range(0, len(data), self._chunk_size):
+            self._pending.append(self._pool.submit(self._compress, data[pos:pos + self._chunk_size]))
+        while len(self._pending) > 2 * self._threads:
+            self._file.write(self._pending.popleft().result())
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+            self._file.write(self._trailer)
+        finally:
+            self._pool.shutdown()
+            self._file.close()
+            self.closed = True
+
+    def abort(self):
+        """Closes the file without the trailer and removes it."""
+        if self.closed:
+            return
+        self._pool.shutdown(cancel_futures=True)
+        self._file.close()
+        self.closed = True
+        os.remove(self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class FrameWriter(ChunkedWriter):
+    """
+    Writable binary file compressed by lz4, zstd or bz2 in frames of chunk_size bytes, with a pool of threads.
+    The output is readable by the lz4/zstd/bzip2 command line tools and by Arrow.
+
+    Parameters
+    ----------
+    path (str): output path
+    codec (str): 'lz4', 'zstd' or 'bz2'
+    threads (int): number of compressing threads
+    level (int): compression level, the codec default if None
+    chunk_size (int): uncompressed bytes per frame
+    """
+
+    def __init__(self, path, codec, threads=1, level=None, chunk_size=DEFAULT_FRAME_SIZE):
+        super().__init__(path, lambda data: compress_frame(data, codec, level), threads, chunk_size)
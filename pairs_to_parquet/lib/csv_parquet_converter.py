@@ -8,30 +8,50 @@ import fire
 import time
 from itertools import product
 import shutil
+import shlex
+import tempfile
+import queue
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import pyarrow.csv as csv
 
 
 from pairtools.lib import fileio, headerops
 
-from . import duckdb_utils, json_transform, header_metadata
+from .._logging import get_logger
+from . import duckdb_utils, duckdb_sort, json_transform, header_metadata, pairs_io, bgzf, compression, region_index, parquet_dataset
 
+logger = get_logger()
 
 
-def choose_compressor(method="auto", threads=4):
+# .pairs files: plain, gzip/BGZF and the in-process codecs of compression.CODEC_EXTENSIONS
+PAIRS_EXTENSIONS = ("pairs", "pairs.gz") + tuple("pairs" + extension for extension in compression.CODEC_EXTENSIONS)
+
+def is_pairs_path(path):
+    """Checks whether the path is a .pairs file, plain or compressed."""
+    return path.endswith(PAIRS_EXTENSIONS)
+
+def choose_compressor(method="auto", threads=4, output_path=None):
     """
     Pick the right compression program based on user request and availability.
     If method='none', return an empty command list (no compression).
+    'bgzf', 'lz4', 'zstd' and 'bz2' are built-in multithreaded compressors, they have no command.
+    'auto' picks 'bgzf' for .gz outputs, the built-in codec for .lz4/.zst/.bz2 outputs and 'none' for other outputs.
     """
     compressors = {
+        "bgzf": None,
+        "lz4": None,
+        "zstd": None,
+        "bz2": None,
         "pigz": ["pigz", "-p", str(threads)],
         "gzip": ["gzip", "-c"],
         "lzop": ["lzop", "-c"],
         "lz4c": ["lz4c", "-c"], 
-        "lz4": ["lz4", "-c"],
         "snzip": ["snzip", "-c"],
         "none": []
     }
@@ -40,53 +60,200 @@ def choose_compressor(method="auto", threads=4):
         return "none", compressors["none"]
 
     if method == "auto":
-        # lz4c is blazing fast per core (way faster than gzip), but single-threaded. -> better on smaller chanks
-        # pigz is slower per core, but can scale across many threads. -> better on large chunks, like ours
-        if shutil.which("pigz"):
-            return "pigz", compressors["pigz"]
-        elif shutil.which("lz4c"):
-            return "lz4c", compressors["lz4c"]
-        elif shutil.which("gzip"):
-            warnings.warn("lz4c and pigz not found. Falling back to gzip.")
-            return "gzip", compressors["gzip"]
-        else:
-            warnings.warn("No compressor found in PATH. Using no compression.")
-            return "none", compressors["none"]
-    else:
-        if method not in compressors:
-            raise ValueError(f"Unsupported compression method: {method}")
-        if shutil.which(compressors[method][0]) is None:
-            raise RuntimeError(f"Compressor '{method}' not found in PATH.")
-        return method, compressors[method]
+        # the built-in BGZF writer scales with threads like pigz, needs no binary in PATH
+        # and produces output that pairix/tabix can index
+        if output_path is None or output_path.endswith(".gz"):
+            return "bgzf", compressors["bgzf"]
+        codec = compression.detect_codec(output_path)
+        if codec is not None:
+            return codec, compressors[codec]
+        return "none", compressors["none"]
+
+    if method not in compressors:
+        raise ValueError(f"Unsupported compression method: {method}")
+    if compressors[method] is not None and shutil.which(compressors[method][0]) is None:
+        raise RuntimeError(f"Compressor '{method}' not found in PATH.")
+    return method, compressors[method]
 
-def write_parquet_iteratable_to_csv(header, iteratable_body, output_path_csv, numb_threads, compress_program="auto"):
-    method, cmd = choose_compressor(compress_program, threads=8)
+def open_compressed_output(output_path, method, threads=1, level=None, eof=True):
+    """
+    Opens a writable binary file compressed by a built-in compressor ('bgzf', 'lz4', 'zstd', 'bz2') or uncompressed ('none').
+
+    Parameters
+    ----------
+    output_path (str): path to the output
+    method (str): compressor, as returned by choose_compressor
+    threads (int): number of compressing threads
+    level (int): compression level, the compressor default if None
+    eof (bool): write the BGZF EOF marker on close
+    """
+    if method == "bgzf":
+        return bgzf.BgzfWriter(output_path, threads=threads, level=6 if level is None else level, eof=eof)
+    if method in compression.CODEC_EXTENSIONS.values():
+        return compression.FrameWriter(output_path, method, threads=threads, level=level)
+    return open(output_path, "wb")
+
+def write_parquet_iteratable_to_csv(header, iteratable_body, output_path_csv, numb_threads, compress_program="auto", nproc_out=None, cmd_out=None, queue_depth=duckdb_utils.DEFAULT_QUEUE_DEPTH, compress_level=None):
+    """
+    Writes the header and the body (iterator of pyarrow.Tables) into a .pairs file, compressed according to compress_program.
+
+    Parameters
+    ----------
+    numb_threads (int): number of compressing threads, if nproc_out is not provided
+    nproc_out (int): number of compressing threads (--nproc-out)
+    cmd_out (str): a command to compress the output (--cmd-out), fully overrides compress_program
+    queue_depth (int): batches in flight between fetching, text encoding and compression, see duckdb_utils.write_parquet_to_csv
+    compress_level (int): level of the built-in compressors, their default if None
+    """
+    threads = nproc_out if nproc_out else numb_threads
+
+    if cmd_out:
+        method, cmd = "cmd_out", shlex.split(cmd_out)
+    else:
+        method, cmd = choose_compressor(compress_program, threads=threads, output_path=output_path_csv)
 
-    if not cmd or cmd==[]:
-        with open(output_path_csv, "wb") as output_file:
+    if not cmd:
+        # built-in compressors and uncompressed output
+        with open_compressed_output(output_path_csv, method, threads, compress_level) as output_file:
             sink = pa.output_stream(output_file)
             sink.write("".join((line.rstrip() + "\n") for line in header).encode())
 
-            duckdb_utils.write_parquet_to_csv(iteratable_body, sink)
+            duckdb_utils.write_parquet_to_csv(iteratable_body, sink, queue_depth)
+            sink.flush()
 
     else:
         with open(output_path_csv, "wb") as output_file, subprocess.Popen(
             cmd, stdin=subprocess.PIPE, stdout=output_file
         ) as proc:
             if proc.stdin is None:
-                raise RuntimeError("Failed to open pipe to pigz")
+                raise RuntimeError(f"Failed to open pipe to {cmd[0]}")
 
             sink = pa.output_stream(proc.stdin)
             
             sink.write("".join((line.rstrip() + "\n") for line in header).encode()) # header
 
-            duckdb_utils.write_parquet_to_csv(iteratable_body, sink) # body
+            duckdb_utils.write_parquet_to_csv(iteratable_body, sink, queue_depth) # body
             
             proc.stdin.close()
             proc.wait()
 
             if proc.returncode != 0:
-                raise RuntimeError(f"{compress_program} compression failed")
+                raise RuntimeError(f"{cmd[0]} compression failed")
+
+def split_row_groups(n_row_groups, n_parts):
+    """
+    Splits the row groups of a Parquet file into at most n_parts contiguous ranges of about equal length.
+
+    Returns
+    ----------
+    list of range: row group indices of every part, in file order
+    """
+    n_parts = max(min(n_parts, n_row_groups), 1)
+    bounds = [n_row_groups * i // n_parts for i in range(n_parts + 1)]
+    return [range(bounds[i], bounds[i + 1]) for i in range(n_parts)]
+
+def _export_row_groups(parquet_path, row_groups, part_path, method, level):
+    """Writes the given row groups of a Parquet file as a headerless .pairs part, BGZF without the EOF marker, compressed frames or plain text."""
+    iterator = duckdb_utils.parquet_file_iterator(parquet_path, row_groups)
+    with open_compressed_output(part_path, method, threads=1, level=level, eof=False) as output_file:
+        sink = pa.output_stream(output_file)
+        duckdb_utils.write_parquet_to_csv(iterator, sink, queue_depth=0)
+        sink.flush()
+    return part_path
+
+def parquet_to_csv_parallel(input_path, output_path, nproc, temp_directory=None, compress_program="auto", UTIL_NAME="pairs_to_parquet", cmd_out=None, compress_level=None):
+    """
+    Exports a Parquet file to .pairs/.pairs.gz with a pool of processes: contiguous ranges of row groups are
+    encoded (and compressed) into separate parts, which are concatenated in order after the header.
+    Concatenated BGZF blocks (or lz4/zstd frames, bz2 streams) form a valid file, so the output is the same as from the serial export.
+    The data files of a partitioned dataset are split in the same way, in the order in which they are read.
+
+    Parameters
+    ----------
+    input_path (str): path to the .parquet file or the partitioned dataset
+    output_path (str): path to the .pairs, .pairs.gz, .pairs.lz4, .pairs.zst or .pairs.bz2 output
+    nproc (int): number of processes
+    temp_directory (str): directory for the parts, next to the output if not provided
+    compress_program (str): 'auto' or one of the built-in compressors, external compressors cannot be split into parts
+    cmd_out (str): not supported, external compressors cannot be split into parts
+    compress_level (int): level of the built-in compressor, its default if None
+    """
+    if not parquet_dataset.is_parquet(input_path):
+        raise ValueError(f"Invalid file: {input_path}. Parallel export expects a .parquet input.")
+    if not is_pairs_path(output_path):
+        raise ValueError(f"Invalid file: {output_path}. Parallel export expects a .pairs output.")
+
+    method, cmd = choose_compressor(compress_program, output_path=output_path)
+    if cmd_out or cmd:
+        raise ValueError("Parallel export works with the built-in compressors only, use the serial export for external ones.")
+
+    header = duckdb_utils.duckdb_kv_metadata_to_header(input_path)
+    header = headerops.append_new_pg(header, ID=UTIL_NAME, PN=UTIL_NAME)
+    header_bytes = "".join((line.rstrip() + "\n") for line in header).encode()
+
+    if parquet_dataset.is_dataset(input_path):
+        con, _ = duckdb_utils.setup_duckdb_types_from_header(duckdb.connect(), header)
+        files = parquet_dataset.dataset_files(input_path, duckdb_utils.chrom_type_values(con))
+        con.close()
+    else:
+        files = [input_path]
+    # a few ranges per process even out row groups of different sizes
+    n_parts = max(4 * nproc // len(files), 1) if files else 1
+    parts = [
+        (path, row_groups) for path in files
+        for row_groups in split_row_groups(pq.ParquetFile(path).num_row_groups, n_parts)
+    ]
+
+    temp_directory = temp_directory or os.path.dirname(os.path.abspath(output_path))
+    with tempfile.TemporaryDirectory(dir=temp_directory) as parts_directory, \
+            ProcessPoolExecutor(nproc) as pool, open(output_path, "wb") as output_file:
+        if method == "bgzf":
+            output_file.write(bgzf.compress_blocks(header_bytes, 6 if compress_level is None else compress_level))
+        elif method != "none":
+            output_file.write(compression.compress_frame(header_bytes, method, compress_level))
+        else:
+            output_file.write(header_bytes)
+
+        part_paths = [os.path.join(parts_directory, f"part_{i}") for i in range(len(parts))]
+        # map yields in submission order, every part is appended and removed as soon as it and its predecessors are done
+        for part_path in pool.map(
+            _export_row_groups, [path for path, _ in parts], [row_groups for _, row_groups in parts],
+            part_paths, repeat(method), repeat(compress_level),
+        ):
+            with open(part_path, "rb") as part:
+                shutil.copyfileobj(part, output_file, 4 << 20)
+            os.remove(part_path)
+
+        if method == "bgzf":
+            output_file.write(bgzf.BGZF_EOF)
+
+def resolve_input_reader(input_path, input_reader="auto", nproc_in=1, cmd_in=None):
+    """
+    Pick how the body of a .pairs input is read.
+
+    'duckdb': DuckDB read_csv re-opens the file after the header was read (parallel parsing of plain text).
+    'stream': the header and the body are taken from one in-process decompression pass and streamed into DuckDB via Arrow.
+    'pipe': like 'stream', but decompressed by an external multi-threaded program (--cmd-in, bgzip or pigz with --nproc-in threads).
+    'bgzf': BGZF inputs only, block ranges are inflated and parsed by --nproc-in threads, in input order.
+    'auto': 'duckdb' for plain text; for compressed inputs 'pipe' if --cmd-in is given, 'bgzf' for BGZF files,
+        'pipe' for .gz if a parallel decompressor is available and --nproc-in > 1,
+        'stream' otherwise (Arrow decompresses .gz, .lz4, .zst and .bz2).
+    """
+    if input_reader == "auto":
+        if input_path.endswith("pairs"):
+            return "duckdb"
+        if cmd_in:
+            return "pipe"
+        if bgzf.is_bgzf(input_path):
+            return "bgzf"
+        if input_path.endswith(".gz") and nproc_in > 1 and (shutil.which("bgzip") or shutil.which("pigz")):
+            return "pipe"
+        return "stream"
+    if input_reader == "bgzf" and not bgzf.is_bgzf(input_path):
+        raise ValueError(f"{input_path} is not BGZF-compressed, the bgzf input reader cannot split it into blocks")
+    if input_reader not in ("duckdb", "stream", "pipe", "bgzf"):
+        raise ValueError(f"Unsupported input reader: {input_reader}")
+    return input_reader
 
 def resolve_keys(undefined_keys, column_names):
     """Map user-specified keys (column names or indices) to column names."""
@@ -102,82 +269,549 @@ def resolve_keys(undefined_keys, column_names):
 
 
 
-# MAIN FUNCTION, which has everything
-def duckdb_read_query_write(
-    input_path, 
-    output_path,
-    applied_query: str,
-    temp_directory: str = None,
-    memory_limit: str=None,
-    enable_progress_bar: bool = True,
-    enable_profiling: str = 'no_output',
-    numb_threads: int = 16,
-    compress_program: str = "pigz",
-    UTIL_NAME: str="pairs_to_parquet",
-    **kwargs
-    ):
+def check_input_output_paths(input_path, output_path, dataset_output=False):
+    """
+    Raises ValueError, if the input is neither .pairs (plain or compressed) nor .parquet (file or partitioned dataset),
+    or the output is neither .pairs nor .parquet, or, for dataset_output, is a .pairs file.
+    """
+    if not(is_pairs_path(input_path) or parquet_dataset.is_parquet(input_path)):
+        raise ValueError(f"Invalid file: {input_path}. Expected a .pairs(.gz/.lz4/.zst/.bz2)/.parquet file or a partitioned dataset.")
 
+    if dataset_output:
+        if is_pairs_path(output_path):
+            raise ValueError(f"Invalid output: {output_path}. A partitioned dataset is a directory of .parquet files.")
+        parquet_dataset.check_dataset_output(output_path)
+        return
 
-    if not(input_path.endswith("pairs.gz") or input_path.endswith("pairs") or input_path.endswith("parquet")):
-        raise ValueError(f"Invalid file: {input_path}. Expected a '.pairs.gz'/.pairs/.parquet file.")
+    if not(is_pairs_path(output_path) or output_path.endswith("parquet")):
+        raise ValueError(f"Invalid file: {output_path}. Expected a .pairs(.gz/.lz4/.zst/.bz2)/.parquet file.")
 
-    if not(output_path.endswith("pairs.gz") or output_path.endswith("pairs") or output_path.endswith("parquet")):
-        raise ValueError(f"Invalid file: {output_path}. Expected a '.pairs.gz'/.pairs/.parquet file.")
 
-    con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, enable_progress_bar, enable_profiling, numb_threads)
-    
-    if input_path.endswith("pairs.gz") or input_path.endswith("pairs"):
-        instream = fileio.auto_open(
-            input_path,
-            mode="r",
-            nproc=kwargs.get("nproc_in", 1),
-            command=kwargs.get("cmd_in", None),
-        )
+def read_header(input_path):
+    """
+    Reads only the header of a .pairs(.gz/.lz4/.zst/.bz2) file or the header stored in the kv metadata of a .parquet file
+    or a partitioned dataset.
+
+    Returns
+    ----------
+    list: the header lines
+    """
+    if is_pairs_path(input_path):
+        header, body_stream = pairs_io.open_pairs_stream(input_path)
+        body_stream.close()
+        return header
+    if parquet_dataset.is_parquet(input_path):
+        return duckdb_utils.duckdb_kv_metadata_to_header(input_path)
+    raise ValueError(f"Invalid file: {input_path}. Expected a .pairs(.gz/.lz4/.zst/.bz2)/.parquet file.")
+
+
+def read_input_query(con, input_path, UTIL_NAME="pairs_to_parquet", relation_name="pairs_body", **kwargs):
+    """
+    Opens a .pairs(.gz/.lz4/.zst/.bz2) or .parquet input (file or partitioned dataset) and builds the DuckDB query, which yields its rows
+    with ENUM chroms/strands/pair types. The ENUM types are created in the connection.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): the connection to run the query in.
+    input_path (str): path to the input.
+    UTIL_NAME (str): name of the tool in the @PG record of the new header.
+    relation_name (str): name under which a streamed .pairs body is registered in the connection.
+    kwargs: input_reader, nproc_in, cmd_in, compact_schema, readid, chrom_order, chroms_path (see the CLI options).
+
+    Returns
+    ----------
+    new_header (list): header of the output, with a new @PG record.
+    query (str): SELECT over the input rows.
+    body_stream: open stream of a streamed .pairs body or None, to be closed by close_input after the query ran.
+    """
+    # compact schema: narrow integer types; readID: keep, drop or hash
+    compact_schema = kwargs.get("compact_schema", False)
+    readid = kwargs.get("readid", "keep")
+    # order of the chromosomes in CHROM_TYPE, i.e. in sorted outputs
+    chrom_order = kwargs.get("chrom_order", "lexicographic")
+    chroms_path = kwargs.get("chroms_path", None)
+
+    body_stream = None
+    if is_pairs_path(input_path):
+        nproc_in = kwargs.get("nproc_in", 1)
+        cmd_in = kwargs.get("cmd_in", None)
+        input_reader = resolve_input_reader(input_path, kwargs.get("input_reader", "auto"), nproc_in, cmd_in)
+
+        if input_reader == "stream":
+            # one decompression pass: the header is parsed and the rest of the same stream goes to DuckDB
+            old_header, body_stream = pairs_io.open_pairs_stream(input_path)
+        elif input_reader == "pipe":
+            # same, but the decompression runs in a separate multi-threaded process
+            old_header, body_stream = pairs_io.open_pairs_pipe(input_path, nproc_in, cmd_in)
+        elif input_reader == "bgzf":
+            # BGZF blocks are inflated and parsed by several threads
+            old_header, body_stream = pairs_io.open_pairs_bgzf(input_path, nproc_in)
+        else:
+            instream = fileio.auto_open(
+                input_path,
+                mode="r",
+                nproc=nproc_in,
+                command=cmd_in,
+            )
+
+            old_header, _ = headerops.get_header(instream)
+
+            if instream != sys.stdin:
+                instream.close()
 
-        old_header, body_stream = headerops.get_header(instream)
         new_header = headerops.append_new_pg(old_header, ID=UTIL_NAME, PN=UTIL_NAME)
 
         header_length = len(old_header)
 
         column_names = headerops.extract_column_names(new_header)
-        column_types = duckdb_utils.classify_column_types_by_name(column_names)
+        column_types = duckdb_utils.classify_column_types_by_name(column_names, compact_schema)
+
+        con, chromsizes = duckdb_utils.setup_duckdb_types_from_header(con, new_header, chrom_order, chroms_path)
+
+        if input_reader in ("stream", "pipe", "bgzf"):
+            if input_reader == "bgzf":
+                body_reader = pairs_io.open_bgzf_body_reader(body_stream, column_names, column_types)
+            else:
+                # PipedIO is a text stream, Arrow reads its binary buffer
+                body_reader = pairs_io.open_pairs_body_reader(getattr(body_stream, "buffer", body_stream), column_names, column_types)
+            con.register(relation_name, body_reader)
+            query=f"""
+            SELECT {duckdb_utils.cast_projection(column_types, readid)}
+                FROM {relation_name}
+            """
+        else:
+            # read_csv already parses into column_types
+            projection = "*" if readid == "keep" else duckdb_utils.cast_projection(dict.fromkeys(column_names), readid)
+            query=f"""
+            SELECT {projection}
+                FROM read_csv('{input_path}', delim='\t', skip={header_length}, columns = {column_types}, header=false, auto_detect=false)
+            """
 
-        chromsizes = headerops.extract_chromsizes(new_header)
-        unknown_chrom=tuple("!")
-        chromosom_field = unknown_chrom+header_metadata.extract_sorted_chromosome_field(chromsizes)
 
-        con = duckdb_utils.setup_duckdb_types(con, chromosom_field)
+    if parquet_dataset.is_parquet(input_path):
+        old_header=duckdb_utils.duckdb_kv_metadata_to_header(input_path, con)
+        new_header = headerops.append_new_pg(old_header, ID=UTIL_NAME, PN=UTIL_NAME)
 
+        # Parquet stores ENUMs as strings: restore them from the chromsize kv metadata, so that
+        # ORDER BY and comparisons work on integer keys as for .pairs inputs
+        con, chromsizes = duckdb_utils.setup_duckdb_types_from_header(con, new_header, chrom_order, chroms_path)
+        column_names = headerops.extract_column_names(new_header)
+        column_types = duckdb_utils.classify_column_types_by_name(column_names, compact_schema)
+        restored_types = ("STRAND_TYPE", "ALIGNMENT_TYPE") + (("CHROM_TYPE",) if len(chromsizes) else ())
+        if compact_schema:
+            # integer columns are narrowed, other columns keep their stored types
+            restored_types += ("UINTEGER", "UTINYINT")
+        casts = {col: typ if typ in restored_types else None for col, typ in column_types.items()}
+        projection = duckdb_utils.cast_projection(casts, readid)
+
+        # the data files of a dataset are read in the order of CHROM_TYPE
         query=f"""
-        SELECT *
-            FROM read_csv('{input_path}', delim='\t', skip={header_length}, columns = {column_types}, header=false, auto_detect=false)
+        SELECT {projection}
+            FROM {parquet_dataset.parquet_source(input_path, duckdb_utils.chrom_type_values(con))}
         """
 
-        if instream != sys.stdin:
-            instream.close()
+    if chrom_order != "lexicographic":
+        # the #chromsize lines follow CHROM_TYPE, so that chrom_order 'header' reproduces the order downstream
+        chroms = header_metadata.extract_ordered_chromosome_field(chromsizes, chrom_order, chroms_path)
+        new_header = header_metadata.set_chromsize_order(new_header, chroms)
 
+    if readid == "drop":
+        warnings.warn("Dropping the readID column, output is not .pairs anymore")
+        new_header = headerops.set_columns(
+            new_header, [col for col in headerops.extract_column_names(new_header) if col != "readID"]
+        )
 
-    if input_path.endswith("parquet"):
-        old_header=duckdb_utils.duckdb_kv_metadata_to_header(input_path, con)
-        new_header = headerops.append_new_pg(old_header, ID=UTIL_NAME, PN=UTIL_NAME)
+    return new_header, query, body_stream
 
-        query=f"""
-        SELECT *
-            FROM read_parquet('{input_path}') 
-        """
-        
-    if applied_query!=None:
-        query=query+applied_query
-        
 
-    if output_path.endswith("gz") or output_path.endswith("pairs"):
-        iterator=duckdb_utils.duckdb_query_iterator(con, query)
-        write_parquet_iteratable_to_csv(new_header, iterator, output_path, numb_threads, compress_program)
+def write_query_output(con, query, header, output_path, numb_threads=16, compress_program="auto", **kwargs):
+    """
+    Writes the result of a DuckDB query with the header into a .pairs(.gz/.lz4/.zst/.bz2) file
+    or into a .parquet file with the header as kv metadata.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): the connection to run the query in.
+    query (str): the query.
+    header (list): header of the output.
+    output_path (str): path to the output.
+    numb_threads (int): number of compressing threads, if nproc_out is not provided.
+    compress_program (str): compressor of .pairs outputs, see choose_compressor.
+    kwargs: nproc_out, cmd_out, compress_level, export_batch_size, export_queue_depth,
+        summary_stats (add duckdb_utils.summary_stats to the kv metadata of .parquet outputs, default False),
+        region_index (write the region_index of .parquet outputs, default False),
+        partition_by_chroms (write a partitioned dataset, see write_partitioned_output) and
+        the Parquet writer options (see the CLI options).
+    """
+    if kwargs.get("partition_by_chroms", False):
+        write_partitioned_output(con, query, header, output_path, numb_threads=numb_threads, **kwargs)
+        return
+
+    if is_pairs_path(output_path):
+        iterator=duckdb_utils.duckdb_query_iterator(con, query, kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE))
+        write_parquet_iteratable_to_csv(
+            header, iterator, output_path, numb_threads, compress_program, kwargs.get("nproc_out"), kwargs.get("cmd_out"),
+            kwargs.get("export_queue_depth", duckdb_utils.DEFAULT_QUEUE_DEPTH), kwargs.get("compress_level"),
+        )
 
     if output_path.endswith("parquet"):
-        kv_metadata = duckdb_utils.header_to_kv_metadata(new_header)
-        query = f""" COPY ( {query} ) TO '{output_path}' (FORMAT PARQUET, KV_METADATA {kv_metadata});"""
-        con.execute(query)
+        kv_metadata = duckdb_utils.header_to_kv_metadata(header)
+        if kwargs.get("summary_stats", False):
+            # DuckDB takes constant kv metadata only: the batches go through a pyarrow writer that adds the stats on close
+            stats = duckdb_utils.SummaryStats(headerops.extract_column_names(header))
+            reader = con.execute(query).fetch_record_batch(kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE))
+            duckdb_utils.write_parquet_stream(
+                reader, output_path, lambda: {**kv_metadata, duckdb_utils.SUMMARY_STATS_KEY: json.dumps(stats.result())},
+                on_table=stats.update, **kwargs
+            )
+        else:
+            copy_options = duckdb_utils.parquet_copy_options(**kwargs)
+            query = f""" COPY ( {query} ) TO '{output_path}' (FORMAT PARQUET, KV_METADATA {kv_metadata}{copy_options});"""
+            con.execute(query)
+        if kwargs.get("region_index", False):
+            region_index.build_region_index(output_path)
+
+
+def write_partitioned_output(con, query, header, output_path, temp_directory=None, memory_limit=None, numb_threads=16, **kwargs):
+    """
+    Writes the result of a DuckDB query into a directory partitioned by chrom pair, chrom1=chr1/chrom2=chr3/data_0.parquet,
+    with the header in the kv metadata of every file and in _header.parquet, see parquet_dataset.
+    The data files are listed in _header.parquet in the order of CHROM_TYPE, in which they are read back.
+
+    The partitioned write of DuckDB does not keep the order of the rows: if the header is #sorted by chrom1, chrom2, ...,
+    the partitions are sorted one by one afterwards, so the query does not need to be sorted.
+    Other orders do not hold across partitions, their #sorted field is dropped.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): the connection to run the query in.
+    query (str): the query, with chrom1 and chrom2 columns.
+    header (list): header of the output.
+    output_path (str): path to the output directory. It is written next to it and replaces it at the end,
+        an existing directory must be a dataset or empty, see parquet_dataset.dataset_writer.
+    temp_directory (str): temporary directory of the sorting connection.
+    memory_limit (str): memory of the sorting connection.
+    numb_threads (int): DuckDB threads of the sorting connection.
+    kwargs: summary_stats, region_index and the Parquet writer options of write_query_output.
+    """
+    sort_keys = duckdb_sort.extract_sort_keys(header)
+    if sort_keys and tuple(sort_keys[:2]) != parquet_dataset.PARTITION_COLUMNS:
+        logger.info(f"The order {','.join(sort_keys)} does not hold across the chrom pair partitions, dropping #sorted")
+        header = [line for line in header if not line.startswith("#sorted:")]
+
+    with parquet_dataset.dataset_writer(output_path) as dataset_path:
+        _write_dataset(con, query, header, dataset_path, temp_directory, memory_limit, numb_threads, **kwargs)
+
+
+def _write_dataset(con, query, header, output_path, temp_directory, memory_limit, numb_threads, **kwargs):
+    sort_keys = duckdb_sort.extract_sort_keys(header)
+    kv_metadata = duckdb_utils.header_to_kv_metadata(header)
+    copy_options = duckdb_utils.parquet_copy_options(**kwargs)
+    partition_columns = ", ".join(parquet_dataset.PARTITION_COLUMNS)
+    con.execute(f"""
+        COPY ( {query} ) TO '{output_path}'
+        (FORMAT PARQUET, PARTITION_BY ({partition_columns}), WRITE_PARTITION_COLUMNS true,
+        KV_METADATA {kv_metadata}{copy_options});
+    """)
+    os.makedirs(output_path, exist_ok=True)
+    schema = con.execute(f"SELECT * FROM ({query}) LIMIT 0").fetch_record_batch().schema
+
+    try:
+        chroms = duckdb_utils.chrom_type_values(con)
+    except duckdb.CatalogException:
+        chroms = None
+    files = parquet_dataset.dataset_files(output_path, chroms)
+
+    if sort_keys:
+        # every partition holds one chrom pair, the lexicographic CHROM_TYPE orders it as well
+        sort_con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, False, "no_output", numb_threads)
+        sort_con, _ = duckdb_utils.setup_duckdb_types_from_header(sort_con, header)
+        partitions = list(dict.fromkeys(os.path.dirname(path) for path in files))
+        files = duckdb_sort.sort_directories(sort_con, partitions, header, sort_keys, copy_options=f", KV_METADATA {kv_metadata}{copy_options}")
+        sort_con.close()
+
+    # the schema and the header without rows, also for an empty dataset
+    header_metadata = dict(kv_metadata)
+    if kwargs.get("summary_stats", False):
+        # DuckDB writes the partitions: the aggregates come from the narrow columns of the data files
+        column_names = headerops.extract_column_names(header)
+        if files:
+            stats = duckdb_utils.summary_stats(output_path, column_names, con)
+        else:
+            stats = duckdb_utils.SummaryStats(column_names).result()
+        header_metadata[duckdb_utils.SUMMARY_STATS_KEY] = json.dumps(stats)
+    parquet_dataset.write_header_file(output_path, schema, header_metadata, files)
+    if kwargs.get("region_index", False):
+        for path in files:
+            region_index.build_region_index(path)
+
+
+def close_input(body_stream, input_path):
+    """Closes the stream opened by read_input_query and checks the exit code of an external decompressor."""
+    if body_stream is not None:
+        retcode = body_stream.close()
+        if retcode:
+            raise RuntimeError(f"Decompression of {input_path} failed with exit code {retcode}")
+
+
+# put into the queues of QueuedOutputWriter when the source fails, the writers stop without finishing their outputs
+_ABORT_SPLIT = object()
+
+
+def write_split_outputs(
+    con,
+    query,
+    label_column,
+    outputs,
+    temp_directory=None,
+    memory_limit=None,
+    numb_threads=16,
+    compress_program="auto",
+    on_table=None,
+    transform=None,
+    **kwargs
+    ):
+    """
+    Writes the rows of one query into several outputs by the labels in label_column, in a single pass over the query,
+    see write_routed_outputs.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): the connection to run the query in.
+    query (str): the query, with a VARCHAR column label_column.
+    label_column (str): column with the label of every row, not written.
+    outputs (dict): label -> (output_path, header). Labels with the same path share the output and the header of the first one,
+        rows with other labels or an empty path are dropped.
+    temp_directory (str): temporary directory of the writing connections.
+    memory_limit (str): memory of DuckDB, split between the writing connections.
+    numb_threads (int): DuckDB threads, split between the writing connections, and compressing threads of .pairs outputs.
+    compress_program (str): compressor of .pairs outputs, see choose_compressor.
+    on_table (callable): called with every pyarrow.Table of the query before it is split, e.g. to count the labels.
+    transform (callable): maps the pyarrow.RecordBatchReader of the query to the one that is split, see write_routed_outputs.
+    kwargs: the output and Parquet writer options of write_query_output.
+    """
+    paths = {}
+    for label, (output_path, header) in outputs.items():
+        if output_path:
+            paths.setdefault(output_path, (header, []))[1].append(label)
+
+    def label_mask(labels):
+        return lambda table: pc.is_in(table.column(label_column), value_set=pa.array(labels, table.schema.field(label_column).type))
+
+    routes = {output_path: (header, label_mask(labels)) for output_path, (header, labels) in paths.items()}
+    write_routed_outputs(
+        con, query, [label_column], routes, temp_directory, memory_limit, numb_threads, compress_program, on_table, transform, **kwargs
+    )
+
+
+def write_routed_outputs(
+    con,
+    query,
+    routing_columns,
+    outputs,
+    temp_directory=None,
+    memory_limit=None,
+    numb_threads=16,
+    compress_program="auto",
+    on_table=None,
+    transform=None,
+    **kwargs
+    ):
+    """
+    Writes the rows of one query into several outputs in a single pass over the query: every output takes the rows of its mask,
+    a row can go to any number of outputs. Every output is written by its own thread and DuckDB connection (see write_query_output),
+    which reads its rows from a queue of export_queue_depth tables.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): the connection to run the query in.
+    query (str): the query.
+    routing_columns (list): columns of the query the masks are computed from, not written.
+    outputs (dict): output_path -> (header, mask), mask maps a pyarrow.Table of the query to a boolean array of its rows in the output.
+    temp_directory (str): temporary directory of the writing connections.
+    memory_limit (str): memory of DuckDB, split between the writing connections.
+    numb_threads (int): DuckDB threads, split between the writing connections, and compressing threads of .pairs outputs.
+    compress_program (str): compressor of .pairs outputs, see choose_compressor.
+    on_table (callable): called with every pyarrow.Table of the query before it is split.
+    transform (callable): maps the pyarrow.RecordBatchReader of the query to the one that is split,
+        e.g. duckdb_dedup.dedup_batches, which adds the routing column in a streaming pass.
+    kwargs: the output and Parquet writer options of write_query_output.
+    """
+    reader = con.execute(query).fetch_record_batch(kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE))
+    if transform is not None:
+        reader = transform(reader)
+    schema = reader.schema
+    for column in routing_columns:
+        schema = schema.remove(schema.get_field_index(column))
+    output_memory = duckdb_sort.split_memory_limit(memory_limit, len(outputs) + 1)
+    output_threads = max(numb_threads // max(len(outputs), 1), 1)
+
+    with ThreadPoolExecutor(max(len(outputs), 1)) as executor:
+        writers = {
+            output_path: QueuedOutputWriter(
+                executor, output_path, header, schema, temp_directory, output_memory, output_threads,
+                numb_threads, compress_program, **kwargs
+            )
+            for output_path, (header, _) in outputs.items()
+        }
+        try:
+            for batch in reader:
+                table = pa.Table.from_batches([batch])
+                if on_table is not None:
+                    on_table(table)
+                for output_path, (_, mask) in outputs.items():
+                    part = table.filter(mask(table))
+                    if part.num_rows:
+                        writers[output_path].put(part.drop_columns(routing_columns))
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+
+        for writer in writers.values():
+            writer.finish()
+
+
+class QueuedOutputWriter:
+    """
+    Writes the tables put into a queue of export_queue_depth tables into an output, by write_query_output
+    in a thread of executor with its own DuckDB connection.
+
+    Parameters
+    ----------
+    executor (concurrent.futures.ThreadPoolExecutor): runs the writer.
+    output_path (str): path to the output.
+    header (list): header of the output.
+    schema (pyarrow.Schema): schema of the tables.
+    temp_directory (str): temporary directory of the writing connection.
+    memory_limit (str): memory of the writing connection.
+    duckdb_threads (int): threads of the writing connection.
+    numb_threads (int): compressing threads of .pairs outputs, see write_query_output.
+    compress_program (str): compressor of .pairs outputs, see choose_compressor.
+    kwargs: the output and Parquet writer options of write_query_output.
+    """
+
+    def __init__(self, executor, output_path, header, schema, temp_directory=None, memory_limit=None, duckdb_threads=1,
+                 numb_threads=16, compress_program="auto", **kwargs):
+        self.output_path = output_path
+        self.queue = queue.Queue(maxsize=max(kwargs.get("export_queue_depth", duckdb_utils.DEFAULT_QUEUE_DEPTH), 1))
+
+        def batches():
+            while True:
+                table = self.queue.get()
+                if table is None:
+                    return
+                if table is _ABORT_SPLIT:
+                    raise RuntimeError("The input of the split outputs failed")
+                yield from table.to_batches()
+
+        # connected in the calling thread: connecting while the other writers scan their streams may deadlock in DuckDB
+        output_con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, False, "no_output", duckdb_threads)
+        output_con.register("split_pairs", pa.RecordBatchReader.from_batches(schema, batches()))
+
+        def write():
+            write_query_output(output_con, "SELECT * FROM split_pairs", header, output_path, numb_threads, compress_program, **kwargs)
+            output_con.close()
+
+        self.future = executor.submit(write)
+
+    def _put(self, item):
+        # a failed writer does not read its queue anymore: its error is raised instead of waiting
+        while not self.future.done():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        self.future.result()
+
+    def put(self, table):
+        """Queues a table for the output."""
+        self._put(table)
+
+    def finish(self):
+        """Ends the output and waits until it is written."""
+        self._put(None)
+        self.future.result()
+
+    def abort(self):
+        """Stops the writer without finishing the output, after a failure of the input."""
+        try:
+            self._put(_ABORT_SPLIT)
+        except Exception:
+            pass
+
+
+# MAIN FUNCTION, which has everything
+def duckdb_read_query_write(
+    input_path, 
+    output_path,
+    applied_query: str,
+    temp_directory: str = None,
+    memory_limit: str=None,
+    enable_progress_bar: bool = True,
+    enable_profiling: str = 'no_output',
+    numb_threads: int = 16,
+    compress_program: str = "auto",
+    UTIL_NAME: str="pairs_to_parquet",
+    **kwargs
+    ):
+
+    partition_by_chroms = kwargs.get("partition_by_chroms", False)
+    check_input_output_paths(input_path, output_path, partition_by_chroms)
+
+    con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, enable_progress_bar, enable_profiling, numb_threads)
+
+    new_header, query, body_stream = read_input_query(con, input_path, UTIL_NAME, **kwargs)
+
+    try:
+        if kwargs.get("sort_keys"):
+            # the output is ordered by sort_keys, either by applied_query or because the input already was
+            new_header = duckdb_sort.set_sorted_field(new_header, kwargs["sort_keys"])
+            if kwargs.get("chrom_order", "lexicographic") == "lexicographic" and any(l.startswith("#chromsize") for l in new_header):
+                # the #chromsize lines tell the chromosome order of the sort, as for the other orders in read_input_query
+                chroms = header_metadata.extract_ordered_chromosome_field(headerops.extract_chromsizes(new_header), "lexicographic")
+                new_header = header_metadata.set_chromsize_order(new_header, chroms)
+            if partition_by_chroms:
+                if tuple(kwargs["sort_keys"][:2]) != parquet_dataset.PARTITION_COLUMNS:
+                    raise ValueError("A partitioned dataset is read by chrom pair, its sort has to start with chrom1, chrom2")
+                # write_partitioned_output sorts every partition on its own
+                applied_query = None
+
+        sort_engine = kwargs.get("sort_engine", "global")
+        if applied_query!=None and sort_engine != "global" and kwargs.get("sort_keys"):
+            # the intermediates of the sort live until the output is written
+            with tempfile.TemporaryDirectory(dir=temp_directory or None) as sort_directory:
+                if sort_engine == "partitioned":
+                    # the #chromsize lines of new_header are in the order of CHROM_TYPE already
+                    chrom_order = "lexicographic" if kwargs.get("chrom_order", "lexicographic") == "lexicographic" else "header"
+                    sorted_query = duckdb_sort.partitioned_sort(
+                        con, query, new_header, kwargs["sort_keys"], sort_directory, numb_threads, memory_limit,
+                        chrom_order=chrom_order,
+                    )
+                    if sorted_query is None:
+                        logger.info("The sort does not start with chrom columns of known chromsizes, sorting globally")
+                        sorted_query = query + applied_query
+                else:
+                    sorted_query = duckdb_sort.late_materialization_sort(
+                        con, query, new_header, kwargs["sort_keys"], sort_directory,
+                        kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE),
+                    )
+                write_query_output(
+                    con, sorted_query, new_header, output_path, numb_threads, compress_program,
+                    temp_directory=temp_directory, memory_limit=memory_limit, **kwargs
+                )
+            return
+
+        if applied_query!=None:
+            query=query+applied_query
+
+        write_query_output(
+            con, query, new_header, output_path, numb_threads, compress_program,
+            temp_directory=temp_directory, memory_limit=memory_limit, **kwargs
+        )
+    finally:
+        close_input(body_stream, input_path)
 
 
 if __name__ == "__main__":
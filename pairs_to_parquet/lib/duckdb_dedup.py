@@ -0,0 +1,280 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .._logging import get_logger
+from . import duckdb_utils, csv_parquet_converter
+
+logger = get_logger()
+
+
+DEDUP_METHODS = ("max", "sum")
+
+# classes of the pairs, in the label column added by dedup_batches
+DEDUP_CLASSES = ("nodup", "dup", "unmapped")
+DEDUP_CLASS_COLUMN = "dedup_class"
+
+
+def _flag_duplicates(keys, pos1, pos2, max_mismatch, method):
+    """
+    Flags the duplicates among mapped pairs, see dedup_batches.
+
+    Parameters
+    ----------
+    keys (numpy.ndarray): int64 code of the chroms and strands of every pair, in the order of the stream
+    pos1, pos2 (numpy.ndarray): int64 positions, pos1 does not decrease within a key
+    max_mismatch (int): allowed difference of the positions
+    method (str): max or sum, see dedup_batches
+
+    Returns
+    ----------
+    numpy.ndarray: True for the duplicates
+    """
+    # the pairs of a key together, by pos1 and then in the order of the stream
+    order = np.argsort(keys, kind="stable")
+    keys, pos1, pos2 = keys[order], pos1[order], pos2[order]
+    if np.any((keys[1:] == keys[:-1]) & (pos1[1:] < pos1[:-1])):
+        raise ValueError("dedup needs the pairs sorted by chrom1, chrom2 and pos1, sort the input first")
+
+    # the look-back of every pair starts at the first pair of its key with pos1 within max_mismatch
+    shifted = pos1 - pos1.min()
+    sort_key = keys * (int(shifted.max()) + max_mismatch + 1) + shifted
+    start = np.maximum(np.searchsorted(sort_key, sort_key - max_mismatch), np.searchsorted(keys, keys))
+
+    # compare every pair with the pair lag rows back, until a duplicate is found or the look-back ends
+    is_dup = np.zeros(len(keys), dtype=bool)
+    active = np.flatnonzero(start < np.arange(len(keys)))
+    lag = 1
+    while active.size:
+        previous = active - lag
+        difference = np.abs(pos2[active] - pos2[previous])
+        if method == "sum":
+            difference += pos1[active] - pos1[previous]
+        near = difference <= max_mismatch
+        is_dup[active[near]] = True
+        lag += 1
+        active = active[~near]
+        active = active[active - lag >= start[active]]
+
+    result = np.empty(len(keys), dtype=bool)
+    result[order] = is_dup
+    return result
+
+
+class _Deduplicator:
+    """Adds dedup_class to the record batches of a stream, keeping the pairs of the look-back between them."""
+
+    def __init__(self, schema, max_mismatch, method, mark_dups, c1, c2, p1, p2, s1, s2, pt, unmapped_chrom):
+        self.max_mismatch = max_mismatch
+        self.method = method
+        self.mark_dups = mark_dups
+        self.chroms = (c1, c2)
+        self.key_columns = [c1, c2, s1, s2, p1, p2]
+        self.pt = pt
+        self.unmapped_chrom = unmapped_chrom
+        if mark_dups:
+            schema = schema.set(schema.get_field_index(pt), pa.field(pt, pa.string()))
+        self.schema = schema.append(pa.field(DEDUP_CLASS_COLUMN, pa.string()))
+        # the mapped pairs of the last chrom pair that later pairs can be duplicates of
+        self.carry = None
+        self.last_block = None
+        self.seen_blocks = set()
+
+    def __call__(self, batch):
+        unmapped = np.zeros(batch.num_rows, dtype=bool)
+        for chrom in self.chroms:
+            column = pc.cast(batch.column(chrom), pa.string())
+            unmapped |= pc.fill_null(pc.equal(column, self.unmapped_chrom), False).to_numpy(zero_copy_only=False)
+        mapped_rows = np.flatnonzero(~unmapped)
+        mapped = duckdb_utils.decode_dictionaries(pa.Table.from_batches([batch.select(self.key_columns)]).take(mapped_rows))
+
+        is_dup = np.zeros(batch.num_rows, dtype=bool)
+        if mapped.num_rows:
+            carried = self.carry.num_rows if self.carry is not None else 0
+            chunk = pa.concat_tables([self.carry, mapped]) if carried else mapped
+            is_dup[mapped_rows] = self._deduplicate(chunk)[carried:]
+
+        # indices into DEDUP_CLASSES
+        classes = np.where(unmapped, 2, is_dup.astype(np.int8))
+        columns = list(batch.columns)
+        if self.mark_dups:
+            index = batch.schema.get_field_index(self.pt)
+            columns[index] = pc.if_else(pa.array(is_dup), "DD", pc.cast(batch.column(index), pa.string()))
+        columns.append(pc.take(pa.array(DEDUP_CLASSES), pa.array(classes)))
+        return pa.RecordBatch.from_arrays(columns, schema=self.schema)
+
+    def _deduplicate(self, chunk):
+        c1, c2, s1, s2, p1, p2 = (chunk.column(name) for name in self.key_columns)
+        codes = [pc.dictionary_encode(column.combine_chunks(), null_encoding="encode") for column in (c1, c2, s1, s2)]
+        chrom1, chrom2, strand1, strand2 = (code.indices.to_numpy(zero_copy_only=False).astype(np.int64) for code in codes)
+
+        # the chrom pairs come one after another, each one once
+        change = np.r_[True, (chrom1[1:] != chrom1[:-1]) | (chrom2[1:] != chrom2[:-1])]
+        starts = np.flatnonzero(change)
+        for block in zip(c1.take(starts).to_pylist(), c2.take(starts).to_pylist()):
+            if block != self.last_block:
+                if block in self.seen_blocks:
+                    raise ValueError(f"dedup needs the pairs sorted by chrom1, chrom2 and pos1, {block} occurs twice, sort the input first")
+                self.seen_blocks.add(block)
+                self.last_block = block
+        blocks = np.cumsum(change) - 1
+        strands = len(codes[3].dictionary)
+        keys = (blocks * len(codes[2].dictionary) + strand1) * strands + strand2
+
+        pos1 = pc.cast(p1, pa.int64()).to_numpy(zero_copy_only=False)
+        pos2 = pc.cast(p2, pa.int64()).to_numpy(zero_copy_only=False)
+        is_dup = _flag_duplicates(keys, pos1, pos2, self.max_mismatch, self.method)
+
+        # the look-back of the next batch: the distinct positions of the last chrom pair within max_mismatch of the last pos1 of their key
+        last = np.flatnonzero(blocks == blocks[-1])
+        last_keys, inverse = np.unique(keys[last], return_inverse=True)
+        last_pos1 = np.zeros(len(last_keys), dtype=np.int64)
+        np.maximum.at(last_pos1, inverse, pos1[last])
+        last = last[pos1[last] >= last_pos1[inverse] - self.max_mismatch]
+        _, first = np.unique(np.stack([keys[last], pos1[last], pos2[last]], axis=1), axis=0, return_index=True)
+        self.carry = chunk.take(np.sort(last[first]))
+        return is_dup
+
+
+def dedup_batches(
+    reader,
+    max_mismatch=3,
+    method="max",
+    mark_dups=False,
+    c1="chrom1",
+    c2="chrom2",
+    p1="pos1",
+    p2="pos2",
+    s1="strand1",
+    s2="strand2",
+    pt="pair_type",
+    unmapped_chrom="!",
+    ):
+    """
+    Adds the column dedup_class (nodup, dup or unmapped) to the pairs of a stream, in a single pass that keeps their order.
+    The pairs must be sorted by chrom1, chrom2 and pos1, as by the sort command, ValueError otherwise.
+    A mapped pair is a duplicate, if an earlier pair has the same chroms and strands and positions within max_mismatch.
+
+    Every batch is compared with itself and with the pairs of the previous batches within max_mismatch of pos1,
+    so the look-back is bounded by max_mismatch, not by the batch size. Unlike the clusters of pairtools dedup,
+    pairs are not chained: two pairs more than max_mismatch apart are both kept, even if a pair lies between them.
+
+    Parameters
+    ----------
+    reader (pyarrow.RecordBatchReader): the pairs
+    max_mismatch (int): allowed difference of the positions
+    method (str): max: both positions differ by at most max_mismatch; sum: the sum of the differences is at most max_mismatch
+    mark_dups (bool): set the pair type of the duplicates to DD
+    c1, c2, p1, p2, s1, s2, pt (str): names of the chrom, position, strand and pair type columns
+    unmapped_chrom (str): chrom of unmapped sides, such pairs are never duplicates
+
+    Returns
+    ----------
+    pyarrow.RecordBatchReader: the pairs with the column dedup_class
+    """
+    if method not in DEDUP_METHODS:
+        raise ValueError(f"Unknown dedup method {method}, expected one of {', '.join(DEDUP_METHODS)}")
+    if max_mismatch < 0:
+        raise ValueError("max_mismatch must be non-negative")
+
+    deduplicator = _Deduplicator(reader.schema, max_mismatch, method, mark_dups, c1, c2, p1, p2, s1, s2, pt, unmapped_chrom)
+    return pa.RecordBatchReader.from_batches(deduplicator.schema, (deduplicator(batch) for batch in reader))
+
+
+class DedupStats:
+    """Counts of the pairs by their dedup_class, collected from the tables of dedup_batches."""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(DEDUP_CLASSES, 0)
+
+    def __call__(self, table):
+        for item in pc.value_counts(table.column(DEDUP_CLASS_COLUMN)).to_pylist():
+            self.counts[item["values"]] += item["counts"]
+
+    def to_dict(self):
+        """Statistics in the keys of pairtools stats."""
+        total_mapped = self.counts["nodup"] + self.counts["dup"]
+        return {
+            "total": total_mapped + self.counts["unmapped"],
+            "total_unmapped": self.counts["unmapped"],
+            "total_mapped": total_mapped,
+            "total_dups": self.counts["dup"],
+            "total_nodups": self.counts["nodup"],
+            "summary/frac_dups": self.counts["dup"] / total_mapped if total_mapped else 0,
+        }
+
+    def write(self, output_path):
+        """Writes the statistics as tab-separated key-value lines."""
+        with open(output_path, "w") as f:
+            for key, value in self.to_dict().items():
+                f.write(f"{key}\t{value}\n")
+
+
+def dedup_file(
+    input_path,
+    output_path,
+    output_dups_path=None,
+    output_unmapped_path=None,
+    output_stats_path=None,
+    max_mismatch=3,
+    method="max",
+    mark_dups=False,
+    temp_directory=None,
+    memory_limit=None,
+    enable_progress_bar=False,
+    numb_threads=8,
+    compress_program="auto",
+    UTIL_NAME="pairs_to_parquet_dedup",
+    columns=None,
+    **kwargs
+    ):
+    """
+    Removes the duplicates from a .pairs(.gz/.lz4/.zst/.bz2)/.parquet file sorted by chrom1, chrom2 and pos1, see dedup_batches.
+    The input is read once: the unique, duplicate and unmapped pairs are written to their outputs
+    and counted in the same pass, in the order of the input.
+
+    Parameters
+    ----------
+    input_path (str): path to the input
+    output_path (str): output of the unique mapped pairs
+    output_dups_path (str): output of the duplicates, may be output_path to keep all mapped pairs
+    output_unmapped_path (str): output of the unmapped pairs, may be one of the other outputs
+    output_stats_path (str): output of the statistics, see DedupStats
+    max_mismatch (int): allowed difference of the positions
+    method (str): max or sum, see dedup_batches
+    mark_dups (bool): set the pair type of the duplicates to DD
+    temp_directory (str): temporary directory of DuckDB
+    memory_limit (str): memory of DuckDB
+    numb_threads (int): DuckDB threads
+    compress_program (str): compressor of .pairs outputs, see csv_parquet_converter.choose_compressor
+    UTIL_NAME (str): name of the tool in the @PG record
+    columns (dict): names of the c1, c2, p1, p2, s1, s2 and pt columns, see dedup_batches
+    kwargs: the input, output and Parquet writer options of csv_parquet_converter.duckdb_read_query_write
+
+    Returns
+    ----------
+    DedupStats: the counts of the pairs
+    """
+    for path in (output_path, output_dups_path, output_unmapped_path):
+        if path:
+            csv_parquet_converter.check_input_output_paths(input_path, path, kwargs.get("partition_by_chroms", False))
+
+    con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, enable_progress_bar, "no_output", numb_threads)
+    header, query, body_stream = csv_parquet_converter.read_input_query(con, input_path, UTIL_NAME, **kwargs)
+    dedup = lambda reader: dedup_batches(reader, max_mismatch, method, mark_dups, **(columns or {}))
+
+    stats = DedupStats()
+    outputs = {
+        "nodup": (output_path, header),
+        "dup": (output_dups_path, header),
+        "unmapped": (output_unmapped_path, header),
+    }
+    csv_parquet_converter.write_split_outputs(
+        con, query, DEDUP_CLASS_COLUMN, outputs, temp_directory, memory_limit, numb_threads, compress_program, on_table=stats, transform=dedup, **kwargs
+    )
+    csv_parquet_converter.close_input(body_stream, input_path)
+
+    if output_stats_path:
+        stats.write(output_stats_path)
+    logger.info(f"{stats.counts['dup']} duplicates out of {stats.counts['dup'] + stats.counts['nodup']} mapped pairs")
+    return stats
@@ -0,0 +1,223 @@
+import bisect
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from pairtools.lib import headerops
+
+from .._logging import get_logger
+from . import duckdb_utils, duckdb_sort, csv_parquet_converter, header_metadata
+
+logger = get_logger()
+
+
+# key columns added to every input of the merge, dropped from the output
+MERGE_KEY_PREFIX = "merge_key_"
+
+
+def merge_key_projection(sort_keys, column_types):
+    """
+    Key columns of the merge, comparable across inputs: ENUM columns by their codes, other columns by value.
+    CHROM_TYPE must be built from the merged header in every connection.
+
+    Parameters
+    ----------
+    sort_keys (list): column names, in the order of the sort
+    column_types (dict): DuckDB types of the columns, chrom columns without chromsizes must be STRING
+
+    Returns
+    ----------
+    str: SELECT list of the key columns merge_key_0, merge_key_1, ...
+    """
+    keys = []
+    for i, key in enumerate(sort_keys):
+        if column_types.get(key) in duckdb_sort.ENUM_TYPES:
+            keys.append(f"enum_code(CAST({key} AS {column_types[key]})) AS {MERGE_KEY_PREFIX}{i}")
+        else:
+            keys.append(f"{key} AS {MERGE_KEY_PREFIX}{i}")
+    return ", ".join(keys)
+
+
+class _KeyView:
+    """Sequence of the key tuples of a table for bisect, NULLs come last as in ORDER BY."""
+
+    def __init__(self, table, n_keys):
+        self._columns = [table.column(f"{MERGE_KEY_PREFIX}{i}") for i in range(n_keys)]
+        self._length = table.num_rows
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        return tuple((value is None, value) for value in (column[i].as_py() for column in self._columns))
+
+
+def _checked_tables(tables, n_keys, name):
+    """Passes the non-empty tables of one input through, raises ValueError if they are not sorted by the keys."""
+    previous = None
+    key_names = [f"{MERGE_KEY_PREFIX}{i}" for i in range(n_keys)]
+    for table in tables:
+        if not table.num_rows:
+            continue
+        keys = table.select(key_names)
+        if duckdb_sort._order_violations(keys, previous):
+            raise ValueError(f"{name} is not sorted by the merge keys")
+        previous = keys.slice(keys.num_rows - 1)
+        # ENUM columns come as dictionaries with the index width of each input, strings can be concatenated
+        yield duckdb_utils.decode_dictionaries(table)
+
+
+def merge_sorted_tables(inputs, n_keys):
+    """
+    K-way merge of sorted streams of pyarrow.Tables with the key columns merge_key_0, ... merge_key_{n_keys-1}.
+    Holds one table per input: rows up to the smallest last key of the current tables cannot be preceded by
+    rows coming later, so they are sorted (stable, ties keep the order of the inputs) and yielded.
+
+    Parameters
+    ----------
+    inputs (list): iterators of sorted, non-empty pyarrow.Tables with the same columns (see _checked_tables)
+    n_keys (int): number of key columns
+
+    Returns
+    ----------
+    Iterator[pyarrow.Table]: the merged tables, without the key columns
+    """
+    key_names = [f"{MERGE_KEY_PREFIX}{i}" for i in range(n_keys)]
+    tables = [next(iterator, None) for iterator in inputs]
+    while True:
+        active = [i for i, table in enumerate(tables) if table is not None]
+        if not active:
+            return
+
+        bound = min(_KeyView(tables[i], n_keys)[tables[i].num_rows - 1] for i in active)
+        pieces = []
+        for i in active:
+            n_rows = bisect.bisect_right(_KeyView(tables[i], n_keys), bound)
+            pieces.append(tables[i].slice(0, n_rows))
+            tables[i] = tables[i].slice(n_rows) if n_rows < tables[i].num_rows else next(inputs[i], None)
+
+        # NULLs are placed at the end by default, as in ORDER BY
+        merged = pa.concat_tables(pieces, promote_options="permissive")
+        order = pc.sort_indices(merged, sort_keys=[(key, "ascending") for key in key_names])
+        yield merged.take(order).drop_columns(key_names)
+
+
+def merge_headers(headers, sort_keys, UTIL_NAME="pairs_to_parquet_merge", readid="keep", chrom_order="lexicographic", chroms_path=None):
+    """
+    Header of the merged output: #samheader lines and @PG chains of all inputs, merged chromsizes
+    and the #sorted field of the merge keys.
+
+    Parameters
+    ----------
+    headers (list): headers of the inputs
+    sort_keys (list): column names, in the order of the sort
+    UTIL_NAME (str): name of the tool in the new @PG record
+    readid (str): keep, drop or hash, see duckdb_utils.READID_MODES
+    chrom_order (str): order of the chromosomes, see header_metadata.extract_ordered_chromosome_field
+    chroms_path (str): .chrom.sizes file, for chrom_order 'file'
+
+    Returns
+    ----------
+    list: the merged header
+    """
+    # the #sorted fields must agree for headerops.merge_headers, the merge sets its own
+    header = headerops.merge_headers([duckdb_sort.set_sorted_field(h, sort_keys) for h in headers])
+    header = headerops.append_new_pg(header, ID=UTIL_NAME, PN=UTIL_NAME)
+    if any(l.startswith("#chromsize") for l in header):
+        # the #chromsize lines follow the order of the merge, as in sorted outputs
+        chroms = header_metadata.extract_ordered_chromosome_field(headerops.extract_chromsizes(header), chrom_order, chroms_path)
+        header = header_metadata.set_chromsize_order(header, chroms)
+    if readid == "drop":
+        header = headerops.set_columns(header, [col for col in headerops.extract_column_names(header) if col != "readID"])
+    return header
+
+
+def merge_sorted_files(
+    input_paths,
+    output_path,
+    sort_keys,
+    temp_directory=None,
+    memory_limit=None,
+    enable_progress_bar=False,
+    numb_threads=8,
+    compress_program="auto",
+    UTIL_NAME="pairs_to_parquet_merge",
+    **kwargs
+    ):
+    """
+    Streams a k-way merge of .pairs(.gz/.lz4/.zst/.bz2)/.parquet files sorted by sort_keys into one sorted output.
+    Every input is read by its own DuckDB connection in batches of export_batch_size rows,
+    so the memory is proportional to the number of inputs times the batch size.
+
+    Parameters
+    ----------
+    input_paths (list): paths to the sorted inputs, with the same columns
+    output_path (str): path to the .pairs(.gz/.lz4/.zst/.bz2)/.parquet output
+    sort_keys (list): column names, in the order of the sort
+    temp_directory (str): temporary directory of DuckDB
+    memory_limit (str): memory of DuckDB, shared by the connections
+    numb_threads (int): DuckDB threads, shared by the connections
+    compress_program (str): compressor of .pairs outputs, see csv_parquet_converter.choose_compressor
+    UTIL_NAME (str): name of the tool in the @PG record
+    kwargs: the input, output and Parquet writer options of csv_parquet_converter.duckdb_read_query_write
+    """
+    for input_path in input_paths:
+        csv_parquet_converter.check_input_output_paths(input_path, output_path, kwargs.get("partition_by_chroms", False))
+
+    headers = [csv_parquet_converter.read_header(input_path) for input_path in input_paths]
+    column_names = headerops.extract_column_names(headers[0])
+    for input_path, header in zip(input_paths, headers):
+        if headerops.extract_column_names(header) != column_names:
+            raise ValueError(f"Columns of {input_path} differ from those of {input_paths[0]}")
+        claimed_keys = duckdb_sort.extract_sort_keys(header)
+        if claimed_keys is not None and not duckdb_sort.is_sorted_by(claimed_keys, sort_keys):
+            logger.warning(f"{input_path} is sorted by {','.join(claimed_keys)} according to its header")
+
+    chrom_order = kwargs.get("chrom_order", "lexicographic")
+    chroms_path = kwargs.get("chroms_path", None)
+    header = merge_headers(headers, sort_keys, UTIL_NAME, kwargs.get("readid", "keep"), chrom_order, chroms_path)
+
+    n_inputs = len(input_paths)
+    input_memory = duckdb_sort.split_memory_limit(memory_limit, n_inputs + 1)
+    input_threads = max(numb_threads // n_inputs, 1)
+    batch_size = kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE)
+
+    body_streams = []
+    try:
+        inputs = []
+        schemas = []
+        for input_path in input_paths:
+            con = duckdb_utils.setup_duckdb_connection(temp_directory, input_memory, False, "no_output", input_threads)
+            input_header, query, body_stream = csv_parquet_converter.read_input_query(con, input_path, UTIL_NAME, **kwargs)
+            body_streams.append(body_stream)
+            # the columns without reading the rows
+            schemas.append(duckdb_utils.decode_dictionaries(con.execute(f"SELECT * FROM ({query}) LIMIT 0").fetch_record_batch().read_all()).schema)
+            # chroms are compared by their codes in the merged CHROM_TYPE, the same in all connections
+            con, chromsizes = duckdb_utils.setup_duckdb_types_from_header(con, header, chrom_order, chroms_path)
+            column_types = duckdb_utils.classify_column_types_by_name(headerops.extract_column_names(input_header))
+            if not len(chromsizes):
+                column_types = {col: "STRING" if typ == "CHROM_TYPE" else typ for col, typ in column_types.items()}
+            query = f"SELECT *, {merge_key_projection(sort_keys, column_types)} FROM ({query})"
+            tables = duckdb_utils.duckdb_query_iterator(con, query, batch_size)
+            inputs.append(_checked_tables(tables, len(sort_keys), input_path))
+
+        # inputs may differ in their types, e.g. UINTEGER positions of compact schemas and BIGINT positions
+        try:
+            schema = pa.unify_schemas(schemas, promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            raise ValueError(f"The columns of the inputs have incompatible types: {e}") from e
+        merged = merge_sorted_tables(inputs, len(sort_keys))
+        batches = (batch for table in merged for batch in table.cast(schema).to_batches())
+        con = duckdb_utils.setup_duckdb_connection(temp_directory, input_memory, enable_progress_bar, "no_output", numb_threads)
+        con.register("merged_pairs", pa.RecordBatchReader.from_batches(schema, batches))
+        query = "SELECT * FROM merged_pairs"
+
+        csv_parquet_converter.write_query_output(
+            con, query, header, output_path, numb_threads, compress_program,
+            temp_directory=temp_directory, memory_limit=memory_limit, **kwargs
+        )
+    finally:
+        # the streams opened so far, also if an input or the output failed
+        for input_path, body_stream in zip(input_paths, body_streams):
+            csv_parquet_converter.close_input(body_stream, input_path)
+
@@ -1,75 +1,59 @@
 
 import duckdb
-import re
+import functools
+import json
 import warnings
+import pyarrow.compute as pc
 from pairtools.lib import fileio, headerops, pairsam_format
 
-from . import duckdb_utils, json_transform, header_metadata
-
-def translate_condition(cond: str) -> str:
-    """Translate Pairtools/Python-like expressions into DuckDB SQL."""
-
-    # Basic operators
-    cond = cond.replace(" and ", " AND ")
-    cond = cond.replace(" or ", " OR ")
-    cond = cond.replace("==", "=")
-    cond = cond.replace("!=", "<>")
-    cond = cond.replace(" in ", " IN ")
-
-    # anything inside parentheses (...) becomes a group -> \1, \2..
-    # Python abs() → DuckDB abs() -> USELESS??
-    cond = re.sub(r"abs\(([^)]+)\)", r"abs(\1)", cond)
-
-    # String quotes -> SQL single quotes
-    cond = re.sub(r'"([^"]*)"', r"'\1'", cond)
-
-    # regex_match(col, 'pattern')
-    cond = re.sub(
-        r"regex_match\(([^,]+),\s*'([^']+)'\)",
-        r"\1 ~ '\2'",
-        cond,
-        flags=re.IGNORECASE,
-    )
-
-    # wildcard_match(col, 'C*') → col LIKE 'C%'
-    cond = re.sub(
-        r"wildcard_match\(([^,]+),\s*'([^']+)'\)",
-        lambda m: f"{m.group(1)} LIKE '{m.group(2).replace('*','%')}'",
-        cond,
-        flags=re.IGNORECASE,
-    )
-
-    # csv_match(col, 'a,b,c')
-    def csv_match_repl(m):
-        col = m.group(1)
-        values = m.group(2).split(",")
-        quoted = ",".join(f"'{v.strip()}'" for v in values)
-        return f"{col} IN ({quoted})"
-
-    cond = re.sub(
-        r"csv_match\(([^,]+),\s*'([^']+)'\)",
-        csv_match_repl,
-        cond,
-        flags=re.IGNORECASE,
-    )
-
-    # region_match(col, pos, 'chr', start, end)
-    cond = re.sub(
-        r"region_match\(([^,]+),([^,]+),\s*'([^']+)',\s*(\d+),\s*(\d+)\)",
-        r"(\1 = '\3' AND \2 BETWEEN \4 AND \5)",
-        cond,
-        flags=re.IGNORECASE,
-    )
-
-    # region_match(col, pos, 'chr', start)
-    # → open-ended range
-    cond = re.sub(
-        r"region_match\(([^,]+),([^,]+),\s*'([^']+)',\s*(\d+)\)",
-        r"(\1 = '\3' AND \2 >= \4)",
-        cond,
-        flags=re.IGNORECASE,
-    )
-    return cond
+from .._logging import get_logger
+from . import duckdb_utils, json_transform, header_metadata, parquet_dataset, csv_parquet_converter, select_condition
+
+logger = get_logger()
+
+
+# DuckDB types of the integer columns, see duckdb_utils.classify_column_types_by_name
+INTEGER_TYPES = ("INTEGER", "UINTEGER", "UTINYINT")
+
+# boolean columns of the single-pass query of several outputs: select_0, select_1, ... one per condition
+SELECT_COLUMN_PREFIX = "select_"
+
+
+def compile_condition(condition, column_names):
+    """
+    Compiles a pairtools select condition into a DuckDB predicate, see select_condition.compile_condition.
+
+    Returns
+    ----------
+    str: the predicate, with escaped literals
+    """
+    column_types = duckdb_utils.classify_column_types_by_name(column_names)
+    integer_columns = [col for col, typ in column_types.items() if typ in INTEGER_TYPES]
+    sql = select_condition.compile_condition(condition, column_names, integer_columns).sql
+    logger.info(f"Condition: {sql}")
+    return sql
+
+
+def scan_filters(plan):
+    """Filters of the Parquet scans in a JSON plan of DuckDB (EXPLAIN (FORMAT JSON) ...)."""
+    if isinstance(plan, dict):
+        filters = plan.get("extra_info", {}).get("Filters", [])
+        filters = [filters] if isinstance(filters, str) else filters
+        return filters + scan_filters(plan.get("children", []))
+    return [f for node in plan for f in scan_filters(node)]
+
+
+def log_scan_filters(con, query):
+    """Logs the filters, which DuckDB pushes into the Parquet scan of the query and checks against the row group statistics."""
+    plan = json.loads(con.execute(f"EXPLAIN (FORMAT JSON) {query}").fetchone()[1])
+    filters = scan_filters(plan)
+    if plan and plan[0].get("name") == "EMPTY_RESULT":
+        logger.info("The statistics of the input exclude every row group, nothing is read")
+    elif filters:
+        logger.info(f"Row groups are pruned by: {' AND '.join(filters)}")
+    else:
+        logger.info("No filter is pushed into the Parquet scan, every row group is read")
+
 
 def header_update(header:list[str],
     UTIL_NAME: str, 
@@ -108,7 +92,52 @@ def header_update(header:list[str],
     
     return new_header
 
-def run_select_parquet(
+def read_manifest(manifest_path):
+    """
+    Reads the (condition, output) pairs of a fan-out select.
+    A .yaml/.yml manifest is a list of mappings with the keys condition and output, e.g.
+
+        - condition: chrom1 == chrom2 and abs(pos1 - pos2) < 1e4
+          output: cis_near.parquet
+        - condition: chrom1 != chrom2
+          output: trans.parquet
+
+    any other manifest has a condition and an output per line, separated by a tab; empty lines and lines starting with # are skipped.
+
+    Returns
+    ----------
+    list: (condition, output) tuples
+    """
+    if manifest_path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Install pyyaml to read .yaml manifests, or use a tab-separated one.")
+        with open(manifest_path) as f:
+            entries = yaml.safe_load(f) or []
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise ValueError(f"{manifest_path}: expected a list of mappings with the keys condition and output")
+        selections = [(str(entry.get("condition", "")), str(entry.get("output", ""))) for entry in entries]
+    else:
+        selections = []
+        with open(manifest_path) as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 2:
+                    raise ValueError(f"{manifest_path}: expected a condition and an output separated by a tab, got {line!r}")
+                selections.append((fields[0], fields[1]))
+
+    if not selections:
+        raise ValueError(f"{manifest_path}: no conditions")
+    for condition, output in selections:
+        if not condition.strip() or not output.strip():
+            raise ValueError(f"{manifest_path}: every entry needs a condition and an output")
+    return [(condition.strip(), output.strip()) for condition, output in selections]
+
+
+def run_select(
     input_path: str,
     output: str,
     output_rest: str,
@@ -116,54 +145,96 @@ def run_select_parquet(
     remove_columns: str = "",
     chrom_subset: str = None,
     type_cast=(),
+    manifest: str = None,
+    **kwargs,
 ):
-    """Execute the SELECT operation using DuckDB SQL."""
+    """Execute the SELECT operation using DuckDB SQL.
+    The input is a .pairs(.gz/.lz4/.zst/.bz2) file, a .parquet file or a partitioned dataset,
+    the outputs are .pairs or .parquet files.
+    With a manifest (see read_manifest), the rows of each of its conditions are written to its output,
+    all of them from a single scan of the input; a row can go to several outputs and output_rest gets the rows
+    of none of them. condition and output are not used then.
+    A single condition on a .parquet input keeps the scan pruned by the condition and writes output_rest
+    from a second scan; .pairs inputs, which are streamed once, route the rows of both outputs from one scan.
+    Keyword arguments set the writer, see csv_parquet_converter.write_query_output."""
 
     UTIL_NAME="pairs_to_parquet_select"
 
+    selections = read_manifest(manifest) if manifest else [(condition, output)]
+    outputs = [output for _, output in selections] + ([output_rest] if output_rest else [])
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Every condition and the rest need their own output")
+
+    for path in outputs:
+        csv_parquet_converter.check_input_output_paths(input_path, path, kwargs.get("partition_by_chroms", False))
+
     con = duckdb.connect()
-    old_header=duckdb_utils.duckdb_kv_metadata_to_header(input_path, con)
+    body_stream = None
+    parquet_input = parquet_dataset.is_parquet(input_path)
+    if parquet_input:
+        old_header=duckdb_utils.duckdb_kv_metadata_to_header(input_path, con)
+        # the order of CHROM_TYPE is the order of the data files of partitioned inputs and outputs
+        con, _ = duckdb_utils.setup_duckdb_types_from_header(con, old_header)
+        # the columns are read as stored, without casts, so that the condition is checked against the row group statistics
+        source = parquet_dataset.parquet_source(input_path, duckdb_utils.chrom_type_values(con))
+    else:
+        old_header = csv_parquet_converter.read_header(input_path)
+        # the body is streamed by the --input-reader of read_input_query; the readID column is kept as for .parquet inputs
+        _, query, body_stream = csv_parquet_converter.read_input_query(con, input_path, UTIL_NAME, **{**kwargs, "readid": "keep"})
+        source = f"({query})"
     new_header=header_update(old_header, UTIL_NAME, remove_columns, chrom_subset)
 
-    sql_condition = translate_condition(condition.strip())
-
+    chroms = None
     if chrom_subset:
         with open(chrom_subset) as f:
-            chroms = [l.split()[0] for l in f]
-        sql_condition = (
-            f"({sql_condition}) AND chrom1 IN {tuple(chroms)} "
-            f"AND chrom2 IN {tuple(chroms)}"
-        )
-
-    # initial query
-    query = f"SELECT * FROM parquet_scan('{input_path}') WHERE {sql_condition}"
-
+            chroms = ",".join(l.split()[0] for l in f)
+    sql_conditions = []
+    for condition, output in selections:
+        if chroms is not None:
+            condition = f"({condition}) and csv_match(chrom1, {chroms!r}) and csv_match(chrom2, {chroms!r})"
+        if manifest:
+            logger.info(f"Condition of {output}:")
+        sql_conditions.append(compile_condition(condition, headerops.extract_column_names(old_header)))
+
+    projection = "*"
     if remove_columns:
         # because they were already updated in header update
         keep = headerops.extract_column_names(new_header)
         if not keep:
             raise ValueError("remove-columns removed all columns.")
-
-        query = f"SELECT {', '.join(keep)} FROM parquet_scan('{input_path}') WHERE {sql_condition}"
-
+        projection = ", ".join(keep)
     if type_cast:
-        cast_exprs = []
-        for col, typ in type_cast:
-            cast_exprs.append(f"CAST({col} AS {typ}) AS {col}")
-
-        cast_select = ", ".join(cast_exprs)
-        query = query.replace("SELECT", f"SELECT {cast_select},", 1)
-
-    # write to output
-    kv_metadata = duckdb_utils.header_to_kv_metadata(new_header)
-    con.execute(f"COPY ({query}) TO '{output}' (FORMAT PARQUET, KV_METADATA {kv_metadata})")
-
-    # write rest
+        projection = ", ".join([f"CAST({col} AS {typ}) AS {col}" for col, typ in type_cast] + [projection])
+
+    if len(selections) == 1 and (not output_rest or parquet_input):
+        query = f"SELECT {projection} FROM {source} WHERE {sql_conditions[0]}"
+        if parquet_input:
+            log_scan_filters(con, query)
+        csv_parquet_converter.write_query_output(con, query, new_header, selections[0][1], **kwargs)
+        if output_rest:
+            # the selected pairs keep the pruned scan, the rest needs every row group and is read by a second scan,
+            # which costs about a scan of the input, far less than routing the selected pairs from a full scan
+            rest_query = f"SELECT {projection} FROM {source} WHERE NOT coalesce({sql_conditions[0]}, false)"
+            csv_parquet_converter.write_query_output(con, rest_query, new_header, output_rest, **kwargs)
+        csv_parquet_converter.close_input(body_stream, input_path)
+        return
+
+    if parquet_input:
+        logger.info("With several conditions, every row group is read")
+    # a single scan: every condition becomes a boolean column and every row is routed to the outputs of its true columns,
+    # rows for which a condition is NULL are not selected by it, as with WHERE
+    columns = [f"{SELECT_COLUMN_PREFIX}{i}" for i in range(len(selections))]
+    flags = ", ".join(f"coalesce({sql_condition}, false) AS {column}" for sql_condition, column in zip(sql_conditions, columns))
+    query = f"SELECT {projection}, {flags} FROM {source}"
+
+    routes = {
+        output: (new_header, lambda table, column=column: table.column(column))
+        for (_, output), column in zip(selections, columns)
+    }
     if output_rest:
-        rest_query = f"""
-        SELECT * FROM parquet_scan('{input_path}')
-        EXCEPT ALL
-        ({query})
-        """
-        con.execute(f"COPY ({rest_query}) TO '{output_rest}' (FORMAT PARQUET, KV_METADATA {kv_metadata})")
-
+        routes[output_rest] = (
+            new_header,
+            lambda table: pc.invert(functools.reduce(pc.or_, [table.column(column) for column in columns])),
+        )
+    csv_parquet_converter.write_routed_outputs(con, query, columns, routes, **kwargs)
+    csv_parquet_converter.close_input(body_stream, input_path)
@@ -0,0 +1,539 @@
+import bisect
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from pairtools.lib import headerops
+
+from . import duckdb_utils, compression, parquet_dataset
+
+
+# column names are shortened in the #sorted field, as pairtools writes "#sorted: chr1-chr2-pos1-pos2"
+SORTED_FIELD_NAMES = {"chrom1": "chr1", "chrom2": "chr2"}
+
+# what to do when the header claims the requested order
+IF_SORTED_MODES = ("verify", "skip", "resort")
+
+ENUM_TYPES = ("CHROM_TYPE", "STRAND_TYPE", "ALIGNMENT_TYPE")
+
+# runs of late_materialization_sort merged within the memory of one run, more runs take more memory
+MERGE_FAN_IN = 64
+
+
+def sorted_field(sort_keys):
+    """
+    Value of the #sorted header field for the sort keys, e.g. "chr1-chr2-pos1-pos2-pair_type".
+
+    Parameters
+    ----------
+    sort_keys (list): column names, in the order of the sort
+
+    Returns
+    ----------
+    str
+    """
+    return "-".join(SORTED_FIELD_NAMES.get(key, key) for key in sort_keys)
+
+
+def parse_sorted_field(value):
+    """
+    Sort keys (column names) from the value of the #sorted header field, the reverse of sorted_field.
+
+    Returns
+    ----------
+    list: column names, empty if the value is empty
+    """
+    column_names = {short: col for col, short in SORTED_FIELD_NAMES.items()}
+    return [column_names.get(key, key) for key in value.strip().split("-") if key]
+
+
+def extract_sort_keys(header):
+    """
+    Sort keys claimed by the #sorted field of a header.
+
+    Returns
+    ----------
+    list or None: column names, None if the header has no #sorted field
+    """
+    for line in header:
+        if line.startswith("#sorted:"):
+            return parse_sorted_field(line.split(":", 1)[1])
+    return None
+
+
+def set_sorted_field(header, sort_keys):
+    """
+    Replaces (or adds after the format line) the #sorted field of a header.
+
+    Parameters
+    ----------
+    header (list): the header lines
+    sort_keys (list): column names, in the order of the sort
+
+    Returns
+    ----------
+    list: the updated header
+    """
+    line = "#sorted: " + sorted_field(sort_keys)
+    header = [l for l in header if not l.startswith("#sorted:")]
+    position = 1 if header and header[0].startswith("##") else 0
+    return header[:position] + [line] + header[position:]
+
+
+def is_sorted_by(claimed_keys, sort_keys):
+    """An order by claimed_keys is also an order by sort_keys, if sort_keys is its prefix."""
+    return claimed_keys is not None and list(claimed_keys[:len(sort_keys)]) == list(sort_keys)
+
+
+def _order_violations(keys, previous):
+    """
+    Checks consecutive rows of the key columns for a descending step.
+
+    Parameters
+    ----------
+    keys (pyarrow.Table): key columns in the order of the sort
+    previous (pyarrow.Table): last row of the previous batch, or None
+
+    Returns
+    ----------
+    bool: True if any row is smaller than the one before it
+    """
+    if previous is not None:
+        keys = pa.concat_tables([previous, keys])
+    if keys.num_rows < 2:
+        return False
+
+    # lexicographic comparison: a step is descending, if all preceding keys tie and this key decreases
+    descending = pa.repeat(False, keys.num_rows - 1)
+    ties = pa.repeat(True, keys.num_rows - 1)
+    for column in keys.columns:
+        before, after = column.slice(0, keys.num_rows - 1), column.slice(1)
+        descending = pc.or_(descending, pc.and_(ties, pc.fill_null(pc.less(after, before), False)))
+        ties = pc.and_(ties, pc.fill_null(pc.equal(after, before), False))
+    return pc.any(descending).as_py()
+
+
+def sort_key_projection(sort_keys, column_types):
+    """
+    Key columns key_0, key_1, ... in the order of ORDER BY: ENUM columns by their codes, other columns by value.
+
+    Parameters
+    ----------
+    sort_keys (list): column names, in the order of the sort
+    column_types (dict): DuckDB types of the columns, chrom columns without chromsizes must be STRING
+
+    Returns
+    ----------
+    str: SELECT list of the key columns
+    """
+    return ", ".join(
+        f"enum_code(CAST({key} AS {column_types[key]})) AS key_{i}" if column_types.get(key) in ENUM_TYPES else f"{key} AS key_{i}"
+        for i, key in enumerate(sort_keys)
+    )
+
+
+def verify_sorted(input_path, header, sort_keys, con=None, chrom_order="lexicographic", chroms_path=None):
+    """
+    Checks in one scan of the key columns, whether a file is sorted by sort_keys in the order of ORDER BY:
+    ENUM columns by their codes, other columns by value.
+
+    Parameters
+    ----------
+    input_path (str): .parquet, .pairs, .pairs.gz or .pairs.zst file, other inputs cannot be re-read by DuckDB
+    header (list): the header of the file
+    sort_keys (list): column names, in the order of the sort
+    con (duckdb.DuckDBPyConnection): connection to use, a new one if not provided
+    chrom_order (str): order of the chromosomes, see header_metadata.extract_ordered_chromosome_field
+    chroms_path (str): .chrom.sizes file, for chrom_order 'file'
+
+    Returns
+    ----------
+    bool or None: None if the file cannot be verified
+    """
+    con = con if con is not None else duckdb_utils.setup_duckdb_connection(enable_progress_bar=False, enable_profiling="no_output")
+    con, chromsizes = duckdb_utils.setup_duckdb_types_from_header(con, header, chrom_order, chroms_path)
+
+    column_names = headerops.extract_column_names(header)
+    column_types = duckdb_utils.classify_column_types_by_name(column_names)
+    if not len(chromsizes):
+        # without chromsizes chroms are VARCHARs, compared in the same lexicographic order
+        column_types = {col: "STRING" if typ == "CHROM_TYPE" else typ for col, typ in column_types.items()}
+
+    if parquet_dataset.is_parquet(input_path):
+        source = parquet_dataset.parquet_source(input_path, duckdb_utils.chrom_type_values(con))
+    elif input_path.endswith(("pairs", "pairs.gz")) or compression.detect_codec(input_path) == "zstd":
+        source = (
+            f"read_csv('{input_path}', delim='\t', skip={len(header)}, columns = {column_types}, "
+            "header=false, auto_detect=false)"
+        )
+    else:
+        return None
+
+    keys = sort_key_projection(sort_keys, column_types)
+    # with preserve_insertion_order (DuckDB default), the scan comes out in file order
+    previous = None
+    for batch in con.execute(f"SELECT {keys} FROM {source}").fetch_record_batch():
+        table = pa.Table.from_batches([batch])
+        if _order_violations(table, previous):
+            return False
+        if table.num_rows:
+            previous = table.slice(table.num_rows - 1)
+    return True
+
+
+# upper bound of the number of partitions of the partitioned sort: chrom pairs are grouped into
+# buckets of consecutive pairs, every partition costs a DuckDB connection and a few files
+MAX_SORT_PARTITIONS = 64
+
+# DuckDB default of partitioned_write_flush_threshold
+PARTITIONED_WRITE_FLUSH_THRESHOLD = 524288
+
+MEMORY_UNITS = {
+    "": 1, "B": 1,
+    "K": 1000, "KB": 1000, "KIB": 1024,
+    "M": 1000 ** 2, "MB": 1000 ** 2, "MIB": 1024 ** 2,
+    "G": 1000 ** 3, "GB": 1000 ** 3, "GIB": 1024 ** 3,
+    "T": 1000 ** 4, "TB": 1000 ** 4, "TIB": 1024 ** 4,
+}
+
+
+def parse_memory_limit(memory_limit):
+    """Number of bytes of a DuckDB memory limit, e.g. '2G', '500MB', '1.5GiB'."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", str(memory_limit))
+    if match is None or match.group(2).upper() not in MEMORY_UNITS:
+        raise ValueError(f"Invalid memory limit: {memory_limit}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).upper()])
+
+
+def split_memory_limit(memory_limit, n_parts):
+    """
+    Splits a DuckDB memory limit (e.g. '2G', '500MB', '1.5GiB') into equal budgets.
+
+    Returns
+    ----------
+    str or None: memory limit of one part in bytes (e.g. '500000000B'), None if memory_limit is None
+    """
+    if memory_limit is None:
+        return None
+    return f"{parse_memory_limit(memory_limit) // max(n_parts, 1)}B"
+
+
+def partition_expression(sort_keys, column_types, n_chroms, n_partitions=MAX_SORT_PARTITIONS):
+    """
+    SQL expression of the partition of a row for the partitioned sort, or None if the sort
+    does not start with a chrom column. Partitions are ranges of (chrom1, chrom2) pairs in ENUM order,
+    so sorting every partition and concatenating them in partition order gives the global order.
+
+    Parameters
+    ----------
+    sort_keys (list): column names, in the order of the sort
+    column_types (dict): DuckDB types of the columns, chrom columns must be CHROM_TYPE
+    n_chroms (int): number of values of CHROM_TYPE
+    n_partitions (int): maximum number of partitions
+
+    Returns
+    ----------
+    str or None
+    """
+    chrom_keys = []
+    for key in sort_keys[:2]:
+        if column_types.get(key) != "CHROM_TYPE":
+            break
+        chrom_keys.append(key)
+    if not chrom_keys:
+        return None
+
+    # NULLs come last in ORDER BY, so they get the code after the last chrom
+    base = n_chroms + 1
+    # enum_code is as narrow as the ENUM (UTINYINT for up to 255 chroms), the pair code needs more
+    codes = [f"coalesce(CAST(enum_code({key}) AS BIGINT), {n_chroms})" for key in chrom_keys]
+    key = codes[0] if len(codes) == 1 else f"{codes[0]} * {base} + {codes[1]}"
+    bucket_width = -(-(base ** len(codes)) // n_partitions)
+    return f"({key}) // {bucket_width}"
+
+
+def _sort_partition(partition_path, output_path, header, sort_keys, memory_limit=None, temp_directory=None, chrom_order="lexicographic"):
+    """
+    Sorts one partition of the partitioned sort with one thread under its own memory budget.
+    Runs in a worker process: the ENUM types are set up again from the header.
+    """
+    con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, False, "no_output", 1)
+    con, chromsizes = duckdb_utils.setup_duckdb_types_from_header(con, header, chrom_order)
+    projection = _enum_projection(header, chromsizes)
+    con.execute(
+        f"COPY (SELECT {projection} FROM read_parquet('{partition_path}/*.parquet', hive_partitioning=false) "
+        f"{duckdb_utils.sort_query(sort_keys)}) TO '{output_path}' (FORMAT PARQUET, COMPRESSION lz4)"
+    )
+    con.close()
+    return output_path
+
+
+def _enum_projection(header, chromsizes):
+    """Projection of the columns of a header, casting the ENUM columns stored as strings back to ENUMs."""
+    column_types = duckdb_utils.classify_column_types_by_name(headerops.extract_column_names(header))
+    enum_types = ENUM_TYPES if len(chromsizes) else ENUM_TYPES[1:]
+    return duckdb_utils.cast_projection({col: typ if typ in enum_types else None for col, typ in column_types.items()})
+
+
+def sort_directories(con, directories, header, sort_keys, file_name="data_0.parquet", copy_options=""):
+    """
+    Replaces the .parquet files of every directory by one file sorted by sort_keys, one directory after the other,
+    e.g. the partitions of a dataset written by PARTITION_BY, which does not keep the order of the rows.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): connection with the ENUM types of the header, lexicographic chrom order is enough
+        if every directory holds one chrom pair
+    directories (list): paths to the directories
+    header (list): header of the rows
+    sort_keys (list): column names, in the order of the sort
+    file_name (str): name of the sorted file
+    copy_options (str): options of the COPY after FORMAT PARQUET, e.g. the kv metadata
+
+    Returns
+    ----------
+    list: paths to the sorted files
+    """
+    chromsizes = headerops.extract_chromsizes(header) if any(l.startswith("#chromsize") for l in header) else {}
+    projection = _enum_projection(header, chromsizes)
+    sorted_paths = []
+    for directory in directories:
+        # not a .parquet file, until the unsorted files are removed
+        sorting_path = os.path.join(directory, ".sorting")
+        con.execute(
+            f"COPY (SELECT {projection} FROM read_parquet('{directory}/*.parquet', hive_partitioning=false) "
+            f"{duckdb_utils.sort_query(sort_keys)}) TO '{sorting_path}' (FORMAT PARQUET{copy_options})"
+        )
+        for name in os.listdir(directory):
+            if name.endswith(".parquet"):
+                os.remove(os.path.join(directory, name))
+        sorted_paths.append(os.path.join(directory, file_name))
+        os.rename(sorting_path, sorted_paths[-1])
+    return sorted_paths
+
+
+def partitioned_sort(con, query, header, sort_keys, temp_directory, nproc=1, memory_limit=None, n_partitions=MAX_SORT_PARTITIONS, chrom_order="lexicographic"):
+    """
+    External sort in partitions of (chrom1, chrom2) pairs: one scan of the query writes the partitions,
+    then they are sorted independently by nproc processes, each under memory_limit / nproc,
+    and read back in partition order.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): connection with the ENUM types of the header
+    query (str): SELECT of the rows to sort
+    header (list): header of the rows, with #chromsize lines
+    sort_keys (list): column names, in the order of the sort, starting with chrom1 (and chrom2)
+    temp_directory (str): directory for the partitions and their sorted versions
+    nproc (int): number of sorting processes
+    memory_limit (str): total memory of the sorting processes, DuckDB notation
+    n_partitions (int): maximum number of partitions
+    chrom_order (str): order of CHROM_TYPE in the connection, 'lexicographic' or 'header'
+
+    Returns
+    ----------
+    str or None: SELECT of the sorted rows, None if the sort does not start with a chrom column
+        or the header has no chromsizes (the caller sorts globally then)
+    """
+    chromsizes = headerops.extract_chromsizes(header) if any(l.startswith("#chromsize") for l in header) else {}
+    column_types = duckdb_utils.classify_column_types_by_name(headerops.extract_column_names(header))
+    partition = partition_expression(sort_keys, column_types, len(chromsizes), n_partitions) if len(chromsizes) else None
+    if partition is None:
+        return None
+
+    partitions_dir = os.path.join(temp_directory, "partitions")
+    if memory_limit is not None:
+        # rows buffered by the partitioned write before it flushes to the partition files,
+        # the default (524288 rows) does not fit into small budgets with wide rows
+        flush_threshold = min(PARTITIONED_WRITE_FLUSH_THRESHOLD, parse_memory_limit(memory_limit) // 4096)
+        con.execute(f"SET partitioned_write_flush_threshold = {max(flush_threshold, 2048)}")
+    con.execute(
+        f"COPY (SELECT *, {partition} AS sort_partition FROM ({query})) TO '{partitions_dir}' "
+        "(FORMAT PARQUET, COMPRESSION lz4, PARTITION_BY (sort_partition))"
+    )
+
+    # no directory is written for an empty input
+    names = os.listdir(partitions_dir) if os.path.isdir(partitions_dir) else []
+    partitions = {
+        int(name.split("=", 1)[1]): os.path.join(partitions_dir, name)
+        for name in names if name.startswith("sort_partition=")
+    }
+    if not partitions:
+        return query
+    sorted_paths = {key: os.path.join(temp_directory, f"sorted_{key}.parquet") for key in partitions}
+    arguments = [
+        (partitions[key], sorted_paths[key], header, sort_keys, split_memory_limit(memory_limit, nproc), temp_directory, chrom_order)
+        for key in partitions
+    ]
+
+    if nproc > 1 and len(partitions) > 1:
+        # spawned, not forked: the parent holds DuckDB threads
+        with ProcessPoolExecutor(min(nproc, len(partitions)), mp_context=multiprocessing.get_context("spawn")) as pool:
+            for _ in pool.map(_sort_partition, *zip(*arguments)):
+                pass
+    else:
+        for args in arguments:
+            _sort_partition(*args)
+
+    # read in the order of the list, i.e. in partition order
+    paths = ", ".join(f"'{sorted_paths[key]}'" for key in sorted(partitions))
+    return f"SELECT {_enum_projection(header, chromsizes)} FROM read_parquet([{paths}])"
+
+
+def _sort_table(table, key_names):
+    """Sorts a pyarrow.Table by its key columns in the order of ORDER BY, NULLs last."""
+    indices = pc.sort_indices(table, sort_keys=[(name, "ascending") for name in key_names], null_placement="at_end")
+    return table.take(indices)
+
+
+class _Null:
+    """Stands for NULL in the keys of _merge_runs: it sorts after every value, as in ORDER BY."""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return not isinstance(other, _Null)
+
+    def __eq__(self, other):
+        return isinstance(other, _Null)
+
+    def __hash__(self):
+        return 0
+
+
+_NULL = _Null()
+
+
+def _key_tuples(keys):
+    """Rows of the key columns as tuples, which compare in the order of ORDER BY, NULLs last."""
+    columns = []
+    for column in keys.columns:
+        values = column.to_pylist()
+        columns.append([_NULL if value is None else value for value in values] if column.null_count else values)
+    return list(zip(*columns))
+
+
+def _merge_runs(paths, key_names, batch_size):
+    """
+    Merges sorted runs, Arrow IPC files of record batches, in a streaming pass: every run is read batch by batch.
+    All the rows up to the smallest last key of the batches in memory are in order, they are sorted and yielded.
+
+    Parameters
+    ----------
+    paths (list): paths to the runs
+    key_names (list): key columns of the runs, dropped from the yielded batches
+    batch_size (int): rows per yielded batch
+
+    Returns
+    ----------
+    Iterator[pyarrow.RecordBatch]
+    """
+    runs = [pa.ipc.open_file(path) for path in paths]
+    if len(runs) == 1:
+        for i in range(runs[0].num_record_batches):
+            yield runs[0].get_batch(i).drop_columns(key_names)
+        return
+    positions = [0] * len(runs)
+    buffers = [None] * len(runs)
+    keys = [None] * len(runs)
+
+    def refill(i):
+        while buffers[i] is None or buffers[i].num_rows == 0:
+            if positions[i] == runs[i].num_record_batches:
+                buffers[i] = None
+                return
+            buffers[i] = pa.Table.from_batches([runs[i].get_batch(positions[i])])
+            keys[i] = _key_tuples(buffers[i].select(key_names))
+            positions[i] += 1
+
+    for i in range(len(runs)):
+        refill(i)
+    while any(buffer is not None for buffer in buffers):
+        active = [i for i, buffer in enumerate(buffers) if buffer is not None]
+        bound = min(keys[i][-1] for i in active)
+        parts = []
+        for i in active:
+            n_rows = bisect.bisect_right(keys[i], bound)
+            parts.append(buffers[i].slice(0, n_rows))
+            buffers[i], keys[i] = buffers[i].slice(n_rows), keys[i][n_rows:]
+            refill(i)
+        merged = _sort_table(pa.concat_tables(parts), key_names).drop_columns(key_names)
+        yield from merged.to_batches(max_chunksize=batch_size)
+
+
+def late_materialization_sort(
+    con, query, header, sort_keys, temp_directory, batch_size=duckdb_utils.DEFAULT_BATCH_SIZE, relation_name="sorted_pairs", run_bytes=None,
+    ):
+    """
+    Sort, in which only the key columns are compared: runs of the rows are sorted by the indices of their keys,
+    the rows are moved once. If the rows fit in one run, the run is
+    the result, otherwise the runs are written as lz4-compressed Arrow IPC files into temp_directory
+    and merged in a streaming pass, see _merge_runs. Wide columns (sam1, sam2) are thus never compared
+    nor spilled uncompressed, and the temporary files hold one compressed copy of the rows.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): connection with the ENUM types of the header
+    query (str): SELECT of the rows to sort
+    header (list): header of the rows
+    sort_keys (list): column names, in the order of the sort
+    temp_directory (str): directory of the runs, must exist until the result is read
+    batch_size (int): rows per batch read from con and per batch of the result
+    relation_name (str): name under which the sorted rows are registered in the connection
+    run_bytes (int): size of a run, a quarter of the memory limit of con by default: sorting copies a run,
+        and the other half is left to DuckDB, which reads the input and writes the output
+
+    Returns
+    ----------
+    str: SELECT of the sorted rows
+    """
+    has_chromsizes = any(line.startswith("#chromsize") for line in header)
+    column_types = duckdb_utils.classify_column_types_by_name(headerops.extract_column_names(header))
+    if not has_chromsizes:
+        column_types = {col: "STRING" if typ == "CHROM_TYPE" else typ for col, typ in column_types.items()}
+    key_names = [f"key_{i}" for i in range(len(sort_keys))]
+    if run_bytes is None:
+        run_bytes = parse_memory_limit(con.execute("SELECT current_setting('memory_limit')").fetchone()[0]) // 4
+
+    reader = con.execute(f"SELECT *, {sort_key_projection(sort_keys, column_types)} FROM ({query})").fetch_record_batch(batch_size)
+    # strings instead of dictionaries: the IPC file format cannot replace dictionaries between batches
+    schema = duckdb_utils.decode_dictionaries(reader.schema.empty_table()).schema
+    write_options = pa.ipc.IpcWriteOptions(compression="lz4")
+    run_paths = []
+    run, run_size = [], 0
+
+    def write_run():
+        path = os.path.join(temp_directory, f"run_{len(run_paths)}.arrow")
+        rows = _sort_table(pa.concat_tables(run), key_names)
+        # the merge keeps a batch of every run in memory: batches of a fraction of run_bytes
+        chunk_rows = max(min(batch_size, rows.num_rows * (run_bytes // MERGE_FAN_IN) // max(run_size, 1)), 1)
+        with pa.ipc.new_file(path, schema, options=write_options) as writer:
+            writer.write_table(rows, max_chunksize=chunk_rows)
+        run_paths.append(path)
+
+    for batch in reader:
+        table = duckdb_utils.decode_dictionaries(pa.Table.from_batches([batch]))
+        if run and run_size + table.nbytes > run_bytes:
+            write_run()
+            run, run_size = [], 0
+        run.append(table)
+        run_size += table.nbytes
+
+    if run_paths:
+        if run:
+            write_run()
+        batches = _merge_runs(run_paths, key_names, batch_size)
+    else:
+        # one run in memory, also for an empty input
+        rows = _sort_table(pa.concat_tables(run or [schema.empty_table()]), key_names).drop_columns(key_names)
+        batches = rows.to_batches(max_chunksize=batch_size)
+    output_schema = schema
+    for name in key_names:
+        output_schema = output_schema.remove(output_schema.get_field_index(name))
+    con.register(relation_name, pa.RecordBatchReader.from_batches(output_schema, batches))
+    return f"SELECT * FROM {relation_name}"
@@ -0,0 +1,188 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from pairtools.lib import headerops
+
+from .._logging import get_logger
+from . import duckdb_utils, duckdb_sort, csv_parquet_converter
+
+logger = get_logger()
+
+
+# chrom of unmapped sides
+UNMAPPED_CHROM = "!"
+# keys that are not columns of the input, by their SQL expression; pairs with an unmapped side are neither cis nor trans
+SPLIT_KEYS = {
+    "cis_trans": f"""CASE WHEN CAST(chrom1 AS VARCHAR) = '{UNMAPPED_CHROM}' OR CAST(chrom2 AS VARCHAR) = '{UNMAPPED_CHROM}' THEN 'unmapped'
+        WHEN chrom1 = chrom2 THEN 'cis' ELSE 'trans' END""",
+}
+# the value of every row in the split query, not written
+SPLIT_KEY_COLUMN = "split_key"
+# {} of the output of the rows with a missing key (NULL): a lone % is never the percent-encoding of a value
+NULL_NAME = "%NULL"
+
+
+def split_key_expression(by, column_names):
+    """
+    SQL expression of the value by which the rows are split: a column of the input as VARCHAR or one of SPLIT_KEYS.
+
+    Parameters
+    ----------
+    by (str): name of the column or of the key
+    column_names (list): columns of the input
+
+    Returns
+    ----------
+    str: NULL for rows with a missing value
+    """
+    if by in SPLIT_KEYS:
+        return SPLIT_KEYS[by]
+    if by not in column_names:
+        raise ValueError(f"Cannot split by {by}: neither a column of the input ({', '.join(column_names)}) nor one of {', '.join(SPLIT_KEYS)}")
+    return f"CAST(\"{by}\" AS VARCHAR)"
+
+
+def output_path_for(output_template, value):
+    """
+    The output of a value: {} of output_template replaced by the value, percent-encoded if it is not safe in a file name,
+    or by NULL_NAME for a missing value (None).
+    """
+    if "{}" not in output_template:
+        raise ValueError(f"The output template {output_template} needs a {{}} for the value, e.g. pairs.{{}}.parquet")
+    return output_template.replace("{}", NULL_NAME if value is None else quote(value, safe="!+,=@"))
+
+
+def _value_parts(table):
+    """Splits a table into the rows of every value of SPLIT_KEY_COLUMN, keeping the order of the rows within a value."""
+    keys = table.column(SPLIT_KEY_COLUMN)
+    # sort_indices is stable: the rows of a value stay in the order of the input, the missing values come last
+    table = table.take(pc.sort_indices(keys, null_placement="at_end"))
+    runs = pc.run_end_encode(table.column(SPLIT_KEY_COLUMN).combine_chunks())
+    start = 0
+    for value, end in zip(runs.values.to_pylist(), runs.run_ends.to_pylist()):
+        yield value, table.slice(start, end - start).drop_columns([SPLIT_KEY_COLUMN])
+        start = end
+
+
+def _split_pass(reader, header, output_template, done, max_writers, input_path, temp_directory=None, memory_limit=None,
+                numb_threads=8, compress_program="auto", **kwargs):
+    """
+    Writes the rows of up to max_writers values, which are not in done, in the order in which the values come up.
+
+    Returns
+    ----------
+    dict: value -> output path of the values written in this pass
+    bool: whether values were left for another pass
+    """
+    schema = reader.schema.remove(reader.schema.get_field_index(SPLIT_KEY_COLUMN))
+    output_memory = duckdb_sort.split_memory_limit(memory_limit, max_writers + 1)
+    output_threads = max(numb_threads // max_writers, 1)
+    writers = {}
+    deferred = False
+
+    with ThreadPoolExecutor(max_writers) as executor:
+        try:
+            for batch in reader:
+                for value, part in _value_parts(pa.Table.from_batches([batch])):
+                    if value in done:
+                        continue
+                    if value not in writers:
+                        if len(writers) == max_writers:
+                            deferred = True
+                            continue
+                        output_path = output_path_for(output_template, value)
+                        csv_parquet_converter.check_input_output_paths(input_path, output_path, kwargs.get("partition_by_chroms", False))
+                        if os.path.dirname(output_path):
+                            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                        writers[value] = csv_parquet_converter.QueuedOutputWriter(
+                            executor, output_path, header, schema, temp_directory, output_memory, output_threads,
+                            numb_threads, compress_program, **kwargs
+                        )
+                    writers[value].put(part)
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+
+        for writer in writers.values():
+            writer.finish()
+
+    return {value: writer.output_path for value, writer in writers.items()}, deferred
+
+
+def split_file(
+    input_path,
+    output_template,
+    by,
+    max_writers=32,
+    temp_directory=None,
+    memory_limit=None,
+    enable_progress_bar=False,
+    numb_threads=8,
+    compress_program="auto",
+    UTIL_NAME="pairs_to_parquet_split",
+    **kwargs
+    ):
+    """
+    Writes the pairs of every value of a column (or of a key of SPLIT_KEYS) into their own output, in the order of the input.
+    Every output gets the header of the input with a new @PG record, also in the kv metadata of .parquet outputs.
+
+    The outputs are written concurrently while the input is read, by at most max_writers writers at a time.
+    If the input has more values, the pairs of the first max_writers values that come up are written in the first pass
+    and the input is read again for the next ones, skipping the values already written.
+
+    Parameters
+    ----------
+    input_path (str): path to the .pairs(.gz/.lz4/.zst/.bz2)/.parquet input
+    output_template (str): path to the outputs, with {} for the value, e.g. pairs.{}.parquet
+    by (str): column of the input or cis_trans
+    max_writers (int): number of outputs written at a time
+    temp_directory (str): temporary directory of DuckDB
+    memory_limit (str): memory of DuckDB, split between the reading and the writing connections
+    enable_progress_bar (bool): progress bar of the reading connection
+    numb_threads (int): DuckDB threads of the reading connection, split between the writing connections
+    compress_program (str): compressor of .pairs outputs, see csv_parquet_converter.choose_compressor
+    UTIL_NAME (str): name of the tool in the @PG record
+    kwargs: the input, output and Parquet writer options of csv_parquet_converter.duckdb_read_query_write
+
+    Returns
+    ----------
+    dict: value -> output path, None for the rows with a missing value
+    """
+    if max_writers < 1:
+        raise ValueError("max_writers must be positive")
+    output_path_for(output_template, "")
+
+    outputs = {}
+    n_passes = 0
+    while True:
+        n_passes += 1
+        input_memory = duckdb_sort.split_memory_limit(memory_limit, max_writers + 1)
+        con = duckdb_utils.setup_duckdb_connection(temp_directory, input_memory, enable_progress_bar, "no_output", numb_threads)
+        header, query, body_stream = csv_parquet_converter.read_input_query(con, input_path, UTIL_NAME, **kwargs)
+        key = split_key_expression(by, headerops.extract_column_names(header))
+        split_query = f"SELECT *, {key} AS {SPLIT_KEY_COLUMN} FROM ({query})"
+        if outputs:
+            con.register("split_done", pa.table({"value": pa.array([value for value in outputs if value is not None], pa.string())}))
+            # NOT IN is NULL for missing values, they are kept by IS NULL until written
+            done = f"{SPLIT_KEY_COLUMN} NOT IN (SELECT value FROM split_done)"
+            if None not in outputs:
+                done = f"({done} OR {SPLIT_KEY_COLUMN} IS NULL)"
+            split_query = f"SELECT * FROM ({split_query}) WHERE {done}"
+
+        reader = con.execute(split_query).fetch_record_batch(kwargs.get("export_batch_size", duckdb_utils.DEFAULT_BATCH_SIZE))
+        written, deferred = _split_pass(
+            reader, header, output_template, outputs, max_writers, input_path, temp_directory, memory_limit,
+            numb_threads, compress_program, **kwargs
+        )
+        csv_parquet_converter.close_input(body_stream, input_path)
+        con.close()
+        outputs.update(written)
+        if not deferred:
+            break
+
+    logger.info(f"Split {input_path} by {by} into {len(outputs)} outputs in {n_passes} pass(es)")
+    return outputs
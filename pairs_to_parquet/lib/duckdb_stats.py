@@ -0,0 +1,149 @@
+import sys
+
+from pairtools.lib import fileio, headerops
+from pairtools.lib.stats import PairCounter
+
+from .._logging import get_logger
+from . import duckdb_utils, csv_parquet_converter
+
+logger = get_logger()
+
+
+# cis distances counted by PairCounter as cis_{kb}kb+
+CIS_KB_THRESHOLDS = (1, 2, 4, 10, 20, 40)
+
+
+def dist_bin_boundaries(dist_bins):
+    """
+    Upper bounds of the DuckDB histogram buckets, which count the distances of the bins of PairCounter:
+    a bin starts at its edge and ends before the next one, a histogram bucket ends at its bound inclusively.
+
+    Parameters
+    ----------
+    dist_bins (numpy.ndarray): sorted lower edges of the distance bins, starting at 0
+
+    Returns
+    ----------
+    dict: upper bound of the bucket -> lower edge of the bin, the last bin has no bound
+    """
+    return {int(upper) - 1: int(lower) for lower, upper in zip(dist_bins[:-1], dist_bins[1:])}
+
+
+def stats_query(query, dist_bins, unmapped_chrom="!"):
+    """
+    Aggregates the pairs of a query in one scan into counts by chroms, pair type and, for cis pairs,
+    the orientation, with the histogram of the cis distances and the counts of the long-range cis pairs.
+    Only the chrom, position, strand and pair type columns are read.
+
+    Parameters
+    ----------
+    query (str): query of the pairs, with the columns chrom1, pos1, chrom2, pos2, strand1, strand2, pair_type
+    dist_bins (numpy.ndarray): lower edges of the distance bins, see dist_bin_boundaries
+    unmapped_chrom (str): chrom of unmapped sides
+
+    Returns
+    ----------
+    str: the query, one row per chrom1, chrom2, pair_type, orientation
+    """
+    boundaries = list(dist_bin_boundaries(dist_bins))
+    kb_counts = ", ".join(f"count(*) FILTER (WHERE dist >= {kb * 1000}) AS cis_{kb}kb" for kb in CIS_KB_THRESHOLDS)
+    return f"""
+    SELECT chrom1, chrom2, pair_type, orientation,
+        count(*) AS n_pairs,
+        histogram(dist, {boundaries}) FILTER (WHERE dist IS NOT NULL) AS dist_freq,
+        {kb_counts}
+    FROM (
+        SELECT CAST(chrom1 AS VARCHAR) AS chrom1, CAST(chrom2 AS VARCHAR) AS chrom2, CAST(pair_type AS VARCHAR) AS pair_type,
+            CASE WHEN cis THEN CAST(strand1 AS VARCHAR) || CAST(strand2 AS VARCHAR) END AS orientation,
+            CASE WHEN cis THEN abs(CAST(pos2 AS BIGINT) - CAST(pos1 AS BIGINT)) END AS dist
+        FROM (
+            SELECT *, chrom1 = chrom2 AND CAST(chrom1 AS VARCHAR) != '{unmapped_chrom}' AS cis FROM ({query})
+        )
+    )
+    GROUP BY ALL
+    """
+
+
+def add_aggregates(counter, rows, unmapped_chrom="!"):
+    """
+    Adds the rows of stats_query to a pairtools PairCounter, as PairCounter.add_pair would add the pairs one by one.
+
+    Parameters
+    ----------
+    counter (pairtools.lib.stats.PairCounter): the counter, without filters
+    rows (Iterable[tuple]): rows of stats_query
+    unmapped_chrom (str): chrom of unmapped sides
+    """
+    stat = counter._stat["no_filter"]
+    bins = dist_bin_boundaries(counter._dist_bins)
+    last_bin = int(counter._dist_bins[-1])
+    for chrom1, chrom2, pair_type, orientation, n_pairs, dist_freq, *kb_counts in rows:
+        stat["total"] += n_pairs
+        stat["pair_types"][pair_type] = stat["pair_types"].get(pair_type, 0) + n_pairs
+        if chrom1 == unmapped_chrom and chrom2 == unmapped_chrom:
+            stat["total_unmapped"] += n_pairs
+        elif chrom1 == unmapped_chrom or chrom2 == unmapped_chrom:
+            stat["total_single_sided_mapped"] += n_pairs
+        else:
+            stat["total_mapped"] += n_pairs
+            # only mapped pairs can be duplicates, the other statistics count the rest
+            if pair_type == "DD":
+                stat["total_dups"] += n_pairs
+                continue
+            stat["total_nodups"] += n_pairs
+            stat["chrom_freq"][(chrom1, chrom2)] = stat["chrom_freq"].get((chrom1, chrom2), 0) + n_pairs
+            if chrom1 != chrom2:
+                stat["trans"] += n_pairs
+                continue
+            stat["cis"] += n_pairs
+            for bound, count in (dist_freq or {}).items():
+                stat["dist_freq"][orientation][bins.get(bound, last_bin)] += count
+            for kb, count in zip(CIS_KB_THRESHOLDS, kb_counts):
+                stat[f"cis_{kb}kb+"] += count
+
+
+def pairs_stats(
+    input_path,
+    temp_directory=None,
+    memory_limit=None,
+    enable_progress_bar=False,
+    numb_threads=8,
+    n_dist_bins_decade=PairCounter.N_DIST_BINS_DECADE_DEFAULT,
+    with_chromsizes=True,
+    **kwargs
+    ):
+    """
+    Statistics of a .pairs(.gz/.lz4/.zst/.bz2)/.parquet file as by pairtools stats, from one aggregating DuckDB scan.
+
+    Parameters
+    ----------
+    input_path (str): path to the input
+    temp_directory (str): temporary directory of DuckDB
+    memory_limit (str): memory of DuckDB
+    numb_threads (int): DuckDB threads
+    n_dist_bins_decade (int): number of distance bins per order of magnitude
+    with_chromsizes (bool): add the chromsizes of the header
+    kwargs: the input options of csv_parquet_converter.read_input_query
+
+    Returns
+    ----------
+    pairtools.lib.stats.PairCounter: the statistics
+    """
+    con = duckdb_utils.setup_duckdb_connection(temp_directory, memory_limit, enable_progress_bar, "no_output", numb_threads)
+    header, query, body_stream = csv_parquet_converter.read_input_query(con, input_path, "pairs_to_parquet_stats", **kwargs)
+
+    counter = PairCounter(n_dist_bins_decade=n_dist_bins_decade)
+    add_aggregates(counter, con.execute(stats_query(query, counter._dist_bins)).fetchall())
+    csv_parquet_converter.close_input(body_stream, input_path)
+
+    if with_chromsizes and any(l.startswith("#chromsize") for l in header):
+        counter.add_chromsizes(headerops.extract_chromsizes(header))
+    return counter
+
+
+def save_stats(counter, output_path, yaml=False, **kwargs):
+    """Writes a PairCounter as pairtools stats does, to stdout if output_path is empty."""
+    outstream = fileio.auto_open(output_path, mode="w", nproc=kwargs.get("nproc_out"), command=kwargs.get("cmd_out", None))
+    counter.save(outstream, yaml=yaml)
+    if outstream != sys.stdout:
+        outstream.close()
@@ -1,16 +1,32 @@
 import duckdb
 import os
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pyarrow as pa
 import pyarrow.parquet as pq
 import pyarrow.csv as csv
 from itertools import product
 
-from pairtools.lib import pairsam_format
-from . import json_transform, header_metadata
+from pairtools.lib import pairsam_format, headerops
+from . import json_transform, header_metadata, parquet_dataset
 
 # MAYBE TO RENAME TO PARQUET UTILS WILL BE MORE STRAIGHTFORWARD
 
+# rows per record batch fetched from DuckDB, same as the DuckDB default
+DEFAULT_BATCH_SIZE = 1_000_000
+# batches fetched ahead and being encoded to text while the previous ones are written
+DEFAULT_QUEUE_DEPTH = 4
+# Parquet codecs accepted by the DuckDB COPY statement, 'none' stands for uncompressed
+PARQUET_COMPRESSIONS = ("zstd", "snappy", "lz4", "gzip", "brotli", "none")
+# what happens to the readID column: kept as is, dropped or replaced by its 64-bit hash
+READID_MODES = ("keep", "drop", "hash")
+# kv metadata key of the summary statistics of .parquet outputs
+SUMMARY_STATS_KEY = "summary_stats"
+# rows per row group of the DuckDB Parquet writer
+DUCKDB_ROW_GROUP_SIZE = 122_880
+
 # duckdb
 def setup_duckdb_connection(temp_directory=None, memory_limit=None, enable_progress_bar=True, enable_profiling='json', numb_threads=4):
     """
@@ -65,7 +81,9 @@ def setup_duckdb_types(con, chromosom_field, reads_type_enum=False):
     con.execute("DROP TYPE IF EXISTS ALIGNMENT_TYPE")
 
     # Create new ENUM types
-    con.execute(f"CREATE TYPE CHROM_TYPE AS ENUM {chromosom_field};")
+    # not the tuple repr: a single chromosome would leave a trailing comma
+    chrom_values = ", ".join("'" + chrom.replace("'", "''") + "'" for chrom in chromosom_field)
+    con.execute(f"CREATE TYPE CHROM_TYPE AS ENUM ({chrom_values});")
     con.execute("CREATE TYPE STRAND_TYPE AS ENUM ('+', '-');")
 
     # all the possible alignments we can get 
@@ -78,13 +96,55 @@ def setup_duckdb_types(con, chromosom_field, reads_type_enum=False):
     return con
 
 # duckdb
-def classify_column_types_by_name(column_names):
+def setup_duckdb_types_from_header(con, header, chrom_order="lexicographic", chroms_path=None):
+    """
+    Sets up the ENUM types in a DuckDB connection, CHROM_TYPE is built from the #chromsize lines of the header
+    (or the chromsize kv metadata of a Parquet file, once converted to a header).
+    The order of CHROM_TYPE is the order of sorted outputs.
+
+    Parameters
+    ----------
+    con (duckdb.DuckDBPyConnection): The DuckDB connection.
+    header (list): the header lines.
+    chrom_order (str): order of the chromosomes, see header_metadata.extract_ordered_chromosome_field
+    chroms_path (str): .chrom.sizes file, for chrom_order 'file'
+
+    Returns
+    ----------
+    con (duckdb.DuckDBPyConnection): Configured DuckDB connection.
+    chromsizes (pandas.Series or dict): chromosome sizes from the header, empty if the header has none.
+    """
+    # extract_chromsizes fails on headers without #chromsize lines
+    has_chromsizes = any(line.startswith("#chromsize") for line in header)
+    chromsizes = headerops.extract_chromsizes(header) if has_chromsizes else {}
+    unknown_chrom = tuple("!")
+    chromosom_field = unknown_chrom + header_metadata.extract_ordered_chromosome_field(chromsizes, chrom_order, chroms_path)
+    con = setup_duckdb_types(con, chromosom_field)
+    return con, chromsizes
+
+def chrom_type_values(con):
+    """Values of CHROM_TYPE in a connection, in the order of the ENUM."""
+    return con.execute("SELECT enum_range(NULL::CHROM_TYPE)").fetchone()[0]
+
+# duckdb
+def _extra_column_dtype(col):
+    """Python type of an extra pairsam column, also for the per-side names (mapq1, pos52, ...), or None."""
+    if col in pairsam_format.DTYPES_EXTRA_COLUMNS:
+        return pairsam_format.DTYPES_EXTRA_COLUMNS[col]
+    if col[-1:] in ("1", "2"):
+        return pairsam_format.DTYPES_EXTRA_COLUMNS.get(col[:-1])
+    return None
+
+# duckdb
+def classify_column_types_by_name(column_names, compact_schema=False):
     """
     Classify columns based on predefined rules and types.
 
     Parameters
     ----------
     column_names (list): A list of column names to classify.
+    compact_schema (bool): use the narrowest lossless types: positions (pos1, pos2, pos51, ...) as UINTEGER,
+        mapq1/mapq2 as UTINYINT, other integer columns of pairtools as INTEGER.
     
     Returns
     ----------
@@ -99,15 +159,161 @@ def classify_column_types_by_name(column_names):
             column_types[col] = "STRAND_TYPE"
         elif col == "pair_type":
             column_types[col] = "ALIGNMENT_TYPE"
+        elif compact_schema and col.startswith("pos") and (col in pairsam_format.DTYPES_PAIRSAM or _extra_column_dtype(col) == int):
+            column_types[col] = "UINTEGER"
+        elif compact_schema and col.startswith("mapq") and _extra_column_dtype(col) == int:
+            column_types[col] = "UTINYINT"
         elif col in pairsam_format.DTYPES_PAIRSAM:
             column_types[col] = "INTEGER" if pairsam_format.DTYPES_PAIRSAM[col] == int else "STRING"
         elif col in pairsam_format.DTYPES_EXTRA_COLUMNS:
             column_types[col] = "INTEGER" if pairsam_format.DTYPES_EXTRA_COLUMNS[col] == int else "STRING"
+        elif compact_schema and _extra_column_dtype(col) == int:
+            column_types[col] = "INTEGER"
         else:
             column_types[col] = "STRING"
 
     return column_types
 
+# duckdb
+def cast_projection(column_types, readid="keep"):
+    """
+    Builds a SELECT list, which casts every column to its DuckDB type and keeps the column name.
+
+    Parameters
+    ----------
+    column_types (dict): column name as a key and DuckDB type as a value, see classify_column_types_by_name.
+        Columns with the type None are selected as they are.
+    readid (str): 'keep' the readID column, 'drop' it or 'hash' it into a UBIGINT.
+
+    Returns
+    ----------
+    str: e.g. "CAST(readID AS STRING) AS readID, CAST(chrom1 AS CHROM_TYPE) AS chrom1, ..."
+    """
+    if readid not in READID_MODES:
+        raise ValueError(f"Unsupported readID mode: {readid}. Choose from: {', '.join(READID_MODES)}")
+
+    projection = []
+    for col, typ in column_types.items():
+        if col == "readID" and readid == "drop":
+            continue
+        if col == "readID" and readid == "hash":
+            projection.append(f"hash({col}) AS {col}")
+        elif typ is None:
+            projection.append(col)
+        else:
+            projection.append(f"CAST({col} AS {typ}) AS {col}")
+    return ", ".join(projection)
+
+
+# duckdb
+def parquet_copy_options(
+    parquet_compression=None,
+    parquet_compression_level=None,
+    row_group_size=None,
+    parquet_dictionary=True,
+    parquet_dictionary_page_size=None,
+    **kwargs,
+):
+    """
+    Builds the Parquet writer options of a DuckDB COPY statement. None keeps the DuckDB default.
+    Extra keyword arguments are ignored, so the options of a CLI command can be passed as they are.
+
+    Parameters
+    ----------
+    parquet_compression (str): codec of the column chunks: zstd, snappy, lz4, gzip, brotli or none.
+    parquet_compression_level (int): compression level, zstd only.
+    row_group_size (int): number of rows per row group, i.e. the granularity of predicate pushdown.
+    parquet_dictionary (bool): dictionary-encode the columns. Defaults to True.
+    parquet_dictionary_page_size (int): maximum size of a string dictionary page in bytes.
+
+    Returns
+    ----------
+    str: e.g. ", COMPRESSION zstd, COMPRESSION_LEVEL 3, ROW_GROUP_SIZE 1000000", to append after FORMAT PARQUET
+    """
+    options = []
+    if parquet_compression is not None:
+        compression = parquet_compression.lower()
+        if compression not in PARQUET_COMPRESSIONS:
+            raise ValueError(f"Unsupported Parquet compression: {parquet_compression}. Choose from: {', '.join(PARQUET_COMPRESSIONS)}")
+        options.append(f"COMPRESSION {'uncompressed' if compression == 'none' else compression}")
+    if parquet_compression_level is not None:
+        if parquet_compression is None or parquet_compression.lower() != "zstd":
+            raise ValueError("Parquet compression level is supported for the zstd codec only")
+        options.append(f"COMPRESSION_LEVEL {int(parquet_compression_level)}")
+    if row_group_size is not None:
+        options.append(f"ROW_GROUP_SIZE {int(row_group_size)}")
+    if not parquet_dictionary:
+        # a dictionary of at most 0 entries -> plain encoding
+        options.append("DICTIONARY_SIZE_LIMIT 0")
+    if parquet_dictionary_page_size is not None:
+        options.append(f"STRING_DICTIONARY_PAGE_SIZE_LIMIT {int(parquet_dictionary_page_size)}")
+    return "".join(", " + option for option in options)
+
+
+def parquet_writer_options(
+    parquet_compression=None,
+    parquet_compression_level=None,
+    parquet_dictionary=True,
+    parquet_dictionary_page_size=None,
+    **kwargs,
+):
+    """
+    The Parquet writer options of parquet_copy_options as keyword arguments of pyarrow.parquet.ParquetWriter.
+    None keeps the DuckDB default, the options are checked by parquet_copy_options.
+
+    Returns
+    ----------
+    dict
+    """
+    parquet_copy_options(parquet_compression, parquet_compression_level, None, parquet_dictionary, parquet_dictionary_page_size)
+    options = {"compression": (parquet_compression or "snappy").lower(), "use_dictionary": parquet_dictionary}
+    if parquet_compression_level is not None:
+        options["compression_level"] = int(parquet_compression_level)
+    if parquet_dictionary_page_size is not None:
+        options["dictionary_pagesize_limit"] = int(parquet_dictionary_page_size)
+    return options
+
+
+def write_parquet_stream(reader, output_path, kv_metadata, on_table=None, row_group_size=None, **kwargs):
+    """
+    Writes the record batches of reader into a .parquet file with a pyarrow.parquet.ParquetWriter, in a single pass.
+    The kv metadata is attached when the writer closes, so it can hold aggregates of the rows, e.g. SummaryStats.
+
+    Parameters
+    ----------
+    reader (pyarrow.RecordBatchReader): the rows, e.g. from con.execute(query).fetch_record_batch().
+    output_path (str): path to the .parquet file.
+    kv_metadata (callable): returns the kv metadata (dict of str) once all the rows are written.
+    on_table (callable): called with every batch, as a pyarrow.Table, before it is written.
+    row_group_size (int): number of rows per row group, the DuckDB default if not provided. The batches are
+        buffered up to it, so that the row groups do not follow the batches of the reader.
+    kwargs: the Parquet writer options, see parquet_writer_options.
+    """
+    row_group_size = int(row_group_size or DUCKDB_ROW_GROUP_SIZE)
+    # no ARROW:schema in the kv metadata: the columns are read back as DuckDB writes them
+    writer = pq.ParquetWriter(output_path, reader.schema, store_schema=False, **parquet_writer_options(**kwargs))
+    pending, pending_rows = [], 0
+    try:
+        for batch in reader:
+            table = pa.Table.from_batches([batch])
+            if on_table is not None:
+                on_table(table)
+            pending.append(table)
+            pending_rows += table.num_rows
+            if pending_rows >= row_group_size:
+                buffered = pa.concat_tables(pending)
+                full_rows = pending_rows - pending_rows % row_group_size
+                writer.write_table(buffered.slice(0, full_rows), row_group_size=row_group_size)
+                pending, pending_rows = [buffered.slice(full_rows)], pending_rows - full_rows
+        if pending_rows:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+        writer.add_key_value_metadata(kv_metadata())
+    except BaseException:
+        writer.close()
+        os.remove(output_path)
+        raise
+    writer.close()
+
 
 # duckdb
 def extract_duckdb_metadata(parquet_file, con=None):
@@ -168,29 +374,145 @@ def header_to_kv_metadata(header):
 
 
 def duckdb_kv_metadata_to_header(parquet_input_path, con=None):
-    metadata = extract_duckdb_metadata(parquet_input_path, con)
+    # the header of a partitioned dataset is in _header.parquet, or in any of its data files
+    metadata = extract_duckdb_metadata(parquet_dataset.header_path(parquet_input_path), con)
     metadata_dict = decode_parquet_metadata_duckdb_as_dict(metadata)
     header = header_metadata.metadata_dict_to_header_list(metadata_dict) 
     return header
 
 
-def parquet_file_iterator(parquet_file_path):
+class SummaryStats:
+    """
+    Cheap aggregates of pairs, accumulated over the pyarrow.Tables of pairs as they are written, see update,
+    or over the groups of a GROUP BY, see add: row counts per chrom pair, the pair type histogram,
+    cis and trans counts of mapped pairs and the position range of every chrom.
+
+    Parameters
+    ----------
+    column_names (list): columns of the pairs, from the header.
+    unmapped_chrom (str): chrom of unmapped sides.
+    """
+
+    def __init__(self, column_names, unmapped_chrom="!"):
+        self.has_chroms = {"chrom1", "chrom2"} <= set(column_names)
+        self.has_positions = {"pos1", "pos2"} <= set(column_names)
+        self.has_pair_types = "pair_type" in column_names
+        self.unmapped_chrom = unmapped_chrom
+        self.stats = {"total": 0, "cis": 0, "trans": 0, "pair_types": {}, "chrom_pairs": {}, "positions": {}}
+
+    def update(self, table):
+        """Adds the pairs of a pyarrow.Table."""
+        if not self.has_chroms:
+            self.stats["total"] += table.num_rows
+            return
+        keys = ["chrom1", "chrom2"] + (["pair_type"] if self.has_pair_types else [])
+        aggregates = [(column, function) for column in ("pos1", "pos2") for function in ("min", "max")] if self.has_positions else []
+        groups = decode_dictionaries(table.select(keys + ["pos1", "pos2"] if self.has_positions else keys)).group_by(keys)
+        for group in groups.aggregate(aggregates + [([], "count_all")]).to_pylist():
+            self.add([(
+                group["chrom1"], group["chrom2"], group.get("pair_type"), group["count_all"],
+                group.get("pos1_min"), group.get("pos1_max"), group.get("pos2_min"), group.get("pos2_max"),
+            )])
+
+    def add(self, rows):
+        """Adds groups of pairs: (chrom1, chrom2, pair_type, count, min(pos1), max(pos1), min(pos2), max(pos2))."""
+        stats = self.stats
+        ranges = stats["positions"]
+        for chrom1, chrom2, pair_type, count, min1, max1, min2, max2 in rows:
+            stats["total"] += count
+            if pair_type is not None:
+                stats["pair_types"][pair_type] = stats["pair_types"].get(pair_type, 0) + count
+            chrom_pairs = stats["chrom_pairs"].setdefault(chrom1, {})
+            chrom_pairs[chrom2] = chrom_pairs.get(chrom2, 0) + count
+            if self.unmapped_chrom not in (chrom1, chrom2):
+                stats["cis" if chrom1 == chrom2 else "trans"] += count
+            for chrom, low, high in ((chrom1, min1, max1), (chrom2, min2, max2)):
+                if chrom != self.unmapped_chrom and low is not None:
+                    old_low, old_high = ranges.get(chrom, (low, high))
+                    ranges[chrom] = [min(low, old_low), max(high, old_high)]
+
+    def result(self):
+        """
+        Returns
+        ----------
+        dict: total, cis, trans, pair_types (pair type -> count), chrom_pairs (chrom1 -> chrom2 -> count)
+            and positions (chrom -> [min, max]). Missing columns leave out their statistics.
+        """
+        if not self.has_chroms:
+            return {"total": self.stats["total"]}
+        stats = dict(self.stats)
+        if not self.has_positions:
+            del stats["positions"]
+        if not self.has_pair_types:
+            del stats["pair_types"]
+        return stats
+
+
+def summary_stats(parquet_path, column_names, con=None, unmapped_chrom="!"):
+    """
+    SummaryStats of a .parquet file of pairs from one GROUP BY over its chrom, position and pair type columns.
+
+    Parameters
+    ----------
+    parquet_path (str): path to the .parquet file or the partitioned dataset.
+    column_names (list): columns of the file, from its header.
+    con (duckdb.DuckDBPyConnection): Configured DuckDB connection, the duckdb module if not provided.
+    unmapped_chrom (str): chrom of unmapped sides.
+
+    Returns
+    ----------
+    dict: see SummaryStats.result
+    """
+    if con is None:
+        con = duckdb
+    source = parquet_dataset.parquet_source(parquet_path)
+    stats = SummaryStats(column_names, unmapped_chrom)
+    if not stats.has_chroms:
+        stats.stats["total"] = con.execute(f"SELECT count(*) FROM {source}").fetchone()[0]
+        return stats.result()
+
+    positions = "min(pos1), max(pos1), min(pos2), max(pos2)" if stats.has_positions else "NULL, NULL, NULL, NULL"
+    pair_types = "CAST(pair_type AS VARCHAR)" if stats.has_pair_types else "NULL"
+    stats.add(con.execute(f"""
+        SELECT CAST(chrom1 AS VARCHAR), CAST(chrom2 AS VARCHAR), {pair_types}, count(*), {positions}
+        FROM {source}
+        GROUP BY ALL
+    """).fetchall())
+    return stats.result()
+
+
+def read_summary_stats(parquet_path):
+    """
+    Reads the summary statistics from the footer of a .parquet file (or of _header.parquet of a dataset), without scanning the rows.
+
+    Returns
+    ----------
+    dict: see SummaryStats.result, None if the file was written without them
+    """
+    value = parquet_dataset.read_kv_metadata(parquet_dataset.header_path(parquet_path)).get(SUMMARY_STATS_KEY.encode())
+    return json.loads(value) if value is not None else None
+
+
+def parquet_file_iterator(parquet_file_path, row_groups=None):
     """
     Yields pyarrow.Tables from a parquet file row group by row group
 
     Parameters:
     ----------
     parquet_file_path (str): The path to the Parquet file to be read.
+    row_groups (Iterable[int]): indices of the row groups to read, all row groups if None.
     
     Returns
     ----------
     Iterator[pyarrow.Table]: An iterator that yields one pyarrow.Table per row group from the Parquet file.
     """
     parquet_file = pq.ParquetFile(parquet_file_path)
-    for i in range(parquet_file.num_row_groups):
+    if row_groups is None:
+        row_groups = range(parquet_file.num_row_groups)
+    for i in row_groups:
         yield parquet_file.read_row_group(i)
 
-def duckdb_query_iterator(con, query):
+def duckdb_query_iterator(con, query, batch_size=DEFAULT_BATCH_SIZE):
     """
     Yields pyarrow.Tables from a duckdb query in batches
 
@@ -198,22 +520,41 @@ def duckdb_query_iterator(con, query):
     ----------
     con (duckdb.DuckDBPyConnection): An active DuckDB connection object used to execute the query.
     query (str): The SQL query string to execute.
+    batch_size (int): number of rows per batch.
 
     Returns
     ----------
     Iterator[pyarrow.Table]: An iterator that yields query results as pyarrow.Table objects, one per batch.
     """
-    for batch in con.execute(query).fetch_record_batch():
+    for batch in con.execute(query).fetch_record_batch(batch_size):
         yield pa.Table.from_batches([batch])
 
-def write_parquet_to_csv(parquet_iterator, sink):
+def decode_dictionaries(table):
+    """Casts the dictionary columns of a pyarrow.Table (ENUMs fetched from DuckDB) to their value types."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+def _encode_csv(batch, write_options):
+    """Formats a pyarrow.Table as tab-separated text in memory."""
+    buffer = pa.BufferOutputStream()
+    csv.write_csv(batch, buffer, write_options=write_options)
+    return buffer.getvalue()
+
+def write_parquet_to_csv(parquet_iterator, sink, queue_depth=DEFAULT_QUEUE_DEPTH):
     """
     Writes data from a Parquet iterator to a CSV file (or other writable sink) in batches.
 
+    With queue_depth > 0 the export is pipelined: a reader thread pulls batches from the iterator
+    (i.e. runs the DuckDB query), up to queue_depth batches are formatted as text by a thread pool,
+    and the calling thread writes them to the sink (and its compressor) in the input order.
+
     Parameters:
     ----------
     parquet_iterator (Iterator[pyarrow.Table]): iterator that yields pyarrow.Table objects, (from a Parquet file or query result)
     sink (str or pyarrow.NativeFile): destination to write the CSV data to
+    queue_depth (int): number of batches in flight between the stages, 0 to run the stages in series
 
     Returns
     ----------
@@ -225,11 +566,54 @@ def write_parquet_to_csv(parquet_iterator, sink):
     delimiter="\t",     
     quoting_style="none" 
 )
-    for batch in parquet_iterator:
-        csv.write_csv(batch, sink, write_options=write_options)
+    if queue_depth <= 0:
+        for batch in parquet_iterator:
+            csv.write_csv(batch, sink, write_options=write_options)
+        return
+
+    # futures of encoded batches in the input order, None marks the end of the input
+    encoded = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    def put(item):
+        # gives up when the writer has failed and stopped consuming
+        while not stop.is_set():
+            try:
+                encoded.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    with ThreadPoolExecutor(queue_depth) as pool:
+
+        def read():
+            try:
+                for batch in parquet_iterator:
+                    if stop.is_set():
+                        return
+                    put(pool.submit(_encode_csv, batch, write_options))
+            except BaseException as error:
+                put(error)
+            put(None)
+
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = encoded.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                buffer = item.result()
+                if buffer.size:
+                    sink.write(buffer)
+        finally:
+            stop.set()
+            reader.join()
 
 def sort_query(columns_to_sort):
-    query=f""" ORDER BY """ +", ".join(columns_to_sort)
+    query=""" ORDER BY """ +", ".join(columns_to_sort)
     return query
 
 
@@ -1,3 +1,10 @@
+import re
+
+
+# orders of the chromosomes in the CHROM_TYPE ENUM, i.e. in sorted outputs
+CHROM_ORDERS = ("lexicographic", "header", "natural", "file")
+
+
 def extract_field_names(header):
     """
     Extract unique header types from a list of strings that start with '#' or '##'.
@@ -37,6 +44,71 @@ def extract_sorted_chromosome_field(chromsizes):
     return tuple(sorted(chromsizes.keys()))
 
 
+def natural_chromosome_key(chrom):
+    """
+    Sort key of a chromosome name, which compares numbers by value: chr2 < chr10 < chrX.
+    """
+    return [(0, int(token)) if token.isdigit() else (1, token) for token in re.split(r"(\d+)", chrom) if token]
+
+
+def read_chromosome_file(chroms_path):
+    """
+    Chromosome names from the first column of a .chrom.sizes file, in the order of the file.
+    """
+    with open(chroms_path) as f:
+        return [line.split()[0] for line in f if line.strip() and not line.startswith("#")]
+
+
+def extract_ordered_chromosome_field(chromsizes, chrom_order="lexicographic", chroms_path=None):
+    """
+    Extract chromosomes from chromsizes dict in the requested order and return as a tuple
+
+    Parameters
+    -------
+    chromsizes (dict): dictionary in the form {chr1: 195471971, ...}, in the order of the #chromsize lines
+    chrom_order (str): lexicographic; header: order of the #chromsize lines; natural: chr2 before chr10;
+        file: order of chroms_path, followed by the other chromosomes in lexicographic order
+    chroms_path (str): .chrom.sizes file, for chrom_order 'file'
+
+    Returns:
+    -------
+    tuple of chromosomes: ('chr1', 'chr2', 'chr3'...)
+    """
+    if chrom_order == "lexicographic":
+        return extract_sorted_chromosome_field(chromsizes)
+    if chrom_order == "header":
+        return tuple(chromsizes.keys())
+    if chrom_order == "natural":
+        return tuple(sorted(chromsizes.keys(), key=natural_chromosome_key))
+    if chrom_order == "file":
+        if chroms_path is None:
+            raise ValueError("chrom_order 'file' needs a .chrom.sizes file")
+        in_file = [chrom for chrom in dict.fromkeys(read_chromosome_file(chroms_path)) if chrom in chromsizes]
+        return tuple(in_file) + tuple(sorted(set(chromsizes.keys()) - set(in_file)))
+    raise ValueError(f"Invalid chromosome order: {chrom_order}. Expected one of {', '.join(CHROM_ORDERS)}")
+
+
+def set_chromsize_order(header, chroms):
+    """
+    Puts the #chromsize lines of a header in the order of chroms, in place of the first one.
+
+    Parameters
+    -------
+    header (list): the header lines
+    chroms (tuple): chromosomes, all of them have a #chromsize line
+
+    Returns:
+    -------
+    header (list)
+    """
+    lines = {line.split()[1]: line for line in header if line.startswith("#chromsize:")}
+    if not lines:
+        return header
+    position = next(i for i, line in enumerate(header) if line.startswith("#chromsize:"))
+    rest = [line for line in header if not line.startswith("#chromsize:")]
+    return rest[:position] + [lines[chrom] for chrom in chroms if chrom in lines] + rest[position:]
+
+
 def metadata_dict_to_header_list(metadata_dict):
     """
     Converts a decoded Parquet metadata dictionary into a list of formatted header lines.
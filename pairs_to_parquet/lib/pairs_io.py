@@ -0,0 +1,288 @@
+import io
+import os
+import shutil
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.csv as csv
+
+from pairtools.lib import fileio, headerops
+
+from . import bgzf
+
+
+# Block size of the Arrow CSV reader and of the decompressed read buffer.
+# Large blocks keep the per-call Python overhead negligible on multi-GB files.
+DEFAULT_BLOCK_SIZE = 4 << 20
+
+# DuckDB types produced by duckdb_utils.classify_column_types_by_name -> Arrow types used while parsing.
+# ENUM columns (CHROM_TYPE, STRAND_TYPE, ALIGNMENT_TYPE) are parsed as strings and cast by DuckDB.
+ARROW_TYPES = {
+    "INTEGER": pa.int32(),
+    "BIGINT": pa.int64(),
+    "UINTEGER": pa.uint32(),
+    "UTINYINT": pa.uint8(),
+}
+
+# Compressed bytes of BGZF blocks inflated and parsed by one worker of the BGZF reader.
+DEFAULT_BGZF_CHUNK_SIZE = 4 << 20
+
+
+def _csv_options(column_names, column_types, block_size=DEFAULT_BLOCK_SIZE, use_threads=True):
+    """Arrow CSV options and the resulting schema for the body of a .pairs file."""
+    read_options = csv.ReadOptions(column_names=column_names, block_size=block_size, use_threads=use_threads)
+    # hard-coded tab separator to follow the DCIC pairs standard, no quoting in pairs/pairsam
+    parse_options = csv.ParseOptions(delimiter="\t", quote_char=False)
+    arrow_types = {col: ARROW_TYPES.get(column_types.get(col), pa.string()) for col in column_names}
+    convert_options = csv.ConvertOptions(column_types=arrow_types)
+    schema = pa.schema([(col, arrow_types[col]) for col in column_names])
+    return read_options, parse_options, convert_options, schema
+
+
+def open_pairs_stream(input_path, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Opens a .pairs/.pairs.gz file with a single in-process decompressor and splits off the header.
+
+    Parameters
+    ----------
+    input_path (str): path to the .pairs or .pairs.gz file.
+    block_size (int): size of the read buffer in bytes.
+
+    Returns
+    ----------
+    header (list): the header lines.
+    body_stream (io.BufferedReader): binary stream positioned at the first line of the body.
+    """
+    raw_stream = pa.input_stream(input_path, compression="detect")
+    body_stream = io.BufferedReader(raw_stream, buffer_size=block_size)
+    header, body_stream = headerops.get_header(body_stream)
+    return header, body_stream
+
+
+def choose_decompressor(nproc=1, command=None):
+    """
+    Pick a decompressing command for the pipe reader based on user request and availability.
+    The command must read the compressed input from stdin and print the output into stdout.
+
+    Parameters
+    ----------
+    nproc (int): number of threads of the decompressor.
+    command (str): user-provided command (--cmd-in), fully overrides the auto-guessed one.
+
+    Returns
+    ----------
+    str: the command, e.g. "pigz -dc -p 8"
+    """
+    if command:
+        return command
+    # bgzip decompresses BGZF blocks in parallel, pigz offloads reading/checksums to extra threads
+    if shutil.which("bgzip"):
+        return f"bgzip -dc -@ {nproc}"
+    if shutil.which("pigz"):
+        return f"pigz -dc -p {nproc}"
+    if shutil.which("gzip"):
+        warnings.warn("bgzip and pigz not found. Falling back to single-threaded gzip.")
+        return "gzip -dc"
+    raise ValueError("bgzip, pigz and gzip are not found, cannot decompress input")
+
+
+def open_pairs_pipe(input_path, nproc=1, command=None):
+    """
+    Opens a .pairs.gz file through an external (multi-threaded) decompressor and splits off the header.
+    Decompression runs in a separate process, in parallel with parsing in DuckDB/Arrow.
+
+    Parameters
+    ----------
+    input_path (str): path to the compressed .pairs file.
+    nproc (int): number of threads of the decompressor (--nproc-in).
+    command (str): user-provided decompressing command (--cmd-in).
+
+    Returns
+    ----------
+    header (list): the header lines.
+    instream (fileio.PipedIO): stream positioned at the first line of the body, its .buffer is binary.
+        close() returns the exit code of the decompressor.
+    """
+    command = choose_decompressor(nproc, command)
+    with open(input_path, "rb") as compressed:
+        instream = fileio.PipedIO(compressed, command, mode="r")
+    header, instream = headerops.get_header(instream)
+
+    # an empty stream is most likely a failed command, report it rather than a missing header
+    if not header and not instream.buffer.peek(1):
+        retcode = instream.close()
+        if retcode:
+            raise RuntimeError(f"Decompressing command '{command}' failed with exit code {retcode}")
+
+    return header, instream
+
+
+def open_pairs_body_reader(body_stream, column_names, column_types, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Wraps the body of a .pairs stream into a streaming Arrow CSV reader, which DuckDB can scan directly.
+
+    Parameters
+    ----------
+    body_stream (io.BufferedReader): binary stream positioned at the first line of the body.
+    column_names (list): column names from the header.
+    column_types (dict): DuckDB types by column name, see duckdb_utils.classify_column_types_by_name.
+    block_size (int): number of bytes parsed into one record batch.
+
+    Returns
+    ----------
+    pyarrow.RecordBatchReader: yields record batches of the body in input order.
+    """
+    read_options, parse_options, convert_options, schema = _csv_options(column_names, column_types, block_size)
+
+    # Arrow refuses to open an empty CSV, but a header-only .pairs file is valid
+    if not body_stream.peek(1):
+        return pa.RecordBatchReader.from_batches(schema, [])
+
+    return csv.open_csv(
+        body_stream,
+        read_options=read_options,
+        parse_options=parse_options,
+        convert_options=convert_options,
+    )
+
+
+class BgzfBody:
+    """
+    Body of a BGZF .pairs file, as returned by open_pairs_bgzf: the decompressed bytes that follow
+    the header in the leading blocks and the compressed block ranges after them.
+    """
+
+    def __init__(self, path, leftover, ranges, nproc):
+        self.path = path
+        self.leftover = leftover
+        self.ranges = ranges
+        self.nproc = nproc
+
+    def close(self):
+        self.leftover = b""
+        self.ranges = []
+
+
+def _split_header(data, at_eof):
+    """
+    Splits the leading '#' lines off the decompressed data.
+    Returns (header, body_offset), or None if more data is needed to find the end of the header.
+    """
+    header = []
+    pos = 0
+    while pos < len(data):
+        if data[pos:pos + 1] != headerops.COMMENT_CHAR.encode():
+            return header, pos
+        end = data.find(b"\n", pos)
+        if end < 0:
+            if not at_eof:
+                return None
+            end = len(data)
+        header.append(data[pos:end].decode())
+        pos = end + 1
+    return (header, len(data)) if at_eof else None
+
+
+def open_pairs_bgzf(input_path, nproc=1, chunk_size=DEFAULT_BGZF_CHUNK_SIZE):
+    """
+    Opens a BGZF .pairs.gz file for the parallel block reader and splits off the header.
+    Block offsets come from the .gzi index next to the file if present, otherwise from the block headers.
+
+    Parameters
+    ----------
+    input_path (str): path to the BGZF-compressed .pairs file.
+    nproc (int): number of threads inflating and parsing block ranges (--nproc-in).
+    chunk_size (int): target compressed size of a block range handled by one thread.
+
+    Returns
+    ----------
+    header (list): the header lines.
+    body (BgzfBody): the rest of the file, see open_bgzf_body_reader.
+    """
+    ranges = bgzf.split_block_ranges(bgzf.block_offsets(input_path), os.path.getsize(input_path), chunk_size)
+
+    # the header usually fits into the first range, but samheaders of big assemblies may be longer
+    data = b""
+    n_read = 0
+    while True:
+        split = _split_header(data, at_eof=n_read == len(ranges))
+        if split is not None:
+            break
+        data += bgzf.read_block_range(input_path, *ranges[n_read])
+        n_read += 1
+
+    header, body_offset = split
+    return header, BgzfBody(input_path, data[body_offset:], ranges[n_read:], nproc)
+
+
+def open_bgzf_body_reader(body, column_names, column_types):
+    """
+    Streams the body of a BGZF .pairs file as Arrow record batches, inflating and parsing block ranges in parallel.
+    Lines cut by range boundaries are stitched back together, record batches come out in input order.
+
+    Parameters
+    ----------
+    body (BgzfBody): the body, as returned by open_pairs_bgzf.
+    column_names (list): column names from the header.
+    column_types (dict): DuckDB types by column name, see duckdb_utils.classify_column_types_by_name.
+
+    Returns
+    ----------
+    pyarrow.RecordBatchReader: yields record batches of the body in input order.
+    """
+    # ranges are parsed concurrently, each of them on a single thread
+    read_options, parse_options, convert_options, schema = _csv_options(column_names, column_types, use_threads=False)
+
+    def parse(data):
+        if not data:
+            return schema.empty_table()
+        return csv.read_csv(
+            pa.BufferReader(pa.py_buffer(data)),
+            read_options=read_options,
+            parse_options=parse_options,
+            convert_options=convert_options,
+        )
+
+    def inflate_and_parse(start, end):
+        # complete lines in the middle are parsed here, the cut lines at both ends are returned as bytes
+        data = bgzf.read_block_range(body.path, start, end)
+        first = data.find(b"\n")
+        if first < 0:
+            return data, None, b""
+        last = data.rfind(b"\n")
+        view = memoryview(data)
+        return view[:first + 1].tobytes(), parse(view[first + 1:last + 1]), view[last + 1:].tobytes()
+
+    def batches():
+        last = body.leftover.rfind(b"\n")
+        yield from parse(body.leftover[:last + 1]).to_batches()
+        carry = body.leftover[last + 1:]
+
+        with ThreadPoolExecutor(max(body.nproc, 1)) as pool:
+            pending = deque()
+            ranges = iter(body.ranges)
+            while True:
+                # keep a bounded number of ranges in flight, results are consumed in submission order
+                while len(pending) < 2 * max(body.nproc, 1):
+                    block_range = next(ranges, None)
+                    if block_range is None:
+                        break
+                    pending.append(pool.submit(inflate_and_parse, *block_range))
+                if not pending:
+                    break
+
+                head, table, tail = pending.popleft().result()
+                if table is None:
+                    # a line longer than the whole range
+                    carry += head
+                    continue
+                yield from parse(carry + head).to_batches()
+                yield from table.to_batches()
+                carry = tail
+
+        # last line without the trailing newline
+        yield from parse(carry).to_batches()
+
+    return pa.RecordBatchReader.from_batches(schema, batches())
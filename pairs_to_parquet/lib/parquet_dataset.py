@@ -0,0 +1,193 @@
+"""
+Hive-partitioned Parquet datasets of pairs: a directory with one partition per chrom pair,
+chrom1=chr1/chrom2=chr3/data_0.parquet, written by DuckDB COPY ... PARTITION_BY (chrom1, chrom2).
+
+Every data file carries the header in its kv metadata. The header is also kept centrally in _header.parquet,
+a file without rows with the schema of the pairs, together with the order of the data files and the
+summary statistics of the whole dataset. Files starting with _ or . are not data files.
+"""
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from urllib.parse import unquote
+
+import pyarrow.parquet as pq
+
+
+PARTITION_COLUMNS = ("chrom1", "chrom2")
+HEADER_FILE = "_header.parquet"
+# kv metadata key of _header.parquet: the data files relative to the dataset, in the order of the chroms of the writer
+FILES_KEY = "dataset_files"
+
+
+def is_dataset(path):
+    """
+    Checks whether the path is a partitioned dataset: a directory with _header.parquet
+    or, if written by another tool, with partition subdirectories like chrom1=chr1.
+    """
+    if not os.path.isdir(path):
+        return False
+    if os.path.exists(os.path.join(path, HEADER_FILE)):
+        return True
+    return any(
+        "=" in name and not name.startswith(("_", ".")) and os.path.isdir(os.path.join(path, name))
+        for name in os.listdir(path)
+    )
+
+
+def is_parquet(path):
+    """Checks whether the path is a .parquet file or a partitioned dataset."""
+    return path.endswith("parquet") or is_dataset(path)
+
+
+def check_dataset_output(path):
+    """Raises ValueError, if the path exists and is neither a partitioned dataset, which is replaced, nor an empty directory."""
+    if not os.path.exists(path) or is_dataset(path):
+        return
+    if not os.path.isdir(path) or os.listdir(path):
+        raise ValueError(f"{path} exists and is not a partitioned dataset of pairs, refusing to replace it")
+
+
+@contextmanager
+def dataset_writer(path):
+    """
+    Yields a temporary directory next to path to write a dataset into. When the block finishes, the directory
+    replaces path, a previous dataset is removed only then. If the block raises, path is left untouched.
+    """
+    check_dataset_output(path)
+    path = os.path.abspath(path)
+    name = os.path.basename(path)
+    temp_path = tempfile.mkdtemp(prefix=f".{name}.", dir=os.path.dirname(path))
+    try:
+        yield temp_path
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+    previous = None
+    if os.path.exists(path):
+        previous = tempfile.mkdtemp(prefix=f".{name}.old.", dir=os.path.dirname(temp_path))
+        os.replace(path, os.path.join(previous, name))
+    os.replace(temp_path, path)
+    if previous is not None:
+        shutil.rmtree(previous)
+
+
+def header_path(path):
+    """The file holding the header of a .parquet file or a dataset: _header.parquet, or its first data file."""
+    if not is_dataset(path):
+        return path
+    if os.path.exists(os.path.join(path, HEADER_FILE)):
+        return os.path.join(path, HEADER_FILE)
+    files = dataset_files(path)
+    if not files:
+        raise ValueError(f"{path} is neither a .parquet file nor a partitioned dataset of pairs")
+    return files[0]
+
+
+def partition_values(relative_path):
+    """Partition values of a data file, e.g. {"chrom1": "chr1", "chrom2": "chr3"} for chrom1=chr1/chrom2=chr3/data_0.parquet."""
+    values = {}
+    for part in relative_path.split(os.sep)[:-1]:
+        key, separator, value = part.partition("=")
+        if separator:
+            # DuckDB percent-encodes the values, e.g. ! as %21
+            values[key] = unquote(value)
+    return values
+
+
+def _walk_files(path):
+    files = []
+    for directory, directories, names in os.walk(path):
+        directories[:] = [name for name in directories if not name.startswith(("_", "."))]
+        files.extend(
+            os.path.relpath(os.path.join(directory, name), path)
+            for name in names if name.endswith(".parquet") and not name.startswith(("_", "."))
+        )
+    return files
+
+
+def dataset_files(path, chroms=None):
+    """
+    Data files of a dataset in the order of the chrom pairs: as listed in _header.parquet,
+    otherwise by the position of the chroms in chroms and, for the chroms not in chroms, lexicographically.
+
+    Parameters
+    ----------
+    path (str): path to the dataset
+    chroms (list): order of the chroms, if _header.parquet lists no files
+
+    Returns
+    ----------
+    list: paths to the data files
+    """
+    files = _walk_files(path)
+    listed = _listed_files(path)
+    if listed is not None and set(listed) == set(files):
+        return [os.path.join(path, name) for name in listed]
+
+    ranks = {chrom: i for i, chrom in enumerate(chroms or [])}
+
+    def order(name):
+        values = partition_values(name)
+        chrom_ranks = tuple(
+            (0, ranks[values[column]], "") if values.get(column) in ranks else (1, 0, values.get(column, ""))
+            for column in PARTITION_COLUMNS
+        )
+        return chrom_ranks, name
+
+    return [os.path.join(path, name) for name in sorted(files, key=order)]
+
+
+def _listed_files(path):
+    header_file = os.path.join(path, HEADER_FILE)
+    if not os.path.exists(header_file):
+        return None
+    value = read_kv_metadata(header_file).get(FILES_KEY.encode())
+    return json.loads(value) if value is not None else None
+
+
+def read_kv_metadata(parquet_path):
+    """The kv metadata of a .parquet file, a dict of bytes, from its footer only."""
+    return pq.read_metadata(parquet_path).metadata or {}
+
+
+def write_header_file(path, schema, kv_metadata, files):
+    """
+    Writes _header.parquet of a dataset once its data files are written.
+
+    Parameters
+    ----------
+    path (str): path to the dataset
+    schema (pyarrow.Schema): schema of the pairs
+    kv_metadata (dict): the header and the other kv metadata, e.g. the summary statistics
+    files (list): paths to the data files, in the order in which they are read
+    """
+    names = [os.path.relpath(name, path) for name in files]
+    with pq.ParquetWriter(os.path.join(path, HEADER_FILE), schema, store_schema=False) as writer:
+        writer.add_key_value_metadata({**kv_metadata, FILES_KEY: json.dumps(names)})
+
+
+def parquet_source(path, chroms=None):
+    """
+    DuckDB table function reading a .parquet file or the data files of a dataset in their order, see dataset_files.
+    The partition columns are read from the files, not from the paths, so that they keep their types.
+
+    Parameters
+    ----------
+    path (str): path to the .parquet file or the dataset
+    chroms (list): order of the chroms, see dataset_files
+
+    Returns
+    ----------
+    str
+    """
+    if not is_dataset(path):
+        return f"read_parquet('{path}')"
+    files = dataset_files(path, chroms)
+    if not files:
+        # an empty dataset: no rows, but the schema
+        return f"read_parquet('{header_path(path)}')"
+    return "read_parquet([{}], hive_partitioning=false)".format(", ".join(f"'{name}'" for name in files))
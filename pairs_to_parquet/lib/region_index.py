@@ -0,0 +1,276 @@
+import hashlib
+import os
+import re
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .._logging import get_logger
+from . import parquet_dataset
+
+logger = get_logger()
+
+
+# the index of pairs.parquet is pairs.parquet.rgi, a small Parquet file
+REGION_INDEX_SUFFIX = ".rgi"
+# kv metadata of the index: size and footer digest of the indexed file, to detect stale indexes
+INDEXED_SIZE_KEY = b"indexed_file_size"
+INDEXED_FOOTER_KEY = b"indexed_file_footer_sha1"
+POSITION_UNITS = {"": 1, "k": 1_000, "m": 1_000_000, "g": 1_000_000_000}
+
+
+def region_index_path(parquet_path):
+    """Path to the region index of a .parquet file."""
+    return parquet_path + REGION_INDEX_SUFFIX
+
+
+def parse_position(position):
+    """Parses 1500, 1,500, 1.5k, 2M or 1G into an integer position."""
+    match = re.fullmatch(r"([0-9][0-9,]*(?:\.[0-9]+)?)([kKmMgG]?)(?:bp|b)?", position.strip())
+    if match is None:
+        raise ValueError(f"Invalid position: {position}")
+    return int(round(float(match.group(1).replace(",", "")) * POSITION_UNITS[match.group(2).lower()]))
+
+
+def parse_region(region, chroms=None):
+    """
+    Parses a region: chr1, chr1:1000000 (a single position), chr1:1000000-2000000, chr1:1M-2M
+    or chr1:1.5M- (to the end of the chromosome). Positions are 1-based and inclusive, as in pairix and tabix.
+    A region, which is one of chroms, is the whole chromosome, even if its name contains a colon.
+
+    Parameters
+    ----------
+    region (str): the region
+    chroms (list): chromosomes of the file, any if None
+
+    Returns
+    ----------
+    tuple: (chrom, start, end), start and end are None for open ends
+    """
+    if chroms is not None and region in chroms:
+        return region, None, None
+    chrom, separator, positions = region.rpartition(":")
+    if not separator:
+        chrom, start, end = region, None, None
+    elif "-" in positions:
+        start, _, end = positions.partition("-")
+        start, end = parse_position(start) if start else None, parse_position(end) if end else None
+    else:
+        start = end = parse_position(positions)
+    if chroms is not None and chrom not in chroms:
+        raise ValueError(f"Unknown chromosome in the region {region}: {chrom}")
+    return chrom, start, end
+
+
+def footer_digest(parquet_path):
+    """SHA-1 of the footer of a .parquet file, its row group offsets and statistics change with any rewrite."""
+    with open(parquet_path, "rb") as f:
+        f.seek(-8, os.SEEK_END)
+        footer_length, magic = struct.unpack("<I4s", f.read(8))
+        if magic != b"PAR1":
+            raise ValueError(f"{parquet_path} is not a Parquet file")
+        f.seek(-8 - footer_length, os.SEEK_END)
+        return hashlib.sha1(f.read(footer_length)).hexdigest()
+
+
+def build_region_index(parquet_path, c1="chrom1", c2="chrom2", p1="pos1", p2="pos2"):
+    """
+    Writes the region index of a .parquet file of pairs: one row per row group and chrom pair with the
+    ranges of the positions and of the rows, like pairix for .pairs.gz. Only the chrom and position columns are read.
+    In sorted files the rows of a chrom pair in a row group are contiguous, row_start and row_end then delimit them.
+
+    Parameters
+    ----------
+    parquet_path (str): path to the .parquet file
+    c1, c2, p1, p2 (str): names of the chrom and position columns
+
+    Returns
+    ----------
+    str: path to the index
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    blocks = []
+    row_group_start = 0
+    for row_group in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(row_group, columns=[c1, c2, p1, p2])
+        n_rows = table.num_rows
+        table = table.append_column("row", pa.array(np.arange(row_group_start, row_group_start + n_rows)))
+        grouped = table.group_by([c1, c2], use_threads=False).aggregate([
+            (p1, "min"), (p1, "max"), (p2, "min"), (p2, "max"), ("row", "min"), ("row", "max"), ("row", "count"),
+        ])
+        blocks.append(pa.table({
+            "row_group": pa.array(np.full(grouped.num_rows, row_group), pa.int32()),
+            "chrom1": pc.cast(grouped.column(c1), pa.string()),
+            "chrom2": pc.cast(grouped.column(c2), pa.string()),
+            "pos1_min": pc.cast(grouped.column(f"{p1}_min"), pa.int64()),
+            "pos1_max": pc.cast(grouped.column(f"{p1}_max"), pa.int64()),
+            "pos2_min": pc.cast(grouped.column(f"{p2}_min"), pa.int64()),
+            "pos2_max": pc.cast(grouped.column(f"{p2}_max"), pa.int64()),
+            "row_start": grouped.column("row_min"),
+            "row_end": pc.add(grouped.column("row_max"), 1),
+            "n_rows": grouped.column("row_count"),
+        }))
+        row_group_start += n_rows
+
+    index = pa.concat_tables(blocks) if blocks else pa.table({
+        "row_group": pa.array([], pa.int32()),
+        **{name: pa.array([], pa.string()) for name in ("chrom1", "chrom2")},
+        **{name: pa.array([], pa.int64()) for name in ("pos1_min", "pos1_max", "pos2_min", "pos2_max", "row_start", "row_end", "n_rows")},
+    })
+    index = index.replace_schema_metadata({
+        INDEXED_SIZE_KEY: str(os.path.getsize(parquet_path)).encode(),
+        INDEXED_FOOTER_KEY: footer_digest(parquet_path).encode(),
+    })
+    index_path = region_index_path(parquet_path)
+    pq.write_table(index, index_path, compression="zstd")
+    return index_path
+
+
+def read_region_index(parquet_path):
+    """
+    Reads the region index of a .parquet file.
+
+    Returns
+    ----------
+    pyarrow.Table: the index, None if there is no index or the file changed after indexing
+    """
+    index_path = region_index_path(parquet_path)
+    if not os.path.exists(index_path):
+        return None
+    index = pq.read_table(index_path)
+    metadata = index.schema.metadata or {}
+    indexed_size, indexed_footer = metadata.get(INDEXED_SIZE_KEY), metadata.get(INDEXED_FOOTER_KEY)
+    if indexed_size is None or int(indexed_size) != os.path.getsize(parquet_path) \
+            or indexed_footer is None or indexed_footer.decode() != footer_digest(parquet_path):
+        logger.warning(f"{index_path} is out of date, rebuild it with the index command")
+        return None
+    return index
+
+
+def _overlaps(index, chrom_column, min_column, max_column, region):
+    chrom, start, end = region
+    mask = pc.equal(index.column(chrom_column), chrom)
+    if start is not None:
+        mask = pc.and_(mask, pc.greater_equal(index.column(max_column), start))
+    if end is not None:
+        mask = pc.and_(mask, pc.less_equal(index.column(min_column), end))
+    return mask
+
+
+def matching_blocks(index, region1, region2=None):
+    """
+    Blocks of the index that may contain pairs of the regions.
+
+    Parameters
+    ----------
+    index (pyarrow.Table): the region index
+    region1 (tuple): (chrom, start, end) of the first side, see parse_region
+    region2 (tuple): (chrom, start, end) of the second side, any if None
+
+    Returns
+    ----------
+    pyarrow.Table: the matching rows of the index, in the order of the file
+    """
+    mask = _overlaps(index, "chrom1", "pos1_min", "pos1_max", region1)
+    if region2 is not None:
+        mask = pc.and_(mask, _overlaps(index, "chrom2", "pos2_min", "pos2_max", region2))
+    return index.filter(mask)
+
+
+def _region_mask(table, chrom_column, position_column, region):
+    chrom, start, end = region
+    mask = pc.equal(pc.cast(table.column(chrom_column), pa.string()), chrom)
+    if start is not None:
+        mask = pc.and_(mask, pc.greater_equal(table.column(position_column), start))
+    if end is not None:
+        mask = pc.and_(mask, pc.less_equal(table.column(position_column), end))
+    return mask
+
+
+def query_region(parquet_path, region1, region2=None, columns=None, c1="chrom1", c2="chrom2", p1="pos1", p2="pos2", chroms=None):
+    """
+    Pairs of a .parquet file in a region or a pair of regions, as pairix queries .pairs.gz files.
+    With a region index only the matching blocks of the matching row groups are read, otherwise the
+    whole file is filtered by row group statistics. Of a partitioned dataset only the files
+    of the partitions of the chroms are queried.
+
+    Parameters
+    ----------
+    parquet_path (str): path to the .parquet file or the partitioned dataset
+    region1 (str): region of chrom1/pos1, e.g. chr1:1M-2M, see parse_region
+    region2 (str): region of chrom2/pos2, any if None
+    columns (list): columns to read, all if None
+    c1, c2, p1, p2 (str): names of the chrom and position columns
+    chroms (list): chromosomes of the file, e.g. of its #chromsize lines, see parse_region
+
+    Returns
+    ----------
+    pyarrow.Table: the pairs, in the order of the file
+    """
+    if parquet_dataset.is_dataset(parquet_path):
+        return _query_dataset(parquet_path, region1, region2, columns, c1, c2, p1, p2, chroms)
+
+    region1 = parse_region(region1, chroms)
+    region2 = parse_region(region2, chroms) if region2 else None
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + [c1, c2, p1, p2]))
+
+    index = read_region_index(parquet_path)
+    if index is None:
+        filters = [(c1, "=", region1[0])]
+        filters += [(p1, ">=", region1[1])] if region1[1] is not None else []
+        filters += [(p1, "<=", region1[2])] if region1[2] is not None else []
+        table = pq.read_table(parquet_path, columns=read_columns, filters=filters)
+    else:
+        parquet_file = pq.ParquetFile(parquet_path)
+        metadata = parquet_file.metadata
+        group_starts = np.cumsum([0] + [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+        blocks = matching_blocks(index, region1, region2)
+        pieces = []
+        for row_group, ranges in _row_ranges(blocks).items():
+            group_table = parquet_file.read_row_group(row_group, columns=read_columns)
+            for row_start, row_end in ranges:
+                pieces.append(group_table.slice(row_start - group_starts[row_group], row_end - row_start))
+        if pieces:
+            table = pa.concat_tables(pieces)
+        else:
+            table = parquet_file.schema_arrow.empty_table()
+            table = table if read_columns is None else table.select(read_columns)
+
+    mask = _region_mask(table, c1, p1, region1)
+    if region2 is not None:
+        mask = pc.and_(mask, _region_mask(table, c2, p2, region2))
+    table = table.filter(mask)
+    return table if columns is None else table.select(list(columns))
+
+
+def _row_ranges(blocks):
+    """
+    Disjoint ranges of rows to read for the blocks, by row group in the order of the file.
+    The blocks of different chrom pairs interleave in unsorted files, their ranges are merged.
+    """
+    ranges = {}
+    order = pc.sort_indices(blocks, sort_keys=[("row_start", "ascending")])
+    for row_group, row_start, row_end in zip(*(blocks.take(order).column(name).to_pylist() for name in ("row_group", "row_start", "row_end"))):
+        group_ranges = ranges.setdefault(row_group, [])
+        if group_ranges and row_start <= group_ranges[-1][1]:
+            group_ranges[-1][1] = max(group_ranges[-1][1], row_end)
+        else:
+            group_ranges.append([row_start, row_end])
+    return ranges
+
+
+def _query_dataset(dataset_path, region1, region2, columns, c1, c2, p1, p2, chroms=None):
+    """query_region over the data files of a dataset, which may hold pairs of the chroms of the regions."""
+    region_chroms = {c1: parse_region(region1, chroms)[0], c2: parse_region(region2, chroms)[0] if region2 else None}
+    tables = []
+    for path in parquet_dataset.dataset_files(dataset_path):
+        values = parquet_dataset.partition_values(os.path.relpath(path, dataset_path))
+        if all(region_chroms.get(column) in (None, value) for column, value in values.items()):
+            tables.append(query_region(path, region1, region2, columns, c1, c2, p1, p2, chroms))
+    if tables:
+        return pa.concat_tables(tables)
+    table = pq.read_schema(parquet_dataset.header_path(dataset_path)).empty_table()
+    return table if columns is None else table.select(list(columns))
@@ -0,0 +1,299 @@
+"""
+Compiler of the select conditions of pairtools (Python expressions over the columns) into DuckDB SQL.
+
+The condition is parsed by the Python parser into an AST and compiled node by node, so that parentheses,
+string literals and operators inside literals are never confused. Constants become escaped literals.
+Comparisons of a column with constants are emitted as column-op-constant predicates, which DuckDB can push
+into the Parquet scan and check against the min/max statistics of every row group: region_match becomes a
+range of the position, csv_match an IN list together with the range of its values, integral float constants
+(1e6) compared with integer columns become integers. Which filters DuckDB actually pushes down is shown by
+its plan, see duckdb_select.scan_filters.
+"""
+import ast
+import math
+import re
+
+
+COMPARISONS = {ast.Eq: "=", ast.NotEq: "<>", ast.Lt: "<", ast.LtE: "<=", ast.Gt: ">", ast.GtE: ">="}
+MIRRORED = {"=": "=", "<>": "<>", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+BINARY_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.FloorDiv: "//", ast.Mod: "%"}
+# Python built-ins of the conditions and their DuckDB counterparts
+FUNCTIONS = {"abs": "abs", "len": "length", "min": "least", "max": "greatest"}
+CASTS = {"int": "BIGINT", "float": "DOUBLE", "str": "VARCHAR"}
+
+
+def sql_literal(value):
+    """SQL literal of a Python constant, strings with quotes doubled."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else f"'{value}'::DOUBLE"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise ValueError(f"Unsupported constant in the condition: {value!r}")
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class _Sql:
+    """
+    A compiled expression: its SQL with escaped literals.
+    column and value are set for bare columns and constants.
+    """
+
+    def __init__(self, sql, column=None, value=None, is_constant=False):
+        self.sql = sql
+        self.column = column
+        self.value = value
+        self.is_constant = is_constant
+
+    @classmethod
+    def constant(cls, value):
+        return cls(sql_literal(value), value=value, is_constant=True)
+
+    @classmethod
+    def join(cls, template, parts):
+        """template with {} for every part, e.g. "({} AND {})"."""
+        return cls(template.format(*(part.sql for part in parts)))
+
+
+class CompiledCondition:
+    """
+    A select condition compiled into DuckDB SQL.
+
+    Attributes
+    ----------
+    sql (str): the condition with escaped literals
+    """
+
+    def __init__(self, compiled):
+        self.sql = compiled.sql
+
+
+class _Compiler:
+    def __init__(self, column_names, integer_columns):
+        self.column_names = list(column_names) if column_names is not None else None
+        self.integer_columns = set(integer_columns)
+
+    def compile(self, node):
+        method = getattr(self, "_" + type(node).__name__, None)
+        if method is None:
+            raise ValueError(f"Unsupported expression in the condition: {ast.unparse(node)}")
+        return method(node)
+
+    def _Expression(self, node):
+        return self.compile(node.body)
+
+    def _Constant(self, node):
+        return _Sql.constant(node.value)
+
+    def _Name(self, node):
+        if self.column_names is not None and node.id not in self.column_names:
+            raise ValueError(f"Unknown column in the condition: {node.id}")
+        return self._column(node.id)
+
+    def _column(self, name):
+        identifier = quote_identifier(name)
+        return _Sql(identifier, column=name)
+
+    def _Subscript(self, node):
+        # COLS[i] of pairtools: the i-th column
+        if isinstance(node.value, ast.Name) and node.value.id == "COLS" and isinstance(node.slice, ast.Constant):
+            if self.column_names is None:
+                raise ValueError("COLS[i] needs the column names of the input")
+            return self._column(self.column_names[node.slice.value])
+        raise ValueError(f"Unsupported expression in the condition: {ast.unparse(node)}")
+
+    def _BoolOp(self, node):
+        parts = [self.compile(value) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return _Sql.join("(" + " AND ".join("{}" for _ in parts) + ")", parts)
+        return _Sql.join("(" + " OR ".join("{}" for _ in parts) + ")", parts)
+
+    def _UnaryOp(self, node):
+        operand = self.compile(node.operand)
+        if isinstance(node.op, ast.Not):
+            return _Sql.join("(NOT {})", [operand])
+        if isinstance(node.op, (ast.USub, ast.UAdd)):
+            if operand.is_constant:
+                return _Sql.constant(-operand.value if isinstance(node.op, ast.USub) else operand.value)
+            return _Sql.join("(-{})" if isinstance(node.op, ast.USub) else "{}", [operand])
+        raise ValueError(f"Unsupported expression in the condition: {ast.unparse(node)}")
+
+    def _BinOp(self, node):
+        left, right = self.compile(node.left), self.compile(node.right)
+        if isinstance(node.op, ast.Pow):
+            return _Sql.join("pow({}, {})", [left, right])
+        if type(node.op) not in BINARY_OPERATORS:
+            raise ValueError(f"Unsupported operator in the condition: {ast.unparse(node)}")
+        return _Sql.join("({} " + BINARY_OPERATORS[type(node.op)] + " {})", [left, right])
+
+    def _Compare(self, node):
+        # a < b < c is a < b and b < c
+        operand_nodes = [node.left] + list(node.comparators)
+        # tuples, lists and sets are the right sides of in
+        operands = [None if isinstance(operand, (ast.Tuple, ast.List, ast.Set)) else self.compile(operand) for operand in operand_nodes]
+        for i, operand in enumerate(operands):
+            if operand is None and (i == 0 or not isinstance(node.ops[i - 1], (ast.In, ast.NotIn)) or i < len(node.ops)):
+                raise ValueError(
+                    f"Unsupported operand in the condition: {ast.unparse(operand_nodes[i])}, tuples, lists and sets are the right side of in only"
+                )
+        parts = [
+            self._comparison(operands[i], op, operands[i + 1], operand_nodes[i + 1])
+            for i, op in enumerate(node.ops)
+        ]
+        if len(parts) == 1:
+            return parts[0]
+        return _Sql.join("(" + " AND ".join("{}" for _ in parts) + ")", parts)
+
+    def _comparison(self, left, op, right, right_node):
+        if isinstance(op, (ast.In, ast.NotIn)):
+            return self._membership(left, right, right_node, negated=isinstance(op, ast.NotIn))
+        if isinstance(op, (ast.Is, ast.IsNot)) or (type(op) in (ast.Eq, ast.NotEq) and (right.is_constant and right.value is None)):
+            if not (right.is_constant and right.value is None):
+                raise ValueError("'is' compares with None only")
+            negated = isinstance(op, (ast.IsNot, ast.NotEq))
+            return _Sql.join("({} IS NOT NULL)" if negated else "({} IS NULL)", [left])
+        if type(op) not in COMPARISONS:
+            raise ValueError(f"Unsupported comparison in the condition: {type(op).__name__}")
+
+        operator = COMPARISONS[type(op)]
+        if left.is_constant and right.column is not None:
+            # the column to the left, as DuckDB matches filters
+            left, right, operator = right, left, MIRRORED[operator]
+        right = self._typed_constant(left, right)
+        return _Sql.join("({} " + operator + " {})", [left, right])
+
+    def _typed_constant(self, column, constant):
+        """Integral floats (1e6) compared with integer columns become integers, so the column is not cast to DOUBLE."""
+        if column.column in self.integer_columns and constant.is_constant and isinstance(constant.value, float) \
+                and constant.value.is_integer():
+            return _Sql.constant(int(constant.value))
+        return constant
+
+    def _membership(self, left, right, right_node, negated):
+        if isinstance(right_node, (ast.Tuple, ast.List, ast.Set)):
+            values = [self.compile(element) for element in right_node.elts]
+            if not all(value.is_constant for value in values):
+                raise ValueError("'in' expects a tuple, list or set of constants")
+            return self._in_list(left, [self._typed_constant(left, value).value for value in values], negated)
+        if right is not None and (right.is_constant and isinstance(right.value, str) or left.is_constant and isinstance(left.value, str)):
+            # substring test of Python strings
+            compiled = _Sql.join("contains({}, {})", [right, left])
+            return _Sql.join("(NOT {})", [compiled]) if negated else compiled
+        raise ValueError("'in' expects a tuple, list or set of constants, or a string")
+
+    def _in_list(self, column, values, negated=False):
+        """column IN (values); for a bare column also within the range of the values, which prunes row groups."""
+        if not values:
+            return _Sql.constant(negated)
+        constants = [_Sql.constant(value) for value in values]
+        membership = _Sql.join("({} " + ("NOT IN" if negated else "IN") + " (" + ", ".join("{}" for _ in constants) + "))", [column] + constants)
+        if negated or column.column is None or len({type(value) for value in values}) > 1 or None in values:
+            return membership
+        # an IN list is only an optional filter of the Parquet scan, its range is checked against the statistics
+        low, high = _Sql.constant(min(values)), _Sql.constant(max(values))
+        value_range = _Sql.join("({} BETWEEN {} AND {})", [column, low, high])
+        return _Sql.join("({} AND {})", [value_range, membership])
+
+    def _Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError(f"Unsupported call in the condition: {ast.unparse(node)}")
+        name = node.func.id
+        args = [self.compile(arg) for arg in node.args]
+        if name in FUNCTIONS:
+            return _Sql.join(FUNCTIONS[name] + "(" + ", ".join("{}" for _ in args) + ")", args)
+        if name in CASTS:
+            return _Sql.join("CAST({} AS " + CASTS[name] + ")", args[:1])
+        matcher = getattr(self, "_call_" + name, None)
+        if matcher is None:
+            raise ValueError(f"Unknown function in the condition: {name}")
+        return matcher(args, node)
+
+    def _constant_args(self, args, node, n_constants):
+        if len(args) < n_constants + 1 or not all(arg.is_constant for arg in args[-n_constants:]):
+            raise ValueError(f"{ast.unparse(node)}: the patterns and regions must be constants")
+
+    def _call_regex_match(self, args, node):
+        # fullmatch, as pairtools
+        self._constant_args(args, node, 1)
+        return _Sql.join("regexp_full_match({}, {})", args)
+
+    def _call_wildcard_match(self, args, node):
+        self._constant_args(args, node, 1)
+        wildcard = args[1].value
+        if "[" in wildcard:
+            return _Sql.join("regexp_full_match({}, {})", [args[0], _Sql.constant(wildcard_to_regex(wildcard))])
+        like = re.sub(r"([%_\\])", r"\\\1", wildcard).replace("*", "%").replace("?", "_")
+        return _Sql.join("({} LIKE {} ESCAPE '\\')", [args[0], _Sql.constant(like)])
+
+    def _call_csv_match(self, args, node):
+        self._constant_args(args, node, 1)
+        values = args[1].value.split(",")
+        if args[0].column in self.integer_columns and all(re.fullmatch(r"-?[0-9]+", value) for value in values):
+            values = [int(value) for value in values]
+        return self._in_list(args[0], list(dict.fromkeys(values)))
+
+    def _call_region_match(self, args, node):
+        # region_match(chrom, pos, region_chrom, start[, end]), start and end inclusive
+        if len(args) not in (4, 5):
+            raise ValueError(f"{ast.unparse(node)}: region_match(chrom, pos, region_chrom, start[, end])")
+        self._constant_args(args, node, len(args) - 2)
+        chrom, pos = args[0], args[1]
+        parts = [self._comparison(chrom, ast.Eq(), args[2], None), self._comparison(pos, ast.GtE(), args[3], None)]
+        if len(args) == 5:
+            parts.append(self._comparison(pos, ast.LtE(), args[4], None))
+        return _Sql.join("(" + " AND ".join("{}" for _ in parts) + ")", parts)
+
+
+def wildcard_to_regex(wildcard):
+    """RE2 regex of a shell wildcard (*, ?, [seq], [!seq]), as fnmatch."""
+    regex = []
+    i = 0
+    while i < len(wildcard):
+        char = wildcard[i]
+        end = wildcard.find("]", i + 2) if char == "[" else -1
+        if char == "*":
+            regex.append(".*")
+        elif char == "?":
+            regex.append(".")
+        elif end != -1:
+            chars = wildcard[i + 1:end]
+            chars = "^" + chars[1:] if chars.startswith("!") else chars
+            regex.append("[" + chars.replace("\\", "\\\\") + "]")
+            i = end
+        else:
+            regex.append(re.escape(char))
+        i += 1
+    return "".join(regex)
+
+
+def compile_condition(condition, column_names=None, integer_columns=()):
+    """
+    Compiles a select condition of pairtools into DuckDB SQL.
+
+    The condition is a Python expression over the columns: comparisons (also chained), and/or/not, arithmetic,
+    in with tuples/lists/sets of constants, abs, len, min, max, int, float, str, COLS[i] and the matchers
+    regex_match(x, regex), wildcard_match(x, wildcard), csv_match(x, 'a,b,c') and region_match(chrom, pos, chrom, start[, end]).
+
+    Parameters
+    ----------
+    condition (str): the condition
+    column_names (list): columns of the input, to check the names and resolve COLS[i]; any name if None
+    integer_columns (Iterable[str]): integer columns, compared with integers rather than floats
+
+    Returns
+    ----------
+    CompiledCondition
+    """
+    try:
+        tree = ast.parse(condition.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid condition {condition!r}: {e.msg}") from None
+    return CompiledCondition(_Compiler(column_names, integer_columns).compile(tree))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import gzip
+import shutil
+import subprocess
+import pytest
+import pysam
+import pyarrow.parquet as pq
+
+from pairs_to_parquet.lib.duckdb_utils import duckdb_kv_metadata_to_header, read_summary_stats
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+
+
+@pytest.fixture
+def mock_pairs_gz(tmp_path):
+    path = os.path.join(tmp_path, "mock.pairs.gz")
+    with open(mock_pairs_path, "rb") as f_in, gzip.open(path, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return path
+
+
+@pytest.fixture
+def mock_pairs_bgzf(tmp_path):
+    path = os.path.join(tmp_path, "mock.bgzf.pairs.gz")
+    with open(mock_pairs_path, "rb") as f_in, pysam.BGZFile(path, "wb") as f_out:
+        f_out.write(f_in.read())
+    return path
+
+
+def run_csv_to_parquet(input_path, output_path, *args):
+    try:
+        subprocess.check_output(
+            ["python", "-m", "pairs_to_parquet", "csv-to-parquet", input_path, "-o", output_path, *args],
+        )
+    except subprocess.CalledProcessError as e:
+        print(e.output)
+        print(sys.exc_info())
+        raise e
+
+
+@pytest.mark.parametrize(
+    "input_reader_args",
+    [
+        ["--input-reader", "duckdb"],
+        ["--input-reader", "stream"],
+        ["--input-reader", "pipe", "--cmd-in", "gzip -dc"],
+        ["--input-reader", "bgzf", "--nproc-in", "2"],
+    ],
+)
+def test_input_readers(mock_pairs_gz, mock_pairs_bgzf, tmp_path, input_reader_args):
+    input_path = mock_pairs_bgzf if input_reader_args[1] == "bgzf" else mock_pairs_gz
+    output_path = os.path.join(tmp_path, f"{input_reader_args[1]}.parquet")
+    run_csv_to_parquet(input_path, output_path, *input_reader_args)
+
+    pairs_body = [
+        l.rstrip("\n").split("\t")
+        for l in open(mock_pairs_path, "r")
+        if not l.startswith("#") and l.strip()
+    ]
+    table = pq.read_table(output_path)
+    output_body = [[str(v) for v in row.values()] for row in table.to_pylist()]
+
+    # same rows in the same order, no matter how the body was read
+    assert output_body == pairs_body
+
+    output_header = duckdb_kv_metadata_to_header(output_path)
+    assert output_header[-1] == "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type"
+
+
+def test_stream_reader_header_only(tmp_path):
+    input_path = os.path.join(tmp_path, "header_only.pairs.gz")
+    with gzip.open(input_path, "wt") as f:
+        f.writelines(l for l in open(mock_pairs_path, "r") if l.startswith("#"))
+
+    output_path = os.path.join(tmp_path, "header_only.parquet")
+    run_csv_to_parquet(input_path, output_path, "--input-reader", "stream")
+
+    assert pq.read_table(output_path).num_rows == 0
+
+
+@pytest.mark.parametrize("extension", ["lz4", "zst", "bz2"])
+def test_codec_inputs(tmp_path, extension):
+    import pyarrow as pa
+
+    input_path = os.path.join(tmp_path, f"mock.pairs.{extension}")
+    with open(mock_pairs_path, "rb") as f_in, pa.output_stream(input_path, compression="detect") as f_out:
+        f_out.write(f_in.read())
+    output_path = os.path.join(tmp_path, "mock.parquet")
+    run_csv_to_parquet(input_path, output_path)
+
+    pairs_body = [
+        l.rstrip("\n").split("\t")
+        for l in open(mock_pairs_path, "r")
+        if not l.startswith("#") and l.strip()
+    ]
+    assert pq.read_table(output_path).num_rows == len(pairs_body)
+
+
+def test_parquet_writer_options(tmp_path):
+    output_path = os.path.join(tmp_path, "mock.parquet")
+    run_csv_to_parquet(
+        mock_pairs_path, output_path,
+        "--parquet-compression", "zstd", "--parquet-compression-level", "9", "--no-parquet-dictionary",
+    )
+
+    metadata = pq.ParquetFile(output_path).metadata
+    readid_chunk = metadata.row_group(0).column(0)
+    assert readid_chunk.compression == "ZSTD"
+    assert "PLAIN" in readid_chunk.encodings
+    # the header is still stored next to the data
+    assert duckdb_kv_metadata_to_header(output_path)[-1].startswith("#columns:")
+
+
+def test_compact_schema_roundtrip(tmp_path):
+    import pyarrow as pa
+
+    output_path = os.path.join(tmp_path, "mock.parquet")
+    run_csv_to_parquet(mock_pairs_path, output_path, "--compact-schema")
+
+    schema = pq.read_schema(output_path)
+    assert schema.field("pos1").type == pa.uint32()
+    assert schema.field("pos2").type == pa.uint32()
+
+    # back to .pairs: the same pairs
+    pairs_path = os.path.join(tmp_path, "mock.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "parquet-to-csv", output_path, "-o", pairs_path])
+    read_body = lambda path: sorted(l for l in open(path, "r") if not l.startswith("#") and l.strip())
+    assert read_body(pairs_path) == read_body(mock_pairs_path)
+
+
+@pytest.mark.parametrize("readid", ["drop", "hash"])
+def test_readid_modes(tmp_path, readid):
+    output_path = os.path.join(tmp_path, "mock.parquet")
+    run_csv_to_parquet(mock_pairs_path, output_path, "--readid", readid)
+
+    table = pq.read_table(output_path)
+    header_columns = duckdb_kv_metadata_to_header(output_path)[-1].split()[1:]
+    assert header_columns == table.column_names
+    if readid == "drop":
+        assert "readID" not in table.column_names
+    else:
+        assert table.schema.field("readID").type == "uint64"
+        # distinct reads keep distinct hashes
+        assert len(set(table.column("readID").to_pylist())) == table.num_rows
+
+
+def test_summary_stats(tmp_path):
+    output_path = os.path.join(tmp_path, "mock.parquet")
+    run_csv_to_parquet(mock_pairs_path, output_path, "--summary-stats")
+
+    stats = read_summary_stats(output_path)
+    assert stats["total"] == 9 and stats["cis"] == 4 and stats["trans"] == 2
+    assert stats["pair_types"]["UU"] == 4
+    assert stats["chrom_pairs"]["chr1"] == {"chr1": 4, "chr2": 1}
+    assert stats["positions"]["chr1"] == [1, 50]
+    # the header is read back as before
+    assert duckdb_kv_metadata_to_header(output_path)[-1] == "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type"
+
+    # off by default
+    run_csv_to_parquet(mock_pairs_path, output_path)
+    assert read_summary_stats(output_path) is None
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import pytest
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def read_body(path):
+    return [l.rstrip("\n").split("\t") for l in open(path) if not l.startswith("#")]
+
+
+@pytest.mark.parametrize("extension", [".pairs", ".parquet"])
+def test_dedup_as_pairtools(tmp_path, extension):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    sorted_path = os.path.join(tmp_path, "sorted.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_path, mock_pairs_path])
+    input_path = os.path.join(tmp_path, "sorted" + extension)
+    if extension == ".parquet":
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "csv-to-parquet", "-o", input_path, sorted_path])
+
+    paths = {name: os.path.join(tmp_path, name + ".pairs") for name in ["nodups", "dups", "unmapped"]}
+    stats_path = os.path.join(tmp_path, "stats.txt")
+    subprocess.check_output([
+        "python", "-m", "pairs_to_parquet", "dedup", input_path, "-o", paths["nodups"], "--output-dups", paths["dups"],
+        "--output-unmapped", paths["unmapped"], "--output-stats", stats_path, "--mark-dups",
+    ])
+
+    pairtools_paths = {name: os.path.join(tmp_path, "pairtools_" + name + ".pairs") for name in paths}
+    subprocess.check_output([
+        "pairtools", "dedup", sorted_path, "-o", pairtools_paths["nodups"], "--output-dups", pairtools_paths["dups"],
+        "--output-unmapped", pairtools_paths["unmapped"], "--mark-dups",
+    ], stderr=subprocess.DEVNULL)
+
+    for name in paths:
+        assert read_body(paths[name]) == read_body(pairtools_paths[name]), name
+    stats = dict(l.rstrip("\n").split("\t") for l in open(stats_path))
+    assert stats["total"] == "9" and stats["total_unmapped"] == "3" and stats["total_dups"] == "2" and stats["total_nodups"] == "4"
+    assert any("ID:pairs_to_parquet_dedup" in l for l in open(paths["nodups"]))
+
+
+def test_dedup_all_mapped_together(tmp_path):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    output_path = os.path.join(tmp_path, "out.parquet")
+    converted_path = os.path.join(tmp_path, "out.pairs")
+    subprocess.check_output([
+        "python", "-m", "pairs_to_parquet", "dedup", mock_pairs_path, "-o", output_path, "--output-dups", output_path, "--mark-dups",
+        "--max-mismatch", "1",
+    ])
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "parquet-to-csv", "-o", converted_path, output_path])
+
+    # all mapped pairs in the order of the input, the duplicates marked: readid04 is 1 bp away from readid03
+    body = read_body(converted_path)
+    assert [l[0] for l in body] == ["readid01", "readid02", "readid03", "readid04", "readid05", "readid06"]
+    assert [l[7] for l in body] == ["UU", "DD", "UU", "DD", "UU", "UU"]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import pytest
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def split_mock_pairs(tmp_path, n_parts):
+    """Splits the body of mock.pairs into n_parts .pairs files with the full header."""
+    lines = open(os.path.join(testdir, "data", "mock.pairs")).readlines()
+    header = [l for l in lines if l.startswith("#")]
+    body = [l for l in lines if not l.startswith("#")]
+    paths = []
+    for i in range(n_parts):
+        path = os.path.join(tmp_path, f"part{i}.pairs")
+        with open(path, "w") as f:
+            f.writelines(header + body[i::n_parts])
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.parametrize("output_name", ["merged.pairs", "merged.parquet"])
+def test_merge_sorted_inputs(tmp_path, output_name):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    sorted_path = os.path.join(tmp_path, "sorted.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_path, mock_pairs_path])
+
+    # sorted inputs of different formats
+    sorted_parts = []
+    for part_path, extension in zip(split_mock_pairs(tmp_path, 3), [".pairs.gz", ".parquet", ".pairs"]):
+        sorted_part = part_path.replace(".pairs", "_sorted") + extension
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_part, part_path])
+        sorted_parts.append(sorted_part)
+
+    merged_path = os.path.join(tmp_path, output_name)
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "merge", "-o", merged_path, "--export-batch-size", "2"] + sorted_parts
+    )
+    if output_name.endswith("parquet"):
+        converted_path = os.path.join(tmp_path, "converted.pairs")
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "parquet-to-csv", "-o", converted_path, merged_path])
+        merged_path = converted_path
+
+    # same order of the sort keys as sorting all pairs at once
+    sorted_body = [l.split("\t") for l in open(sorted_path) if not l.startswith("#")]
+    merged_body = [l.split("\t") for l in open(merged_path) if not l.startswith("#")]
+    assert [l[1:8] for l in merged_body] == [l[1:8] for l in sorted_body]
+    assert sorted(merged_body) == sorted(sorted_body)
+
+    # @PG chains of all inputs are kept
+    merged_header = [l for l in open(merged_path) if l.startswith("#")]
+    assert "#sorted: chr1-chr2-pos1-pos2-pair_type\n" in merged_header
+    assert sum("ID:pairs_to_parquet_sort" in l for l in merged_header) == 3
+    assert sum("ID:pairs_to_parquet_merge" in l for l in merged_header) == 3
+
+
+def test_merge_unsorted_input(tmp_path):
+    part_paths = split_mock_pairs(tmp_path, 2)
+    result = subprocess.run(
+        ["python", "-m", "pairs_to_parquet", "merge", "-o", os.path.join(tmp_path, "merged.pairs")] + part_paths,
+        capture_output=True,
+    )
+    assert result.returncode != 0
+    assert b"is not sorted by the merge keys" in result.stderr
+
+
+def test_merge_chrom_order(tmp_path):
+    chroms = ["chr2", "chrX", "chr10", "chr1"]
+    sorted_parts = []
+    for part in range(2):
+        input_path = os.path.join(tmp_path, f"part{part}.pairs")
+        with open(input_path, "w") as f:
+            f.write("## pairs format v1.0.0\n")
+            f.writelines(f"#chromsize: {chrom} 1000\n" for chrom in chroms)
+            f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type\n")
+            f.writelines(f"r{part}_{i}\t{chrom}\t{i}\t{chrom}\t{i}\t+\t+\tUU\n" for i, chrom in enumerate(chroms))
+        sorted_part = os.path.join(tmp_path, f"part{part}_sorted.pairs")
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_part, "--chrom-order", "natural", input_path])
+        sorted_parts.append(sorted_part)
+
+    merged_path = os.path.join(tmp_path, "merged.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "merge", "-o", merged_path, "--chrom-order", "natural"] + sorted_parts)
+    lines = open(merged_path).readlines()
+    body_chroms = [l.split("\t")[1] for l in lines if not l.startswith("#")]
+    assert body_chroms == ["chr1", "chr1", "chr2", "chr2", "chr10", "chr10", "chrX", "chrX"]
+    assert [l.split()[1] for l in lines if l.startswith("#chromsize")] == ["chr1", "chr2", "chr10", "chrX"]
+
+
+def test_merge_mixed_schemas(tmp_path):
+    # compact UINTEGER positions beyond the INTEGER range and the default positions are merged into their common type
+    sorted_parts = []
+    for part, (chrom, position, options) in enumerate([("chr1", 10, []), ("chr2", 3_000_000_000, ["--compact-schema"])]):
+        input_path = os.path.join(tmp_path, f"part{part}.pairs")
+        with open(input_path, "w") as f:
+            f.write("## pairs format v1.0.0\n")
+            f.writelines(f"#chromsize: {c} 4000000000\n" for c in ("chr1", "chr2"))
+            f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type\n")
+            f.write(f"r{part}\t{chrom}\t{position}\t{chrom}\t{position}\t+\t+\tUU\n")
+        sorted_part = os.path.join(tmp_path, f"part{part}_sorted.parquet")
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_part, input_path] + options)
+        sorted_parts.append(sorted_part)
+
+    merged_path = os.path.join(tmp_path, "merged.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "merge", "-o", merged_path, "--export-batch-size", "1"] + sorted_parts)
+    merged_body = [l.split("\t")[:5] for l in open(merged_path) if not l.startswith("#")]
+    assert merged_body == [["r0", "chr1", "10", "chr1", "10"], ["r1", "chr2", "3000000000", "chr2", "3000000000"]]
+
+
+def test_merge_empty_inputs(tmp_path):
+    header = [l for l in open(os.path.join(testdir, "data", "mock.pairs")) if l.startswith("#")]
+    part_paths = []
+    for i in range(2):
+        part_path = os.path.join(tmp_path, f"part{i}.pairs.gz")
+        subprocess.run(["gzip", "-c"], input="".join(header).encode(), stdout=open(part_path, "wb"), check=True)
+        part_paths.append(part_path)
+
+    merged_path = os.path.join(tmp_path, "merged.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "merge", "-o", merged_path] + part_paths)
+    lines = open(merged_path).readlines()
+    assert lines and all(l.startswith("#") for l in lines)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def test_query_with_region_index(tmp_path):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    sorted_path = os.path.join(tmp_path, "sorted.parquet")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_path, "--region-index", mock_pairs_path])
+    assert os.path.exists(sorted_path + ".rgi")
+
+    # .pairs to stdout, with the header of the input
+    output = subprocess.check_output(["python", "-m", "pairs_to_parquet", "query", sorted_path, "chr1:1-1", "chr1:3-50"]).decode()
+    body = [l.split("\t") for l in output.splitlines() if not l.startswith("#")]
+    assert sorted(l[0] for l in body) == ["readid01", "readid02", "readid04"]
+    assert "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type" in output.splitlines()
+
+    # an index built by the index command, a .parquet output
+    parquet_path = os.path.join(tmp_path, "mock.parquet")
+    query_path = os.path.join(tmp_path, "query.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "csv-to-parquet", mock_pairs_path, "-o", parquet_path])
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "index", parquet_path])
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "query", parquet_path, "chr2", "-o", query_path])
+    body = [l.split("\t") for l in open(query_path) if not l.startswith("#")]
+    assert [l[0] for l in body] == ["readid06"]
+
+
+def test_query_position(tmp_path):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    parquet_path = os.path.join(tmp_path, "mock.parquet")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "csv-to-parquet", mock_pairs_path, "-o", parquet_path])
+
+    # chr1:1 is the position 1, not a chromosome named chr1:1
+    output = subprocess.check_output(["python", "-m", "pairs_to_parquet", "query", parquet_path, "chr1:1", "chr1:50"]).decode()
+    body = [l.split("\t") for l in output.splitlines() if not l.startswith("#")]
+    assert sorted(l[0] for l in body) == ["readid01", "readid02"]
+
+    result = subprocess.run(["python", "-m", "pairs_to_parquet", "query", parquet_path, "chrUn:1-50"], capture_output=True)
+    assert result.returncode != 0
+    assert b"Unknown chromosome" in result.stderr
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import gzip
 import os
 import sys
 import subprocess
@@ -328,4 +329,116 @@ def test_region_match_no_end():
         fields = l.split("	")
         chrom1, pos1 = fields[1], int(fields[2])
         if chrom1 == "chr1" and pos1 >= 100:
-            assert l in output_body
\ No newline at end of file
+            assert l in output_body
+
+def test_partitioned_dataset(tmp_path):
+    dataset_path = os.path.join(tmp_path, "mock_dataset")
+    selected_path = os.path.join(tmp_path, "selected")
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "csv-to-parquet", os.path.join(testdir, "data", "mock.pairs"), "-o", dataset_path, "--partition-by-chroms"]
+    )
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "select", 'pair_type == "UU"', dataset_path, "-o", selected_path, "--partition-by-chroms"]
+    )
+
+    original_body = read_parquet_as_lines(mock_parquet_path)
+    expected = [l for l in original_body if l.split("\t")[7] == "UU"]
+    selected = [
+        l for partition in sorted(os.listdir(selected_path)) if partition.startswith("chrom1=")
+        for sub in sorted(os.listdir(os.path.join(selected_path, partition)))
+        for l in read_parquet_as_lines(os.path.join(selected_path, partition, sub, "data_0.parquet"))
+    ]
+    assert sorted(selected) == sorted(expected)
+    # the header of the dataset is the header of every data file
+    header = duckdb_kv_metadata_to_header(selected_path)
+    assert any("pairs_to_parquet_select" in l for l in header)
+    data_file = os.path.join(selected_path, "chrom1=chr1", "chrom2=chr1", "data_0.parquet")
+    assert duckdb_kv_metadata_to_header(data_file) == header
+
+    # a dataset is replaced, any other non-empty directory is left alone
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "select", 'pair_type == "UU"', dataset_path, "-o", selected_path, "--partition-by-chroms"]
+    )
+    other_path = os.path.join(tmp_path, "other")
+    os.makedirs(other_path)
+    open(os.path.join(other_path, "notes.txt"), "w").close()
+    with pytest.raises(subprocess.CalledProcessError):
+        subprocess.check_output(
+            ["python", "-m", "pairs_to_parquet", "select", 'pair_type == "UU"', dataset_path, "-o", other_path, "--partition-by-chroms"],
+            stderr=subprocess.DEVNULL,
+        )
+    assert os.listdir(other_path) == ["notes.txt"]
+    assert sorted(os.listdir(tmp_path)) == ["mock_dataset", "other", "selected"]
+
+
+def test_output_rest(tmp_path):
+    selected_path = os.path.join(tmp_path, "selected.parquet")
+    rest_path = os.path.join(tmp_path, "rest.parquet")
+    subprocess.check_output(
+        [
+            "python", "-m", "pairs_to_parquet", "select", 'pair_type == "UU"', mock_parquet_path,
+            "-o", selected_path, "--output-rest", rest_path, "--remove-columns", "sam1,sam2",
+        ]
+    )
+
+    original_body = [l.split("\t")[:8] for l in read_parquet_as_lines(mock_parquet_path)]
+    # both outputs keep the order of the input and drop the removed columns
+    assert [l.split("\t") for l in read_parquet_as_lines(selected_path)] == [l for l in original_body if l[7] == "UU"]
+    assert [l.split("\t") for l in read_parquet_as_lines(rest_path)] == [l for l in original_body if l[7] != "UU"]
+    assert duckdb_kv_metadata_to_header(rest_path) == duckdb_kv_metadata_to_header(selected_path)
+
+
+@pytest.mark.parametrize("manifest_name", ["manifest.tsv", "manifest.yaml"])
+def test_manifest(tmp_path, manifest_name):
+    conditions = {
+        "cis.parquet": "chrom1 == chrom2",
+        "trans.pairs": "chrom1 != chrom2",
+        "uu.parquet": 'pair_type == "UU"',
+    }
+    manifest_path = os.path.join(tmp_path, manifest_name)
+    with open(manifest_path, "w") as f:
+        for output, condition in conditions.items():
+            if manifest_name.endswith(".yaml"):
+                f.write(f"- condition: '{condition}'\n  output: {os.path.join(tmp_path, output)}\n")
+            else:
+                f.write(f"{condition}\t{os.path.join(tmp_path, output)}\n")
+    rest_path = os.path.join(tmp_path, "rest.parquet")
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "select", "--manifest", manifest_path, mock_parquet_path, "--output-rest", rest_path]
+    )
+
+    original_body = [l.split("\t") for l in read_parquet_as_lines(mock_parquet_path)]
+    # a pair goes to every output whose condition it satisfies
+    assert [l.split("\t") for l in read_parquet_as_lines(os.path.join(tmp_path, "cis.parquet"))] == [l for l in original_body if l[1] == l[3]]
+    assert [l.split("\t") for l in read_parquet_as_lines(os.path.join(tmp_path, "uu.parquet"))] == [l for l in original_body if l[7] == "UU"]
+    with open(os.path.join(tmp_path, "trans.pairs")) as f:
+        trans = [l.rstrip("\n").split("\t")[:8] for l in f if not l.startswith("#")]
+    assert trans == [l[:8] for l in original_body if l[1] != l[3]]
+    # cis and trans cover all the pairs
+    assert read_parquet_as_lines(rest_path) == []
+
+
+@pytest.mark.parametrize(
+    "condition",
+    ['pair_type == "UU"', "chrom1 == chrom2 and abs(pos1 - pos2) < 1e6", 'regex_match(chrom1, "chr[0-9]+") and strand1 == "+"'],
+)
+def test_pairs_as_pairtools(tmp_path, condition):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    output_path = os.path.join(tmp_path, "selected.pairs.gz")
+    rest_path = os.path.join(tmp_path, "rest.pairs")
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "select", condition, mock_pairs_path, "-o", output_path, "--output-rest", rest_path]
+    )
+    pairtools_output_path = os.path.join(tmp_path, "pairtools_selected.pairs")
+    pairtools_rest_path = os.path.join(tmp_path, "pairtools_rest.pairs")
+    subprocess.check_output(
+        ["pairtools", "select", condition, mock_pairs_path, "-o", pairtools_output_path, "--output-rest", pairtools_rest_path],
+        stderr=subprocess.DEVNULL,
+    )
+
+    def read_body(path):
+        with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as f:
+            return [l for l in f if not l.startswith("#")]
+
+    assert read_body(output_path) == read_body(pairtools_output_path)
+    assert read_body(rest_path) == read_body(pairtools_rest_path)
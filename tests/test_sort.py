@@ -4,6 +4,8 @@ import sys
 import subprocess
 import pytest
 
+from pairs_to_parquet.lib import parquet_dataset
+
 testdir = os.path.dirname(os.path.realpath(__file__)) # __file__ is a built-in variable that Python automatically sets when it loads a module or script from a file.
 
 
@@ -87,3 +89,157 @@ def test_mock_pairs_parquet():
         raise e
 
 
+
+
+@pytest.mark.parametrize("if_sorted", ["verify", "skip", "resort"])
+def test_sorted_input(tmp_path, if_sorted):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    sorted_path = os.path.join(tmp_path, "sorted.parquet")
+    resorted_path = os.path.join(tmp_path, "resorted.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", sorted_path, mock_pairs_path])
+    output = subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "-v", "sort", "-o", resorted_path, "--if-sorted", if_sorted, sorted_path],
+        stderr=subprocess.STDOUT,
+    ).decode()
+
+    # the sort order is recorded in the header and the sort is skipped unless requested
+    assert "#sorted: chr1-chr2-pos1-pos2-pair_type\n" in open(resorted_path).readlines()
+    assert ("skipping the sort" in output) == (if_sorted != "resort")
+
+    sorted_body = [l for l in open(os.path.join(testdir, "data", "mock.pairs")) if not l.startswith("#")]
+    resorted_body = [l for l in open(resorted_path) if not l.startswith("#")]
+    assert sorted(resorted_body) == sorted(sorted_body)
+
+
+@pytest.mark.parametrize(
+    "sort_engine,output_name,nproc",
+    [("partitioned", "sorted.pairs", 1), ("partitioned", "sorted.parquet", 2), ("late", "sorted.pairs", 1), ("late", "sorted.parquet", 1)],
+)
+def test_sort_engines(tmp_path, sort_engine, output_name, nproc):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    global_path = os.path.join(tmp_path, "global.pairs")
+    partitioned_path = os.path.join(tmp_path, output_name)
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", global_path, mock_pairs_path])
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "sort", "-o", partitioned_path, "--sort-engine", sort_engine,
+         "--export-batch-size", "3", "--nproc", str(nproc), "--tmpdir", str(tmp_path), "--if-sorted", "resort", mock_pairs_path]
+    )
+    if output_name.endswith("parquet"):
+        converted_path = os.path.join(tmp_path, "converted.pairs")
+        subprocess.check_output(["python", "-m", "pairs_to_parquet", "parquet-to-csv", "-o", converted_path, partitioned_path])
+        partitioned_path = converted_path
+
+    # same order of the sort keys as the global sort, ties may come in any order
+    global_body = [l.split("\t") for l in open(global_path) if not l.startswith("#")]
+    partitioned_body = [l.split("\t") for l in open(partitioned_path) if not l.startswith("#")]
+    assert [l[1:8] for l in partitioned_body] == [l[1:8] for l in global_body]
+    assert sorted(partitioned_body) == sorted(global_body)
+    assert "#sorted: chr1-chr2-pos1-pos2-pair_type\n" in open(partitioned_path).readlines()
+    # the intermediates are removed
+    assert sorted(os.listdir(tmp_path)) == sorted(["global.pairs"] + (["sorted.parquet", "converted.pairs"] if output_name.endswith("parquet") else [output_name]))
+
+
+@pytest.mark.parametrize(
+    "chrom_order,expected",
+    [
+        ("lexicographic", ["chr1", "chr10", "chr2", "chrX"]),
+        ("header", ["chr2", "chrX", "chr10", "chr1"]),
+        ("natural", ["chr1", "chr2", "chr10", "chrX"]),
+        ("file", ["chrX", "chr10", "chr1", "chr2"]),
+    ],
+)
+@pytest.mark.parametrize("sort_engine", ["global", "partitioned"])
+def test_chrom_order(tmp_path, chrom_order, expected, sort_engine):
+    chroms = ["chr2", "chrX", "chr10", "chr1"]
+    input_path = os.path.join(tmp_path, "input.pairs")
+    with open(input_path, "w") as f:
+        f.write("## pairs format v1.0.0\n")
+        f.writelines(f"#chromsize: {chrom} 1000\n" for chrom in chroms)
+        f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type\n")
+        f.writelines(f"r{i}\t{chrom}\t{i}\t{chrom}\t{i}\t+\t+\tUU\n" for i, chrom in enumerate(chroms * 2))
+    chroms_path = os.path.join(tmp_path, "order.chrom.sizes")
+    with open(chroms_path, "w") as f:
+        f.write("chrX\t1000\nchr10\t1000\n")
+
+    output_path = os.path.join(tmp_path, "output.pairs")
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "sort", "-o", output_path, "--chrom-order", chrom_order,
+         "--chroms-path", chroms_path, "--sort-engine", sort_engine, "--tmpdir", str(tmp_path), input_path]
+    )
+    lines = open(output_path).readlines()
+    body_chroms = [l.split("\t")[1] for l in lines if not l.startswith("#")]
+    assert list(dict.fromkeys(body_chroms)) == expected
+    # the #chromsize lines follow the order, so that "header" keeps it
+    header_chroms = [l.split()[1] for l in lines if l.startswith("#chromsize")]
+    assert header_chroms == expected
+
+    if chrom_order != "lexicographic":
+        resorted_path = os.path.join(tmp_path, "resorted.pairs")
+        output = subprocess.check_output(
+            ["python", "-m", "pairs_to_parquet", "-v", "sort", "-o", resorted_path, "--chrom-order", "header", output_path],
+            stderr=subprocess.STDOUT,
+        ).decode()
+        assert "skipping the sort" in output
+
+
+def test_skip_other_chrom_order(tmp_path):
+    # a file sorted in natural order is not sorted lexicographically, although its #sorted field is the same
+    chroms = ["chr1", "chr2", "chr10", "chr11"]
+    input_path = os.path.join(tmp_path, "input.pairs")
+    with open(input_path, "w") as f:
+        f.write("## pairs format v1.0.0\n")
+        f.writelines(f"#chromsize: {chrom} 1000\n" for chrom in chroms)
+        f.write("#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type\n")
+        f.writelines(f"r{i}\t{chrom}\t{i}\t{chrom}\t{i}\t+\t+\tUU\n" for i, chrom in enumerate(chroms))
+    natural_path = os.path.join(tmp_path, "natural.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", natural_path, "--chrom-order", "natural", input_path])
+
+    output_path = os.path.join(tmp_path, "lexicographic.pairs")
+    output = subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "-v", "sort", "-o", output_path, "--if-sorted", "skip", natural_path],
+        stderr=subprocess.STDOUT,
+    ).decode()
+    assert "skipping the sort" not in output
+    body_chroms = [l.split("\t")[1] for l in open(output_path) if not l.startswith("#")]
+    assert body_chroms == ["chr1", "chr10", "chr11", "chr2"]
+
+    # the lexicographic output is skipped in turn
+    output = subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "-v", "sort", "-o", os.path.join(tmp_path, "again.pairs"), "--if-sorted", "skip", output_path],
+        stderr=subprocess.STDOUT,
+    ).decode()
+    assert "skipping the sort" in output
+
+
+@pytest.mark.parametrize("chrom_order", ["lexicographic", "natural"])
+def test_partition_by_chroms(tmp_path, chrom_order):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    global_path = os.path.join(tmp_path, "global.pairs")
+    dataset_path = os.path.join(tmp_path, "sorted")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "sort", "-o", global_path, "--chrom-order", chrom_order, mock_pairs_path])
+    subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "sort", "-o", dataset_path, "--partition-by-chroms", "--chrom-order", chrom_order,
+         "--nproc", "2", mock_pairs_path]
+    )
+
+    # one directory per chrom pair, the header in every file and in _header.parquet
+    global_body = [l.split("\t") for l in open(global_path) if not l.startswith("#")]
+    data_files = parquet_dataset.dataset_files(dataset_path)
+    partitions = [parquet_dataset.partition_values(os.path.relpath(path, dataset_path)) for path in data_files]
+    assert sorted((p["chrom1"], p["chrom2"]) for p in partitions) == sorted({(l[1], l[3]) for l in global_body})
+    assert all(os.path.basename(path) == "data_0.parquet" for path in data_files)
+    assert os.path.exists(os.path.join(dataset_path, "_header.parquet"))
+
+    # read back in the order of the sort, also by the other commands
+    converted_path = os.path.join(tmp_path, "converted.pairs")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "parquet-to-csv", "-o", converted_path, dataset_path])
+    converted_lines = open(converted_path).readlines()
+    assert [l.split("\t")[1:8] for l in converted_lines if not l.startswith("#")] == [l[1:8] for l in global_body]
+    assert "#sorted: chr1-chr2-pos1-pos2-pair_type\n" in converted_lines
+
+    output = subprocess.check_output(
+        ["python", "-m", "pairs_to_parquet", "-v", "sort", "-o", os.path.join(tmp_path, "resorted.parquet"),
+         "--chrom-order", chrom_order, dataset_path],
+        stderr=subprocess.STDOUT,
+    ).decode()
+    assert "skipping the sort" in output
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import pytest
+import pyarrow.parquet as pq
+
+from pairs_to_parquet.lib.duckdb_utils import duckdb_kv_metadata_to_header
+from pairs_to_parquet.lib.duckdb_split import output_path_for
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+
+
+def read_body(path):
+    return [l.rstrip("\n").split("\t") for l in open(path) if not l.startswith("#")]
+
+
+@pytest.mark.parametrize("max_writers", [1, 32])
+def test_split_by_pair_type(tmp_path, max_writers):
+    output_template = os.path.join(tmp_path, "split", "mock.{}.pairs")
+    subprocess.check_output([
+        "python", "-m", "pairs_to_parquet", "split", mock_pairs_path, "--by", "pair_type", "-o", output_template,
+        "--max-writers", str(max_writers),
+    ])
+
+    body = read_body(mock_pairs_path)
+    pair_types = sorted(set(l[7] for l in body))
+    assert sorted(os.listdir(os.path.join(tmp_path, "split"))) == sorted(f"mock.{pair_type}.pairs" for pair_type in pair_types)
+    for pair_type in pair_types:
+        output_path = output_template.replace("{}", pair_type)
+        # the pairs of every value in the order of the input, with the header of the input
+        assert read_body(output_path) == [l for l in body if l[7] == pair_type]
+        assert any("ID:pairs_to_parquet_split" in l for l in open(output_path))
+
+
+def test_split_cis_trans_parquet(tmp_path):
+    output_template = os.path.join(tmp_path, "mock.{}.parquet")
+    subprocess.check_output([
+        "python", "-m", "pairs_to_parquet", "split", mock_pairs_path, "--by", "cis_trans", "-o", output_template,
+    ])
+
+    body = read_body(mock_pairs_path)
+    kinds = {
+        "unmapped": lambda l: "!" in (l[1], l[3]),
+        "cis": lambda l: "!" not in (l[1], l[3]) and l[1] == l[3],
+        "trans": lambda l: "!" not in (l[1], l[3]) and l[1] != l[3],
+    }
+    assert all(any(kind(l) for l in body) for kind in kinds.values())
+    for name, kind in kinds.items():
+        output_path = output_template.replace("{}", name)
+        table = pq.read_table(output_path)
+        assert table.column("readID").to_pylist() == [l[0] for l in body if kind(l)]
+        assert any(l.startswith("#chromsize") for l in duckdb_kv_metadata_to_header(output_path))
+
+
+@pytest.mark.parametrize("max_writers", [1, 32])
+def test_split_missing_values(tmp_path, max_writers):
+    # every third pair without a pair type
+    input_path = os.path.join(tmp_path, "missing.pairs")
+    body = read_body(mock_pairs_path)
+    for i, l in enumerate(body):
+        if i % 3 == 2:
+            l[7] = ""
+    with open(input_path, "w") as f:
+        f.writelines(l for l in open(mock_pairs_path) if l.startswith("#"))
+        f.writelines("\t".join(l) + "\n" for l in body)
+    output_template = os.path.join(tmp_path, "split", "{}.pairs")
+    subprocess.check_output([
+        "python", "-m", "pairs_to_parquet", "split", input_path, "--by", "pair_type", "-o", output_template,
+        "--max-writers", str(max_writers),
+    ])
+
+    # the missing values get their own output, which no value can name
+    assert output_path_for(output_template, None) != output_path_for(output_template, "%NULL")
+    assert [l[0] for l in read_body(output_path_for(output_template, None))] == [l[0] for l in body if not l[7]]
+    assert sum(len(read_body(os.path.join(tmp_path, "split", name))) for name in os.listdir(os.path.join(tmp_path, "split"))) == len(body)
+
+
+def test_split_unknown_column(tmp_path):
+    result = subprocess.run(
+        ["python", "-m", "pairs_to_parquet", "split", mock_pairs_path, "--by", "foo", "-o", os.path.join(tmp_path, "{}.pairs")],
+        capture_output=True, text=True,
+    )
+    assert result.returncode != 0
+    assert "Cannot split by foo" in result.stderr
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import pytest
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def read_stats(path):
+    return dict(l.rstrip("\n").split("\t") for l in open(path))
+
+
+@pytest.mark.parametrize("input_name", ["mock.pairs", "mock.parquet"])
+def test_stats_as_pairtools(tmp_path, input_name):
+    mock_pairs_path = os.path.join(testdir, "data", "mock.pairs")
+    input_path = os.path.join(testdir, "data", input_name)
+    stats_path = os.path.join(tmp_path, "stats.txt")
+    pairtools_stats_path = os.path.join(tmp_path, "pairtools_stats.txt")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "stats", "-o", stats_path, input_path])
+    subprocess.check_output(["pairtools", "stats", "-o", pairtools_stats_path, mock_pairs_path], stderr=subprocess.DEVNULL)
+
+    stats = read_stats(stats_path)
+    assert stats == read_stats(pairtools_stats_path)
+    assert stats["total"] == "9" and stats["cis"] == "3" and stats["trans"] == "2" and stats["total_dups"] == "1"
+
+
+def test_stats_merge(tmp_path):
+    input_path = os.path.join(testdir, "data", "mock.pairs")
+    stats_path = os.path.join(tmp_path, "stats.txt")
+    merged_path = os.path.join(tmp_path, "merged.txt")
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "stats", "-o", stats_path, input_path])
+    subprocess.check_output(["python", "-m", "pairs_to_parquet", "stats", "--merge", "-o", merged_path, stats_path, stats_path])
+
+    merged = read_stats(merged_path)
+    assert merged["total"] == "18" and merged["chrom_freq/chr1/chr1"] == "6"
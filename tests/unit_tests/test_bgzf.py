@@ -0,0 +1,124 @@
+import gzip
+import os
+import struct
+import pytest
+import pysam
+
+from pairs_to_parquet.lib.bgzf import (
+    is_bgzf,
+    read_gzi_index,
+    scan_block_offsets,
+    block_offsets,
+    split_block_ranges,
+    inflate_blocks,
+    read_block_range,
+    compress_blocks,
+    BgzfWriter,
+    BGZF_BLOCK_DATA_SIZE,
+    BGZF_EOF,
+)
+
+
+DATA = b"".join(b"line%d\tchr1\t%d\n" % (i, i) for i in range(50000))
+
+
+@pytest.fixture
+def bgzf_path(tmp_path):
+    path = os.path.join(tmp_path, "data.gz")
+    with pysam.BGZFile(path, "wb") as f:
+        f.write(DATA)
+    return path
+
+
+# -------------------------------
+# TEST is_bgzf
+# -------------------------------
+def test_is_bgzf(bgzf_path, tmp_path):
+    plain_path = os.path.join(tmp_path, "plain.gz")
+    with gzip.open(plain_path, "wb") as f:
+        f.write(DATA)
+
+    assert is_bgzf(bgzf_path)
+    assert not is_bgzf(plain_path)
+
+
+# -------------------------------
+# TEST block offsets
+# -------------------------------
+def test_scan_block_offsets_and_gzi(bgzf_path):
+    offsets = scan_block_offsets(bgzf_path)
+    assert offsets[0] == 0
+    assert len(offsets) > 2
+    assert offsets == sorted(offsets)
+
+    # .gzi: number of entries, then (compressed, uncompressed) offsets of all blocks but the first
+    with open(bgzf_path + ".gzi", "wb") as f:
+        f.write(struct.pack("<Q", len(offsets) - 1))
+        for offset in offsets[1:]:
+            f.write(struct.pack("<QQ", offset, 0))
+
+    assert read_gzi_index(bgzf_path + ".gzi") == offsets
+    assert block_offsets(bgzf_path) == offsets
+
+
+# -------------------------------
+# TEST split_block_ranges + read_block_range
+# -------------------------------
+def test_split_block_ranges_roundtrip(bgzf_path):
+    offsets = scan_block_offsets(bgzf_path)
+    file_size = os.path.getsize(bgzf_path)
+    ranges = split_block_ranges(offsets, file_size, chunk_size=20000)
+
+    # contiguous and covering the whole file
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == file_size
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+    assert b"".join(read_block_range(bgzf_path, start, end) for start, end in ranges) == DATA
+
+
+def test_inflate_blocks_detects_corruption(bgzf_path):
+    with open(bgzf_path, "rb") as f:
+        data = bytearray(f.read())
+    block_size = scan_block_offsets(bgzf_path)[1]
+    # flip a bit of the stored CRC32 of the first block
+    data[block_size - 8] ^= 1
+
+    with pytest.raises(ValueError):
+        inflate_blocks(bytes(data[:block_size]))
+
+
+# -------------------------------
+# TEST BgzfWriter
+# -------------------------------
+@pytest.mark.parametrize("threads", [1, 4])
+def test_bgzf_writer_roundtrip(tmp_path, threads):
+    path = os.path.join(tmp_path, "out.gz")
+    with BgzfWriter(path, threads=threads, chunk_size=3 * BGZF_BLOCK_DATA_SIZE) as f:
+        # odd write sizes: blocks do not follow the write boundaries
+        for pos in range(0, len(DATA), 7777):
+            f.write(DATA[pos:pos + 7777])
+
+    assert is_bgzf(path)
+    assert gzip.open(path).read() == DATA
+    with pysam.BGZFile(path, "rb") as f:
+        assert f.read() == DATA
+    with open(path, "rb") as f:
+        assert f.read().endswith(BGZF_EOF)
+
+
+def test_bgzf_writer_failure(tmp_path):
+    # a truncated output must not end in the EOF marker: it is removed
+    path = os.path.join(tmp_path, "out.gz")
+    with pytest.raises(RuntimeError):
+        with BgzfWriter(path, threads=2, chunk_size=BGZF_BLOCK_DATA_SIZE) as f:
+            f.write(DATA)
+            raise RuntimeError("the input failed")
+    assert not os.path.exists(path)
+
+
+def test_compress_blocks_concatenate():
+    first, second = DATA[:100000], DATA[100000:]
+    stream = compress_blocks(first) + compress_blocks(second, level=1) + BGZF_EOF
+    assert inflate_blocks(stream) == DATA
+    assert gzip.decompress(stream) == DATA
@@ -0,0 +1,52 @@
+import bz2
+import os
+import pytest
+import pyarrow as pa
+
+from pairs_to_parquet.lib.compression import (
+    detect_codec,
+    compress_frame,
+    FrameWriter,
+)
+
+
+DATA = b"".join(b"line%d\tchr1\t%d\n" % (i, i) for i in range(50000))
+
+
+def test_detect_codec():
+    assert detect_codec("a.pairs.lz4") == "lz4"
+    assert detect_codec("a.pairs.zst") == "zstd"
+    assert detect_codec("a.pairs.bz2") == "bz2"
+    assert detect_codec("a.pairs.gz") is None
+    assert detect_codec("a.pairs") is None
+
+
+@pytest.mark.parametrize("codec,extension", [("lz4", "lz4"), ("zstd", "zst"), ("bz2", "bz2")])
+@pytest.mark.parametrize("threads", [1, 4])
+def test_frame_writer_roundtrip(tmp_path, codec, extension, threads):
+    path = os.path.join(tmp_path, f"data.pairs.{extension}")
+    # small frames -> many frames compressed concurrently
+    with FrameWriter(path, codec, threads=threads, level=3, chunk_size=10000) as f:
+        for pos in range(0, len(DATA), 7777):
+            f.write(DATA[pos:pos + 7777])
+
+    # concatenated frames are decompressed as one stream
+    assert pa.input_stream(path, compression="detect").read() == DATA
+
+
+@pytest.mark.parametrize("codec", ["lz4", "bz2"])
+def test_frame_writer_failure(tmp_path, codec):
+    # the output of a failed write is removed, it does not end in a valid frame
+    path = os.path.join(tmp_path, "data.pairs")
+    with pytest.raises(RuntimeError):
+        with FrameWriter(path, codec, threads=2, chunk_size=10000) as f:
+            f.write(DATA)
+            raise RuntimeError("the input failed")
+    assert not os.path.exists(path)
+
+
+def test_compress_frame_levels():
+    fast = compress_frame(DATA, "zstd", level=1)
+    small = compress_frame(DATA, "zstd", level=19)
+    assert len(small) < len(fast)
+    assert bz2.decompress(compress_frame(DATA, "bz2", level=1)) == DATA
@@ -0,0 +1,134 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from pairs_to_parquet.lib import csv_parquet_converter
+from pairs_to_parquet.lib.duckdb_dedup import dedup_batches, DedupStats
+
+
+# sorted by chrom1, chrom2 and pos1
+PAIRS = pa.table({
+    "readID": ["c", "a", "d", "g", "b", "e", "f"],
+    "chrom1": ["chr1", "chr1", "chr1", "chr1", "chr1", "chr1", "!"],
+    "pos1": [98, 100, 100, 101, 102, 110, 0],
+    "chrom2": ["chr2", "chr2", "chr2", "chr2", "chr2", "chr2", "chr2"],
+    "pos2": [503, 500, 500, 502, 501, 500, 500],
+    "strand1": ["+", "+", "-", "+", "+", "+", "+"],
+    "strand2": ["+", "+", "+", "+", "+", "+", "+"],
+    "pair_type": ["UU", "UU", "UU", "UU", "UU", "UU", "NU"],
+})
+
+
+def run_dedup(pairs=PAIRS, batch_size=1000, **kwargs):
+    reader = dedup_batches(pa.RecordBatchReader.from_batches(pairs.schema, pairs.to_batches(batch_size)), **kwargs)
+    return reader.read_all().select(["readID", "pair_type", "dedup_class"]).to_pylist()
+
+
+def brute_force(pairs, max_mismatch):
+    rows = pairs.to_pylist()
+    classes = []
+    for i, row in enumerate(rows):
+        if "!" in (row["chrom1"], row["chrom2"]):
+            classes.append("unmapped")
+            continue
+        same = lambda other: all(other[key] == row[key] for key in ("chrom1", "chrom2", "strand1", "strand2"))
+        near = lambda other: max(abs(other["pos1"] - row["pos1"]), abs(other["pos2"] - row["pos2"])) <= max_mismatch
+        classes.append("dup" if any(same(other) and near(other) for other in rows[:i]) else "nodup")
+    return classes
+
+
+def test_dedup_batches_max():
+    # the first pair of a group is kept in the input order, other strands and far pairs are not duplicates
+    assert [row["dedup_class"] for row in run_dedup()] == ["nodup", "dup", "nodup", "dup", "dup", "nodup", "unmapped"]
+    # the look-back reaches into the previous batches
+    assert [row["dedup_class"] for row in run_dedup(batch_size=1)] == ["nodup", "dup", "nodup", "dup", "dup", "nodup", "unmapped"]
+
+
+def test_dedup_batches_sum():
+    # a is 2 + 3 bp away from c, g and b are 1 + 2 and 2 + 1 bp away from a
+    assert [row["dedup_class"] for row in run_dedup(method="sum", max_mismatch=4)] == ["nodup", "nodup", "nodup", "dup", "dup", "nodup", "unmapped"]
+
+
+def test_dedup_batches_mark_dups():
+    assert [row["pair_type"] for row in run_dedup(max_mismatch=0, mark_dups=True)] == ["UU", "UU", "UU", "UU", "UU", "UU", "NU"]
+    assert [row["pair_type"] for row in run_dedup(mark_dups=True)] == ["UU", "DD", "UU", "DD", "DD", "UU", "NU"]
+
+
+def test_dedup_batches_not_chained():
+    # b is 3 bp away from a, c is 3 bp away from b only: c is kept, pairtools dedup would chain it to a
+    pairs = pa.table({"chrom1": ["chr1"] * 3, "pos1": [100, 103, 106], "chrom2": ["chr1"] * 3, "pos2": [200, 200, 200],
+        "strand1": ["+"] * 3, "strand2": ["+"] * 3, "pair_type": ["UU"] * 3, "readID": ["a", "b", "c"]})
+    assert [row["dedup_class"] for row in run_dedup(pairs)] == ["nodup", "dup", "dup"]
+
+
+def test_dedup_batches_random():
+    rng = np.random.default_rng(0)
+    size = 2000
+    pairs = pa.table({
+        "readID": [f"r{i}" for i in range(size)],
+        "chrom1": np.sort(rng.choice(["chr1", "chr2"], size)),
+        "pos1": rng.integers(0, 200, size),
+        "chrom2": rng.choice(["chr1", "chr3"], size),
+        "pos2": rng.integers(0, 50, size),
+        "strand1": rng.choice(["+", "-"], size),
+        "strand2": rng.choice(["+", "-"], size),
+        "pair_type": ["UU"] * size,
+    })
+    pairs = pairs.sort_by([("chrom1", "ascending"), ("chrom2", "ascending"), ("pos1", "ascending")])
+    expected = brute_force(pairs, 3)
+    for batch_size in (7, 100, size):
+        assert [row["dedup_class"] for row in run_dedup(pairs, batch_size)] == expected
+
+
+def test_dedup_batches_hotspot():
+    # thousands of pairs at one position over several batches, and a few next to it
+    con = duckdb.connect()
+    pairs = con.execute("""
+        SELECT 'r' || i AS readID, 'chr1' AS chrom1, 100 + (i >= 4995)::INT AS pos1, 'chr2' AS chrom2,
+            500 AS pos2, '+' AS strand1, '+' AS strand2, 'UU' AS pair_type
+        FROM range(5000) t(i) ORDER BY i
+    """).fetch_record_batch().read_all()
+    rows = run_dedup(pairs, batch_size=700)
+    assert [row["readID"] for row in rows] == [f"r{i}" for i in range(5000)]
+    assert [row["dedup_class"] for row in rows] == ["nodup"] + ["dup"] * 4999
+
+
+def test_dedup_batches_unsorted():
+    unsorted = PAIRS.take([1, 0, 2, 3, 4, 5, 6])
+    with pytest.raises(ValueError, match="sorted"):
+        run_dedup(unsorted)
+    # a chrom pair that comes back in a later batch
+    pairs = pa.concat_tables([PAIRS.slice(0, 6), PAIRS.slice(0, 1).set_column(3, "chrom2", pa.array(["chr3"])), PAIRS.slice(0, 1)])
+    with pytest.raises(ValueError, match="twice"):
+        run_dedup(pairs, batch_size=1)
+
+
+def test_dedup_batches_invalid():
+    with pytest.raises(ValueError):
+        run_dedup(method="min")
+    with pytest.raises(ValueError):
+        run_dedup(max_mismatch=-1)
+
+
+def test_dedup_stats():
+    stats = DedupStats()
+    stats(pa.table({"dedup_class": ["dup", "nodup", "nodup"]}))
+    stats(pa.table({"dedup_class": ["unmapped", "nodup"]}))
+    assert stats.to_dict() == {
+        "total": 5, "total_unmapped": 1, "total_mapped": 4, "total_dups": 1, "total_nodups": 3, "summary/frac_dups": 0.25,
+    }
+
+
+def test_write_split_outputs(tmp_path):
+    con = duckdb.connect()
+    con.register("pairs", PAIRS)
+    header = ["## pairs format v1.0.0", "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type"]
+    first, second = str(tmp_path / "first.parquet"), str(tmp_path / "second.pairs")
+    outputs = {"x": (first, header), "y": (second, header), "z": (first, header), "w": ("", header)}
+    query = "SELECT *, ['x', 'y', 'z', 'w'][(row_number() OVER () - 1) % 4 + 1] AS label FROM pairs"
+    csv_parquet_converter.write_split_outputs(con, query, "label", outputs, export_batch_size=2, export_queue_depth=1)
+
+    # labels sharing a path share the output, in the order of the query
+    assert duckdb.sql(f"SELECT readID FROM '{first}'").fetchall() == [("c",), ("d",), ("b",), ("f",)]
+    assert [l.split("\t")[0] for l in open(second) if not l.startswith("#")] == ["a", "e"]
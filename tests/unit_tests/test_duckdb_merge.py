@@ -0,0 +1,88 @@
+import gzip
+import os
+import shutil
+
+import pytest
+import pyarrow as pa
+
+from pairs_to_parquet.lib import csv_parquet_converter
+from pairs_to_parquet.lib.duckdb_merge import (
+    merge_key_projection,
+    merge_sorted_tables,
+    merge_headers,
+    merge_sorted_files,
+    _checked_tables,
+)
+
+mock_pairs_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data", "mock.pairs")
+
+
+def sorted_input(chroms, positions, name, batch_size):
+    table = pa.table({
+        "name": [f"{name}{i}" for i in range(len(chroms))],
+        "merge_key_0": chroms,
+        "merge_key_1": positions,
+    })
+    return iter(table.to_batches(batch_size))
+
+
+def test_merge_key_projection():
+    column_types = {"chrom1": "CHROM_TYPE", "pos1": "INTEGER", "pair_type": "ALIGNMENT_TYPE"}
+    assert merge_key_projection(["chrom1", "pos1", "pair_type"], column_types) == (
+        "enum_code(CAST(chrom1 AS CHROM_TYPE)) AS merge_key_0, pos1 AS merge_key_1, "
+        "enum_code(CAST(pair_type AS ALIGNMENT_TYPE)) AS merge_key_2"
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 10])
+def test_merge_sorted_tables(batch_size):
+    inputs = [
+        (pa.Table.from_batches([b]) for b in sorted_input(["chr1", "chr1", "chr2", None], [1, 5, 3, 1], "a", batch_size)),
+        (pa.Table.from_batches([b]) for b in sorted_input(["chr1", "chr10", "chr2"], [5, 1, 2], "b", batch_size)),
+        (pa.Table.from_batches([b]) for b in sorted_input([], [], "c", batch_size)),
+    ]
+    merged = pa.concat_tables(list(merge_sorted_tables(inputs, 2)))
+    assert merged.column_names == ["name"]
+    # ties keep the order of the inputs, NULLs come last
+    assert merged.column("name").to_pylist() == ["a0", "a1", "b0", "b1", "b2", "a2", "a3"]
+
+
+def test_checked_tables():
+    tables = (pa.Table.from_batches([b]) for b in sorted_input(["chr1", "chr2", "chr1"], [1, 1, 1], "a", 2))
+    with pytest.raises(ValueError):
+        list(_checked_tables(tables, 2, "a.pairs"))
+
+
+def test_merge_headers():
+    header = [
+        "## pairs format v1.0.0",
+        "#sorted: chr1-chr2-pos1-pos2",
+        "#chromsize: chr1 100",
+        "#samheader: @PG\tID:bwa\tPN:bwa",
+        "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type",
+    ]
+    other_header = [l.replace("chr1 100", "chr2 50") for l in header[:1] + header[2:]]
+    merged = merge_headers([header, other_header], ["chrom1", "chrom2", "pos1", "pos2", "pair_type"], readid="drop")
+    assert "#sorted: chr1-chr2-pos1-pos2-pair_type" in merged
+    assert "#chromsize: chr1 100" in merged and "#chromsize: chr2 50" in merged
+    assert sum(l.startswith("#samheader: @PG\tID:pairs_to_parquet_merge") for l in merged) == 2
+    assert merged[-1] == "#columns: chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type"
+
+
+def test_merge_closes_inputs_on_failure(tmp_path, monkeypatch):
+    input_paths = []
+    for name in ("a", "b"):
+        input_paths.append(os.path.join(tmp_path, f"{name}.pairs.gz"))
+        with open(mock_pairs_path, "rb") as f_in, gzip.open(input_paths[-1], "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+    closed = []
+    close_input = csv_parquet_converter.close_input
+    monkeypatch.setattr(csv_parquet_converter, "close_input", lambda stream, path: closed.append(path) or close_input(stream, path))
+
+    # the output directory does not exist
+    with pytest.raises(Exception):
+        merge_sorted_files(
+            input_paths, os.path.join(tmp_path, "missing", "merged.pairs"), ["chrom1", "chrom2", "pos1", "pos2"],
+            input_reader="stream",
+        )
+    assert closed == input_paths
@@ -0,0 +1,204 @@
+import os
+import pytest
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+from pairs_to_parquet.lib.duckdb_sort import (
+    sorted_field,
+    parse_sorted_field,
+    extract_sort_keys,
+    set_sorted_field,
+    is_sorted_by,
+    _order_violations,
+    verify_sorted,
+    parse_memory_limit,
+    split_memory_limit,
+    partition_expression,
+    partitioned_sort,
+    late_materialization_sort,
+    _key_tuples,
+    _merge_runs,
+)
+from pairs_to_parquet.lib import duckdb_utils
+
+SORT_KEYS = ["chrom1", "chrom2", "pos1", "pos2", "pair_type"]
+HEADER = [
+    "## pairs format v1.0.0",
+    "#shape: upper triangle",
+    "#chromsize: chr1 100",
+    "#chromsize: chr2 100",
+    "#chromsize: chr10 100",
+    "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type",
+]
+
+
+def test_sorted_field_roundtrip():
+    assert sorted_field(SORT_KEYS) == "chr1-chr2-pos1-pos2-pair_type"
+    assert parse_sorted_field("chr1-chr2-pos1-pos2-pair_type") == SORT_KEYS
+    # pairtools header
+    assert parse_sorted_field(" chr1-chr2-pos1-pos2") == SORT_KEYS[:4]
+
+
+def test_set_and_extract_sorted_field():
+    assert extract_sort_keys(HEADER) is None
+
+    header = set_sorted_field(HEADER, SORT_KEYS)
+    assert header[1] == "#sorted: chr1-chr2-pos1-pos2-pair_type"
+    assert extract_sort_keys(header) == SORT_KEYS
+
+    # an existing field is replaced
+    header = set_sorted_field(header, ["chrom2"])
+    assert [l for l in header if l.startswith("#sorted")] == ["#sorted: chr2"]
+
+
+def test_is_sorted_by():
+    assert is_sorted_by(SORT_KEYS, SORT_KEYS[:4])
+    assert not is_sorted_by(SORT_KEYS[:4], SORT_KEYS)
+    assert not is_sorted_by(["chrom2", "chrom1"], ["chrom1"])
+    assert not is_sorted_by(None, ["chrom1"])
+
+
+def test_order_violations():
+    table = pa.table({"a": [1, 1, 2, 2], "b": [5, 6, 0, 1]})
+    assert not _order_violations(table, None)
+    assert _order_violations(pa.table({"a": [1, 1], "b": [6, 5]}), None)
+    # the step between two batches counts as well
+    assert _order_violations(pa.table({"a": [1], "b": [0]}), table.slice(3))
+    assert not _order_violations(pa.table({"a": [2], "b": [1]}), table.slice(3))
+
+
+def write_pairs_parquet(path, rows):
+    con = duckdb.connect()
+    con.execute(
+        "CREATE TABLE pairs (readID VARCHAR, chrom1 VARCHAR, pos1 INTEGER, chrom2 VARCHAR, pos2 INTEGER, "
+        "strand1 VARCHAR, strand2 VARCHAR, pair_type VARCHAR)"
+    )
+    con.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    con.execute(f"COPY pairs TO '{path}' (FORMAT PARQUET)")
+
+
+def test_verify_sorted_parquet(tmp_path):
+    # chr10 < chr2 lexicographically, pair types follow the ENUM order (UU < RU < DD), not the alphabet
+    rows = [
+        ("r1", "chr1", 5, "chr1", 10, "+", "+", "UU"),
+        ("r2", "chr1", 5, "chr1", 10, "+", "+", "RU"),
+        ("r3", "chr1", 5, "chr1", 10, "+", "+", "DD"),
+        ("r4", "chr10", 1, "chr2", 1, "+", "+", "UU"),
+        ("r5", "chr2", 1, "chr2", 1, "+", "+", "UU"),
+    ]
+    sorted_path = os.path.join(tmp_path, "sorted.parquet")
+    write_pairs_parquet(sorted_path, rows)
+    assert verify_sorted(sorted_path, HEADER, SORT_KEYS)
+
+    unsorted_path = os.path.join(tmp_path, "unsorted.parquet")
+    write_pairs_parquet(unsorted_path, [rows[1], rows[0]] + rows[2:])
+    assert not verify_sorted(unsorted_path, HEADER, SORT_KEYS)
+    # but it is sorted by the positions
+    assert verify_sorted(unsorted_path, HEADER, SORT_KEYS[:4])
+
+
+def test_verify_sorted_unsupported_input():
+    assert verify_sorted("mock.pairs.lz4", HEADER, SORT_KEYS) is None
+
+
+def test_split_memory_limit():
+    assert split_memory_limit("2G", 4) == "500000000B"
+    assert split_memory_limit("1GiB", 2) == f"{2 ** 29}B"
+    assert split_memory_limit(None, 4) is None
+    assert parse_memory_limit("1.5MB") == 1_500_000
+    with pytest.raises(ValueError):
+        split_memory_limit("2 apples", 2)
+
+
+def test_partition_expression():
+    column_types = duckdb_utils.classify_column_types_by_name(["chrom1", "pos1", "chrom2", "pos2"])
+    assert partition_expression(["pos1", "chrom1"], column_types, 3) is None
+    assert partition_expression(["chrom1", "pos1"], column_types, 3, 2) == "(coalesce(CAST(enum_code(chrom1) AS BIGINT), 3)) // 2"
+    assert partition_expression(["chrom1", "chrom2"], column_types, 3, 1024) == (
+        "(coalesce(CAST(enum_code(chrom1) AS BIGINT), 3) * 4 + coalesce(CAST(enum_code(chrom2) AS BIGINT), 3)) // 1"
+    )
+
+
+@pytest.mark.parametrize("n_partitions", [1, 3, 1024])
+def test_partitioned_sort(tmp_path, n_partitions):
+    rows = [
+        ("r1", "chr2", 1, "chr2", 1, "+", "+", "UU"),
+        ("r2", "chr1", 5, "chr1", 10, "+", "+", "DD"),
+        ("r3", "chr10", 1, "chr2", 1, "+", "+", "UU"),
+        ("r4", "chr1", 5, "chr1", 10, "+", "+", "UU"),
+        ("r5", "chr1", 7, "chr10", 1, "-", "+", "UU"),
+    ]
+    input_path = os.path.join(tmp_path, "input.parquet")
+    write_pairs_parquet(input_path, rows)
+
+    con = duckdb_utils.setup_duckdb_connection(enable_progress_bar=False, enable_profiling="no_output", numb_threads=1)
+    con, _ = duckdb_utils.setup_duckdb_types_from_header(con, HEADER)
+    query = f"SELECT * REPLACE (CAST(chrom1 AS CHROM_TYPE) AS chrom1, CAST(chrom2 AS CHROM_TYPE) AS chrom2, CAST(pair_type AS ALIGNMENT_TYPE) AS pair_type) FROM read_parquet('{input_path}')"
+    sorted_query = partitioned_sort(con, query, HEADER, SORT_KEYS, str(tmp_path), 1, "100MB", n_partitions)
+
+    expected = con.execute(query + duckdb_utils.sort_query(SORT_KEYS)).fetchall()
+    assert con.execute(sorted_query).fetchall() == expected
+    assert [row[0] for row in expected] == ["r4", "r2", "r5", "r3", "r1"]
+
+    # the sort does not start with a chrom column
+    assert partitioned_sort(con, query, HEADER, ["pos1"], str(tmp_path)) is None
+
+
+def test_key_tuples():
+    keys = pa.table({"key_0": [2, 1, None, 1], "key_1": ["a", None, "a", "b"]})
+    tuples = _key_tuples(keys)
+    # NULLs last, in every key column
+    assert sorted(range(4), key=lambda i: tuples[i]) == [3, 1, 0, 2]
+
+
+def test_merge_runs(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(3):
+        keys = np.sort(rng.integers(0, 20, 50))
+        # the value tells the key and the row
+        table = pa.table({"key_0": keys, "value": keys * 1000 + np.arange(50) * 3 + i})
+        paths.append(str(tmp_path / f"run_{i}.arrow"))
+        with pa.ipc.new_file(paths[-1], table.schema) as writer:
+            writer.write_table(table, max_chunksize=7)
+    batches = list(_merge_runs(paths, ["key_0"], 10))
+    values = pa.Table.from_batches(batches).column("value").to_pylist()
+    assert max(batch.num_rows for batch in batches) <= 10 and batches[0].schema.names == ["value"]
+    assert sorted(values) == sorted(v for path in paths for v in pa.ipc.open_file(path).read_all().column("value").to_pylist())
+    assert [value // 1000 for value in values] == sorted(value // 1000 for value in values)
+
+
+@pytest.mark.parametrize("batch_size, run_bytes", [(1, None), (2, None), (1000, None), (1, 1), (2, 1)])
+def test_late_materialization_sort(tmp_path, batch_size, run_bytes):
+    rows = [
+        ("r1", "chr2", 1, "chr2", 1, "+", "+", "UU"),
+        ("r2", "chr1", 5, "chr1", 10, "+", "+", "DD"),
+        ("r3", "chr10", 1, "chr2", 1, "+", "+", "UU"),
+        ("r4", "chr1", 5, "chr1", 10, "+", "+", "UU"),
+        ("r5", "chr1", 7, "chr10", 1, "-", "+", "UU"),
+    ]
+    input_path = os.path.join(tmp_path, "input.parquet")
+    write_pairs_parquet(input_path, rows)
+
+    con = duckdb_utils.setup_duckdb_connection(memory_limit="200MB", enable_progress_bar=False, enable_profiling="no_output", numb_threads=1)
+    con, _ = duckdb_utils.setup_duckdb_types_from_header(con, HEADER)
+    query = f"SELECT * REPLACE (CAST(chrom1 AS CHROM_TYPE) AS chrom1, CAST(chrom2 AS CHROM_TYPE) AS chrom2, CAST(pair_type AS ALIGNMENT_TYPE) AS pair_type) FROM read_parquet('{input_path}')"
+    sorted_query = late_materialization_sort(con, query, HEADER, SORT_KEYS, str(tmp_path), batch_size, run_bytes=run_bytes)
+    # the memory limit of con is left as it is
+    assert parse_memory_limit(con.execute("SELECT current_setting('memory_limit')").fetchone()[0]) > 100_000_000
+    # runs of at most 1 byte: one run per batch, merged
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("run_")]) == (-(-5 // batch_size) if run_bytes else 0)
+
+    expected = con.execute(query + duckdb_utils.sort_query(SORT_KEYS)).fetchall()
+    assert con.execute(sorted_query).fetchall() == expected
+    assert [row[0] for row in expected] == ["r4", "r2", "r5", "r3", "r1"]
+
+
+def test_late_materialization_sort_empty(tmp_path):
+    con = duckdb_utils.setup_duckdb_connection(enable_progress_bar=False, enable_profiling="no_output", numb_threads=1)
+    con, _ = duckdb_utils.setup_duckdb_types_from_header(con, HEADER)
+    query = "SELECT 'r1' AS readID, 'chr1' AS chrom1, 1 AS pos1, 'chr1' AS chrom2, 2 AS pos2, 'UU' AS pair_type WHERE false"
+    sorted_query = late_materialization_sort(con, query, HEADER, SORT_KEYS, str(tmp_path))
+    assert con.execute(sorted_query).fetchall() == []
+    assert [column[0] for column in con.execute(sorted_query).description] == ["readID", "chrom1", "pos1", "chrom2", "pos2", "pair_type"]
@@ -0,0 +1,35 @@
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+from pairtools.lib.stats import PairCounter
+
+from pairs_to_parquet.lib.duckdb_stats import dist_bin_boundaries, stats_query, add_aggregates
+
+
+PAIRS = pa.table({
+    "chrom1": ["chr1", "chr1", "chr1", "chr1", "chr1", "chr1", "!", "!"],
+    "pos1": [10, 10, 10, 5000, 10, 10, 0, 0],
+    "chrom2": ["chr1", "chr1", "chr1", "chr1", "chr2", "chr1", "chr1", "!"],
+    "pos2": [10, 11, 50_000, 10, 30, 12, 5, 0],
+    "strand1": ["+", "+", "-", "+", "+", "+", "-", "-"],
+    "strand2": ["+", "+", "+", "-", "+", "+", "+", "-"],
+    "pair_type": ["UU", "UU", "UR", "RU", "UU", "DD", "NU", "WW"],
+})
+
+
+def test_dist_bin_boundaries():
+    assert dist_bin_boundaries(np.array([0, 1, 2, 3, 10])) == {0: 0, 1: 1, 2: 2, 9: 3}
+
+
+def test_add_aggregates_as_add_pair():
+    con = duckdb.connect()
+    con.register("pairs", PAIRS)
+    counter = PairCounter()
+    add_aggregates(counter, con.execute(stats_query("SELECT * FROM pairs", counter._dist_bins)).fetchall())
+
+    expected = PairCounter()
+    for row in PAIRS.to_pylist():
+        expected.add_pair(row["chrom1"], row["pos1"], row["strand1"], row["chrom2"], row["pos2"], row["strand2"], row["pair_type"])
+    assert dict(counter.flatten()) == dict(expected.flatten())
+    assert counter["cis_40kb+"] == 1 and counter["total_single_sided_mapped"] == 1
@@ -3,17 +3,27 @@ import json
 import pytest
 import duckdb
 import pyarrow as pa
+import pyarrow.parquet as pq
 from unittest.mock import MagicMock, patch
 
 from pairs_to_parquet.lib.duckdb_utils import (
     setup_duckdb_connection,
     setup_duckdb_types,
+    setup_duckdb_types_from_header,
     classify_column_types_by_name,
+    cast_projection,
     decode_parquet_metadata_duckdb_as_dict,
     header_to_kv_metadata,
     duckdb_kv_metadata_to_header,
     write_parquet_to_csv,
+    parquet_copy_options,
     sort_query,
+    parquet_writer_options,
+    write_parquet_stream,
+    summary_stats,
+    SummaryStats,
+    read_summary_stats,
+    SUMMARY_STATS_KEY,
 )
 
 
@@ -52,6 +62,23 @@ def test_setup_duckdb_types_enum_creation():
     assert ("." ,) in con.execute("SELECT unnest(enum_range(NULL::READS_TYPE))").fetchall()
 
 
+def test_setup_duckdb_types_from_header():
+    con = duckdb.connect(":memory:")
+    header = ["## pairs format v1.0.0", "#chromsize: chr2 100", "#chromsize: chr1 200", "#columns: readID chrom1"]
+    con, chromsizes = setup_duckdb_types_from_header(con, header)
+
+    assert dict(chromsizes) == {"chr2": 100, "chr1": 200}
+    # sorted chromosomes after the unknown one, compared as integers
+    res = con.execute("SELECT unnest(enum_range(NULL::CHROM_TYPE))").fetchall()
+    assert res == [("!",), ("chr1",), ("chr2",)]
+    assert con.execute("SELECT 'chr1'::CHROM_TYPE < 'chr2'::CHROM_TYPE").fetchone()[0]
+
+    # headers without chromsizes (e.g. Parquet files written by other tools) still get the types
+    con, chromsizes = setup_duckdb_types_from_header(con, ["#columns: readID chrom1"])
+    assert len(chromsizes) == 0
+    assert con.execute("SELECT unnest(enum_range(NULL::CHROM_TYPE))").fetchall() == [("!",)]
+
+
 # --------------------------------------------------------------------
 # TEST classify_column_types_by_name
 # --------------------------------------------------------------------
@@ -72,6 +99,34 @@ def test_classify_column_types_by_name_with_known_and_unknown(monkeypatch):
     assert result["unknown"] == "STRING"
 
 
+def test_classify_column_types_by_name_compact():
+    cols = ["readID", "chrom1", "pos1", "pos2", "mapq1", "pos51", "read_len1", "cigar1", "unknown"]
+    result = classify_column_types_by_name(cols, compact_schema=True)
+
+    assert result["chrom1"] == "CHROM_TYPE"
+    assert result["pos1"] == "UINTEGER"
+    assert result["pos2"] == "UINTEGER"
+    assert result["mapq1"] == "UTINYINT"
+    assert result["pos51"] == "UINTEGER"
+    assert result["read_len1"] == "INTEGER"
+    assert result["cigar1"] == "STRING"
+    assert result["readID"] == "STRING"
+    assert result["unknown"] == "STRING"
+
+
+# --------------------------------------------------------------------
+# TEST cast_projection
+# --------------------------------------------------------------------
+def test_cast_projection_readid():
+    column_types = {"readID": "STRING", "pos1": "UINTEGER", "chrom1": None}
+
+    assert cast_projection(column_types) == "CAST(readID AS STRING) AS readID, CAST(pos1 AS UINTEGER) AS pos1, chrom1"
+    assert cast_projection(column_types, readid="drop") == "CAST(pos1 AS UINTEGER) AS pos1, chrom1"
+    assert cast_projection(column_types, readid="hash").startswith("hash(readID) AS readID, ")
+    with pytest.raises(ValueError):
+        cast_projection(column_types, readid="encrypt")
+
+
 # --------------------------------------------------------------------
 # TEST decode_parquet_metadata_duckdb_as_dict
 # --------------------------------------------------------------------
@@ -132,6 +187,67 @@ def test_write_parquet_to_csv(monkeypatch):
     fake_write.assert_called_once()
 
 
+@pytest.mark.parametrize("queue_depth", [0, 1, 4])
+def test_write_parquet_to_csv_keeps_order(queue_depth):
+    tables = [pa.table({"x": list(range(i * 10, i * 10 + 10)), "y": ["a"] * 10}) for i in range(20)]
+    sink = pa.BufferOutputStream()
+    write_parquet_to_csv(iter(tables), sink, queue_depth=queue_depth)
+
+    lines = sink.getvalue().to_pybytes().decode().splitlines()
+    assert lines == [f"{x}\ta" for x in range(200)]
+
+
+def test_write_parquet_to_csv_propagates_errors():
+    def failing_iterator():
+        yield pa.table({"x": [1]})
+        raise RuntimeError("query failed")
+
+    with pytest.raises(RuntimeError, match="query failed"):
+        write_parquet_to_csv(failing_iterator(), pa.BufferOutputStream(), queue_depth=2)
+
+
+# --------------------------------------------------------------------
+# TEST parquet_copy_options
+# --------------------------------------------------------------------
+def test_parquet_copy_options():
+    assert parquet_copy_options() == ""
+    # unrelated CLI options are ignored
+    assert parquet_copy_options(nproc_in=3) == ""
+
+    options = parquet_copy_options(
+        parquet_compression="zstd",
+        parquet_compression_level=9,
+        row_group_size=50000,
+        parquet_dictionary=False,
+        parquet_dictionary_page_size=1024,
+    )
+    assert options == (
+        ", COMPRESSION zstd, COMPRESSION_LEVEL 9, ROW_GROUP_SIZE 50000"
+        ", DICTIONARY_SIZE_LIMIT 0, STRING_DICTIONARY_PAGE_SIZE_LIMIT 1024"
+    )
+    assert parquet_copy_options(parquet_compression="none") == ", COMPRESSION uncompressed"
+
+
+def test_parquet_copy_options_errors():
+    with pytest.raises(ValueError):
+        parquet_copy_options(parquet_compression="lzma")
+    with pytest.raises(ValueError):
+        parquet_copy_options(parquet_compression="snappy", parquet_compression_level=3)
+
+
+def test_parquet_copy_options_duckdb(tmp_path):
+    import pyarrow.parquet as pq
+
+    output = str(tmp_path / "out.parquet")
+    options = parquet_copy_options(parquet_compression="zstd", row_group_size=4096, parquet_dictionary=False)
+    duckdb.execute(f"COPY (SELECT range AS x, range::VARCHAR AS y FROM range(10000)) TO '{output}' (FORMAT PARQUET{options})")
+
+    metadata = pq.ParquetFile(output).metadata
+    assert metadata.num_row_groups == 3
+    assert metadata.row_group(0).column(1).compression == "ZSTD"
+    assert "PLAIN" in metadata.row_group(0).column(1).encodings
+
+
 # --------------------------------------------------------------------
 # TEST sort_query
 # --------------------------------------------------------------------
@@ -139,3 +255,68 @@ def test_sort_query():
     result = sort_query(["chrom1", "pos1"])
     assert result.strip().startswith("ORDER BY")
     assert "chrom1" in result and "pos1" in result
+
+
+# --------------------------------------------------------------------
+# TEST summary_stats
+# --------------------------------------------------------------------
+def test_summary_stats(tmp_path):
+    path = str(tmp_path / "pairs.parquet")
+    query = """
+        SELECT * FROM (VALUES ('chr1', 5, 'chr1', 50, 'UU'), ('chr1', 1, 'chr2', 7, 'UU'), ('!', 0, 'chr2', 3, 'NU'))
+            t(chrom1, pos1, chrom2, pos2, pair_type)
+    """
+    duckdb.sql(f"COPY ({query}) TO '{path}' (FORMAT PARQUET)")
+    assert read_summary_stats(path) is None
+
+    expected = {
+        "total": 3, "cis": 1, "trans": 1,
+        "pair_types": {"UU": 2, "NU": 1},
+        "chrom_pairs": {"chr1": {"chr1": 1, "chr2": 1}, "!": {"chr2": 1}},
+        "positions": {"chr1": [1, 50], "chr2": [3, 7]},
+    }
+    columns = ["chrom1", "pos1", "chrom2", "pos2", "pair_type"]
+    assert summary_stats(path, columns) == expected
+    # the same from the batches as they are written, one row per batch
+    stats = SummaryStats(columns)
+    for batch in duckdb.sql(query).fetch_record_batch(1):
+        stats.update(pa.Table.from_batches([batch]))
+    assert stats.result() == expected
+
+    # without pair_type and positions
+    assert summary_stats(path, ["chrom1", "chrom2"]) == {
+        "total": 3, "cis": 1, "trans": 1, "chrom_pairs": {"chr1": {"chr1": 1, "chr2": 1}, "!": {"chr2": 1}},
+    }
+    assert summary_stats(path, ["pos1"]) == {"total": 3}
+
+
+# --------------------------------------------------------------------
+# TEST write_parquet_stream
+# --------------------------------------------------------------------
+def test_write_parquet_stream(tmp_path):
+    path = str(tmp_path / "pairs.parquet")
+    reader = duckdb.sql("SELECT range AS pos1 FROM range(10)").fetch_record_batch(3)
+    stats = SummaryStats(["pos1"])
+    write_parquet_stream(
+        reader, path, lambda: {SUMMARY_STATS_KEY: json.dumps(stats.result())}, on_table=stats.update, row_group_size=4,
+        parquet_compression="zstd",
+    )
+    metadata = pq.read_metadata(path)
+    # the row groups follow row_group_size, not the batches
+    assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [4, 4, 2]
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    assert read_summary_stats(path) == {"total": 10}
+    assert duckdb.sql(f"SELECT sum(pos1) FROM '{path}'").fetchone()[0] == 45
+
+    # an empty query still has the schema
+    write_parquet_stream(duckdb.sql("SELECT 1 AS a WHERE false").fetch_record_batch(), path, lambda: {"format": "pairs"})
+    assert pq.read_schema(path).names == ["a"] and pq.read_metadata(path).num_rows == 0
+
+
+def test_parquet_writer_options():
+    assert parquet_writer_options() == {"compression": "snappy", "use_dictionary": True}
+    assert parquet_writer_options(parquet_compression="ZSTD", parquet_compression_level=5, parquet_dictionary=False) == {
+        "compression": "zstd", "compression_level": 5, "use_dictionary": False,
+    }
+    with pytest.raises(ValueError):
+        parquet_writer_options(parquet_compression="snappy", parquet_compression_level=5)
@@ -2,6 +2,8 @@ import pytest
 from pairs_to_parquet.lib.header_metadata import (
     extract_field_names,
     extract_sorted_chromosome_field,
+    extract_ordered_chromosome_field,
+    set_chromsize_order,
     metadata_dict_to_header_list,
 )
 
@@ -52,6 +54,37 @@ def test_extract_sorted_chromosome_field_empty():
     assert extract_sorted_chromosome_field({}) == ()
 
 
+# -------------------------------
+# TEST extract_ordered_chromosome_field
+# -------------------------------
+CHROMSIZES = {"chr2": 200, "chrX": 50, "chr10": 100, "chr1": 300}
+
+
+def test_extract_ordered_chromosome_field():
+    assert extract_ordered_chromosome_field(CHROMSIZES) == ("chr1", "chr10", "chr2", "chrX")
+    assert extract_ordered_chromosome_field(CHROMSIZES, "header") == ("chr2", "chrX", "chr10", "chr1")
+    assert extract_ordered_chromosome_field(CHROMSIZES, "natural") == ("chr1", "chr2", "chr10", "chrX")
+
+
+def test_extract_ordered_chromosome_field_file(tmp_path):
+    chroms_path = tmp_path / "order.chrom.sizes"
+    chroms_path.write_text("chrX\t50\nchr2\t200\nchrUn\t10\n")
+    # chromosomes missing from the file follow lexicographically
+    assert extract_ordered_chromosome_field(CHROMSIZES, "file", str(chroms_path)) == ("chrX", "chr2", "chr1", "chr10")
+    with pytest.raises(ValueError):
+        extract_ordered_chromosome_field(CHROMSIZES, "file")
+    with pytest.raises(ValueError):
+        extract_ordered_chromosome_field(CHROMSIZES, "karyotype")
+
+
+def test_set_chromsize_order():
+    header = ["## pairs format v1.0.0", "#chromsize: chr2 200", "#chromsize: chr10 100", "#columns: readID"]
+    assert set_chromsize_order(header, ("chr10", "chr2")) == [
+        "## pairs format v1.0.0", "#chromsize: chr10 100", "#chromsize: chr2 200", "#columns: readID"
+    ]
+    assert set_chromsize_order(header[:1], ("chr10",)) == header[:1]
+
+
 # -------------------------------
 # TEST metadata_dict_to_header_list
 # -------------------------------
@@ -0,0 +1,63 @@
+import os
+import pytest
+import pysam
+import duckdb
+
+from pairs_to_parquet.lib import pairs_io
+from pairs_to_parquet.lib.duckdb_utils import classify_column_types_by_name
+
+
+HEADER = ["## pairs format v1.0.0"] + [f"#samheader: @SQ\tSN:chr{i}\tLN:1000" for i in range(200)] + [
+    "#columns: readID chrom1 pos1 chrom2 pos2 strand1 strand2 pair_type"
+]
+ROWS = [[f"read{i}", "chr1", str(i), "chr2", str(2 * i), "+", "-", "UU"] for i in range(5000)]
+
+
+def write_bgzf(path, lines, trailing_newline=True):
+    with pysam.BGZFile(path, "wb") as f:
+        f.write(("\n".join(lines) + ("\n" if trailing_newline else "")).encode())
+    return path
+
+
+def read_all(header, body):
+    column_names = header[-1].split()[1:]
+    column_types = classify_column_types_by_name(column_names)
+    reader = pairs_io.open_bgzf_body_reader(body, column_names, column_types)
+    return [[str(v) for v in row.values()] for row in reader.read_all().to_pylist()]
+
+
+# -------------------------------
+# TEST open_pairs_bgzf + open_bgzf_body_reader
+# -------------------------------
+@pytest.mark.parametrize("chunk_size", [1, 5000, 1 << 20])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_bgzf_reader_stitches_lines(tmp_path, chunk_size, trailing_newline):
+    path = write_bgzf(
+        os.path.join(tmp_path, "mock.pairs.gz"),
+        HEADER + ["\t".join(r) for r in ROWS],
+        trailing_newline,
+    )
+    # tiny chunks: the header spans several ranges and every range cuts lines
+    header, body = pairs_io.open_pairs_bgzf(path, nproc=3, chunk_size=chunk_size)
+
+    assert header == HEADER
+    assert read_all(header, body) == ROWS
+
+
+def test_bgzf_reader_header_only(tmp_path):
+    path = write_bgzf(os.path.join(tmp_path, "header_only.pairs.gz"), HEADER)
+    header, body = pairs_io.open_pairs_bgzf(path, nproc=2, chunk_size=1)
+
+    assert header == HEADER
+    assert read_all(header, body) == []
+
+
+def test_bgzf_reader_scanned_by_duckdb(tmp_path):
+    path = write_bgzf(os.path.join(tmp_path, "mock.pairs.gz"), HEADER + ["\t".join(r) for r in ROWS])
+    header, body = pairs_io.open_pairs_bgzf(path, nproc=2, chunk_size=5000)
+    column_names = header[-1].split()[1:]
+    reader = pairs_io.open_bgzf_body_reader(body, column_names, classify_column_types_by_name(column_names))
+
+    con = duckdb.connect()
+    con.register("pairs_body", reader)
+    assert con.execute("SELECT count(*), sum(pos1) FROM pairs_body").fetchone() == (5000, sum(range(5000)))
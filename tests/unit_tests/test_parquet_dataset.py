@@ -0,0 +1,77 @@
+import os
+
+import duckdb
+import pytest
+
+from pairs_to_parquet.lib import parquet_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = os.path.join(tmp_path, "pairs")
+    duckdb.execute(f"""
+        COPY (SELECT * FROM (VALUES ('r1', 'chr2', 1, 'chr10', 5), ('r2', 'chr10', 2, 'chr10', 3), ('r3', '!', 0, '!', 0))
+            AS t(readID, chrom1, pos1, chrom2, pos2))
+        TO '{path}' (FORMAT PARQUET, PARTITION_BY (chrom1, chrom2), WRITE_PARTITION_COLUMNS true)
+    """)
+    return path
+
+
+def test_partition_values():
+    path = os.path.join("chrom1=chr1", "chrom2=%21", "data_0.parquet")
+    assert parquet_dataset.partition_values(path) == {"chrom1": "chr1", "chrom2": "!"}
+
+
+def test_dataset_files(dataset):
+    chroms = lambda files: [tuple(parquet_dataset.partition_values(os.path.relpath(path, dataset)).values()) for path in files]
+    # lexicographic without an order, the order of the chroms first
+    assert chroms(parquet_dataset.dataset_files(dataset)) == [("!", "!"), ("chr10", "chr10"), ("chr2", "chr10")]
+    assert chroms(parquet_dataset.dataset_files(dataset, ["!", "chr2", "chr10"])) == [("!", "!"), ("chr2", "chr10"), ("chr10", "chr10")]
+
+    # the list of _header.parquet overrides the order
+    files = parquet_dataset.dataset_files(dataset)
+    schema = duckdb.execute(f"SELECT * FROM read_parquet('{files[0]}') LIMIT 0").fetch_record_batch().schema
+    parquet_dataset.write_header_file(dataset, schema, {"format": '"pairs"'}, files[::-1])
+    assert parquet_dataset.dataset_files(dataset, ["!", "chr2", "chr10"]) == files[::-1]
+    assert parquet_dataset.header_path(dataset) == os.path.join(dataset, parquet_dataset.HEADER_FILE)
+    assert parquet_dataset.read_kv_metadata(parquet_dataset.header_path(dataset))[b"format"] == b'"pairs"'
+
+
+def test_parquet_source(dataset):
+    rows = duckdb.execute(f"SELECT readID, chrom1 FROM {parquet_dataset.parquet_source(dataset, ['!', 'chr2', 'chr10'])}").fetchall()
+    assert rows == [("r3", "!"), ("r1", "chr2"), ("r2", "chr10")]
+    assert parquet_dataset.parquet_source("pairs.parquet") == "read_parquet('pairs.parquet')"
+    assert parquet_dataset.is_parquet(dataset) and parquet_dataset.is_parquet("pairs.parquet")
+    assert not parquet_dataset.is_parquet("pairs.pairs.gz")
+
+
+def test_is_dataset(dataset, tmp_path):
+    assert parquet_dataset.is_dataset(dataset)
+    other = os.path.join(tmp_path, "other")
+    os.makedirs(os.path.join(other, "figures"))
+    assert not parquet_dataset.is_dataset(other)
+    assert not parquet_dataset.is_parquet(other)
+    open(os.path.join(other, parquet_dataset.HEADER_FILE), "w").close()
+    assert parquet_dataset.is_dataset(other)
+
+
+def test_dataset_writer(dataset, tmp_path):
+    with parquet_dataset.dataset_writer(dataset) as path:
+        open(os.path.join(path, parquet_dataset.HEADER_FILE), "w").close()
+        # the previous dataset is kept until the block finishes
+        assert parquet_dataset.dataset_files(dataset)
+    assert os.listdir(dataset) == [parquet_dataset.HEADER_FILE]
+
+    with pytest.raises(RuntimeError):
+        with parquet_dataset.dataset_writer(dataset) as path:
+            raise RuntimeError
+    assert os.listdir(dataset) == [parquet_dataset.HEADER_FILE]
+    assert sorted(os.listdir(tmp_path)) == ["pairs"]
+
+    other = os.path.join(tmp_path, "other")
+    os.makedirs(other)
+    open(os.path.join(other, "thesis.docx"), "w").close()
+    with pytest.raises(ValueError):
+        with parquet_dataset.dataset_writer(other):
+            pass
+    assert os.listdir(other) == ["thesis.docx"]
@@ -0,0 +1,105 @@
+import os
+import random
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from pairs_to_parquet.lib.region_index import (
+    parse_position,
+    parse_region,
+    build_region_index,
+    read_region_index,
+    matching_blocks,
+    query_region,
+    region_index_path,
+)
+
+
+def test_parse_region():
+    assert parse_position("1,500") == 1500
+    assert parse_position("1.5k") == 1500
+    assert parse_position("2M") == 2_000_000
+    assert parse_region("chr1") == ("chr1", None, None)
+    assert parse_region("chr1:1M-2M") == ("chr1", 1_000_000, 2_000_000)
+    assert parse_region("chr1:1000-") == ("chr1", 1000, None)
+    # a position without - is a single position, as in pairix and tabix
+    assert parse_region("chr1:1000") == ("chr1", 1000, 1000)
+    assert parse_region("chr1:1.5k") == ("chr1", 1500, 1500)
+    assert parse_region("HLA-A*01:01", ["chr1", "HLA-A*01:01"]) == ("HLA-A*01:01", None, None)
+    assert parse_region("chr1:1000", ["chr1"]) == ("chr1", 1000, 1000)
+    with pytest.raises(ValueError):
+        parse_region("chr1:a-b")
+    with pytest.raises(ValueError):
+        parse_region("chr1:1000x")
+    # unknown chroms are errors, not empty results
+    with pytest.raises(ValueError):
+        parse_region("chr1:1000", ["chr2"])
+    with pytest.raises(ValueError):
+        parse_region("chrUn", ["chr1"])
+
+
+@pytest.fixture(params=[True, False], ids=["sorted", "unsorted"])
+def pairs_parquet(tmp_path, request):
+    rng = random.Random(0)
+    rows = [(rng.choice(["chr1", "chr2", "chr3"]), rng.randint(1, 10_000), rng.choice(["chr1", "chr2"]), rng.randint(1, 10_000)) for _ in range(5000)]
+    if request.param:
+        rows.sort()
+    table = pa.table({
+        "readID": [f"read{i}" for i in range(len(rows))],
+        "chrom1": [row[0] for row in rows],
+        "pos1": [row[1] for row in rows],
+        "chrom2": [row[2] for row in rows],
+        "pos2": [row[3] for row in rows],
+    })
+    path = str(tmp_path / "pairs.parquet")
+    pq.write_table(table, path, row_group_size=300)
+    return path
+
+
+@pytest.mark.parametrize("regions", [("chr1:2k-3k", None), ("chr2", "chr1:100-5000"), ("chr3:9000-", "chr2"), ("chrX", None)])
+def test_query_region(pairs_parquet, regions):
+    region1, region2 = regions
+    chrom, start, end = parse_region(region1)
+    condition = f"chrom1 = '{chrom}' AND pos1 BETWEEN {start or 0} AND {end or 10**9}"
+    if region2:
+        chrom, start, end = parse_region(region2)
+        condition += f" AND chrom2 = '{chrom}' AND pos2 BETWEEN {start or 0} AND {end or 10**9}"
+    expected = [row[0] for row in duckdb.sql(f"SELECT readID FROM '{pairs_parquet}' WHERE {condition}").fetchall()]
+
+    # without and with the index: the same pairs in the order of the file
+    assert query_region(pairs_parquet, region1, region2).column("readID").to_pylist() == expected
+    build_region_index(pairs_parquet)
+    assert query_region(pairs_parquet, region1, region2).column("readID").to_pylist() == expected
+    assert query_region(pairs_parquet, region1, region2, columns=["readID"]).column_names == ["readID"]
+
+
+def test_matching_blocks(pairs_parquet):
+    build_region_index(pairs_parquet)
+    index = read_region_index(pairs_parquet)
+    assert index.num_rows > 0 and sum(index.column("n_rows").to_pylist()) == 5000
+    blocks = matching_blocks(index, parse_region("chr2:1-100"))
+    assert set(blocks.column("chrom1").to_pylist()) == {"chr2"}
+    assert all(low <= 100 for low in blocks.column("pos1_min").to_pylist())
+
+
+def test_stale_index(pairs_parquet):
+    build_region_index(pairs_parquet)
+    with open(pairs_parquet, "ab") as f:
+        f.write(b"\0")
+    assert read_region_index(pairs_parquet) is None
+    os.remove(region_index_path(pairs_parquet))
+    assert read_region_index(pairs_parquet) is None
+
+
+def test_stale_index_same_size(pairs_parquet):
+    build_region_index(pairs_parquet)
+    assert read_region_index(pairs_parquet) is not None
+    # a rewrite of the same size: the footer differs
+    with open(pairs_parquet, "rb") as f:
+        data = f.read()
+    assert b"parquet-cpp" in data
+    with open(pairs_parquet, "wb") as f:
+        f.write(data.replace(b"parquet-cpp", b"parquet-cpq"))
+    assert read_region_index(pairs_parquet) is None
@@ -0,0 +1,86 @@
+import json
+
+import duckdb
+import pytest
+
+from pairs_to_parquet.lib.select_condition import compile_condition
+from pairs_to_parquet.lib.duckdb_select import scan_filters
+
+COLUMNS = ["readID", "chrom1", "pos1", "chrom2", "pos2", "strand1", "strand2", "pair_type"]
+ROWS = [
+    ("r1", "chr1", 100, "chr1", 250, "+", "-", "UU"),
+    ("r2", "chr1", 5000, "chr2", 10, "+", "+", "RU"),
+    ("r3", "chr2", 20, "chr2", 3000000, "-", "-", "UR"),
+    ("r4", "!", 0, "chr1", 40, "-", "+", "NU"),
+]
+
+
+@pytest.fixture
+def con():
+    con = duckdb.connect()
+    con.execute("CREATE TABLE pairs (readID VARCHAR, chrom1 VARCHAR, pos1 BIGINT, chrom2 VARCHAR, pos2 BIGINT, "
+                "strand1 VARCHAR, strand2 VARCHAR, pair_type VARCHAR)")
+    con.executemany("INSERT INTO pairs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ROWS)
+    return con
+
+
+def select(con, condition):
+    compiled = compile_condition(condition, COLUMNS, ["pos1", "pos2"])
+    return [r[0] for r in con.execute(f"SELECT readID FROM pairs WHERE {compiled.sql} ORDER BY readID").fetchall()]
+
+
+@pytest.mark.parametrize(
+    "condition,expected",
+    [
+        ("True", ["r1", "r2", "r3", "r4"]),
+        ('pair_type == "UU"', ["r1"]),
+        ("(chrom1 == chrom2) and (abs(pos1 - pos2) < 1e6)", ["r1"]),
+        ("chrom1 == chrom2 and abs((pos1 - (pos2 + 50))) < 1e7", ["r1", "r3"]),
+        ('(chrom1 == "!") and (chrom2 != "!")', ["r4"]),
+        ('csv_match(pair_type, "RU,UR")', ["r2", "r3"]),
+        ('wildcard_match(pair_type, "*U")', ["r1", "r2", "r4"]),
+        ('wildcard_match(pair_type, "[!U]?")', ["r2", "r4"]),
+        ('regex_match(pair_type, "[NM]U")', ["r4"]),
+        ('regex_match(chrom1, "chr[0-9]+") and regex_match(chrom2, "chr[0-9]+")', ["r1", "r2", "r3"]),
+        ('region_match(chrom1, pos1, "chr1", 0, 150)', ["r1"]),
+        ('region_match(chrom1, pos1, "chr1", 150)', ["r2"]),
+        ("10 <= pos1 < 5000", ["r1", "r3"]),
+        ('chrom1 in ("chr2", "!") or pair_type in ["UU"]', ["r1", "r3", "r4"]),
+        ('pair_type not in ("UU", "RU")', ["r3", "r4"]),
+        ("COLS[1] == COLS[3]", ["r1", "r3"]),
+        # operators and quotes inside string literals stay literals
+        ('pair_type == "U and U" or readID == "r\'1"', []),
+    ],
+)
+def test_conditions(con, condition, expected):
+    assert select(con, condition) == expected
+
+
+def test_predicates():
+    compiled = compile_condition('region_match(chrom1, pos1, "chr1", 1e3, 5e3) and abs(pos1 - pos2) < 1e6', COLUMNS, ["pos1", "pos2"])
+    assert compiled.sql == '((("chrom1" = \'chr1\') AND ("pos1" >= 1000) AND ("pos1" <= 5000)) AND (abs(("pos1" - "pos2")) < 1000000.0))'
+
+    # csv_match: the range of the values for the row group statistics, the IN list for the rows
+    compiled = compile_condition('csv_match(chrom1, "chr3,chr1")', COLUMNS)
+    assert compiled.sql == '(("chrom1" BETWEEN \'chr1\' AND \'chr3\') AND ("chrom1" IN (\'chr3\', \'chr1\')))'
+
+
+def test_scan_filters(tmp_path):
+    path = tmp_path / "pairs.parquet"
+    duckdb.execute(f"COPY (SELECT 'chr' || (i // 1000) AS chrom1, i AS pos1 FROM range(10000) t(i)) TO '{path}' (FORMAT PARQUET, ROW_GROUP_SIZE 1000)")
+    compiled = compile_condition('csv_match(chrom1, "chr2,chr3") and pos1 < 2.5e3', ["chrom1", "pos1"], ["pos1"])
+    plan = duckdb.execute(f"EXPLAIN (FORMAT JSON) SELECT * FROM read_parquet('{path}') WHERE {compiled.sql}").fetchone()[1]
+    # the range of the IN list and the integer bound are checked against the row group statistics
+    filters = " AND ".join(scan_filters(json.loads(plan)))
+    assert "chrom1>='chr2' AND chrom1<='chr3'" in filters
+    assert "pos1<2500" in filters
+    assert duckdb.execute(f"SELECT count(*) FROM read_parquet('{path}') WHERE {compiled.sql}").fetchone()[0] == 500
+
+
+@pytest.mark.parametrize("condition", [
+    "foo == 1", "os.system('ls')", "pos1 <", "lambda: 1", "regex_match(chrom1, chrom2)", "pos1 is 1",
+    "pair_type == ('UU', 'RU')", "pair_type != ['UU']", "('UU',) in pair_type", "(1, 2) < (pos1, pos2)",
+])
+def test_invalid_conditions(condition):
+    with pytest.raises(ValueError):
+        compile_condition(condition, COLUMNS)